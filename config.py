@@ -21,8 +21,10 @@ TWITTER_CONFIG = {
 # MongoDB 配置
 MONGODB_CONFIG = {
     "CONNECTION_STRING": os.getenv("MONGODB_URI", "mongodb://localhost:27017/"),
-    "DATABASE_NAME": "twitter_monitor",
-    "COLLECTION_NAME": "tweets"
+    "DATABASE_NAME": os.getenv("MONGODB_DATABASE", "twitter_monitor"),
+    "COLLECTION_NAME": "tweets",
+    "BULK_BATCH_SIZE": 500,  # 批量写入每批最多条数
+    "BULK_FLUSH_SECONDS": 5  # 缓冲区最长滞留时间
 }
 
 # 抓取配置
@@ -30,7 +32,55 @@ FETCH_CONFIG = {
     "MAX_TWEETS_PER_PERSON": 10,
     "SLEEP_BETWEEN_USERS": 5,  # 秒
     "FETCH_INTERVAL_HOURS": 2,
-    "MAX_RETRIES": 3
+    "MAX_RETRIES": 3,
+    "PAGE_SIZE": 100,  # since_id 增量抓取时每页条数（API 上限 100）
+    "MAX_PAGES_PER_FETCH": 10,  # 单账号单轮最多翻页数
+    "MAX_WORKERS": 4,  # 并发抓取线程数
+    "ANALYSIS_WORKERS": 0,  # 分析进程数，0 表示在抓取线程内直接分析
+    "ANALYSIS_QUEUE_SIZE": 1000,  # 抓取→分析、分析→写入队列容量（背压上限）
+    "ANALYSIS_WAIT_SECONDS": 900,  # 轮次结束时等待流水线排空的上限，超时则本轮不推进检查点
+    "USER_ID_TTL_HOURS": 168,  # 用户名 → user_id 解析结果的有效期，到期后按 ID 刷新（可发现改名）
+    "USER_ID_NEGATIVE_TTL_HOURS": 6,  # 不存在 / 被封禁账号的负缓存有效期
+    # 优先级 → 并发份额权重（高优先级先提交、占用更多并发槽）
+    "PRIORITY_WEIGHTS": {"high": 3, "medium": 2, "low": 1}
+}
+
+# 自适应调度配置（按发推频率与优先级分配轮询预算，取代固定周期）
+SCHEDULER_CONFIG = {
+    "ENABLED": True,
+    "POLL_BUDGET_PER_HOUR": None,  # 每小时轮询次数，None 表示与固定周期相同（账号数 / FETCH_INTERVAL_HOURS）
+    "MIN_INTERVAL_MINUTES": 5,  # 单账号最短轮询间隔
+    "MAX_INTERVAL_HOURS": 6,  # 单账号最长轮询间隔（保底检查）
+    "BOOST_MINUTES": 60,  # 黑天鹅推文后加速轮询的时长
+    "BOOST_FACTOR": 16,  # 加速期间需求倍数（轮询频率约提高到 4 倍，预算从其他账号匀出）
+    "HALF_LIFE_DAYS": 7,  # 发推频率估计的衰减半衰期
+    "PRIOR_TWEETS_PER_DAY": 2,  # 历史不足时的先验发推频率
+    "PRIOR_HOURS": 24  # 先验相当于多少小时的观测
+}
+
+# 多节点协调配置（多台主机共用 MongoDB，账号按一致性哈希分配，共享租约保证每周期只抓一次）
+COORDINATION_CONFIG = {
+    "ENABLED": False,
+    "HEARTBEAT_SECONDS": 10,  # 心跳间隔
+    "WORKER_TTL_SECONDS": 30,  # 超过该时长没有心跳视为失联，其账号由其他节点接手
+    "LEASE_SECONDS": 600,  # 单个账号的抓取租约，持有期间随心跳续期
+    "VIRTUAL_NODES": 64  # 每个工作进程在哈希环上的虚拟节点数
+}
+
+# 监控指标配置（抓取进程在本地暴露 /metrics，面板系统设置页读取）
+METRICS_CONFIG = {
+    "ENABLED": True,
+    "HOST": "127.0.0.1",
+    "PORT": int(os.getenv("POLITWEET_METRICS_PORT", "9108"))  # 被占用时顺延到后续端口，实际端口见启动日志
+}
+
+# 近重复推文检测配置
+DEDUP_CONFIG = {
+    "ENABLED": True,
+    "MAX_DISTANCE": 3,  # SimHash 汉明距离不超过该值视为同一簇，复用情感分析结果
+    "MIN_FEATURES": 4,  # 特征（单词、二字组）少于该值的推文不参与聚类
+    "WINDOW_HOURS": 48,  # 簇超过该时长未命中则移出索引
+    "MAX_CLUSTERS": 50000  # 索引中最多保留的簇数
 }
 
 # 领导人账号配置
@@ -104,6 +154,10 @@ BLACK_SWAN_KEYWORDS = {
     "自然灾害": {
         "keywords": ["earthquake", "tsunami", "hurricane", "flood", "disaster", "地震", "海啸", "飓风"],
         "weight": 1.0
+    },
+    "健康危机": {
+        "keywords": ["pandemic", "virus", "outbreak", "epidemic", "disease", "疫情", "病毒", "大流行"],
+        "weight": 1.5
     }
 }
 
@@ -111,9 +165,22 @@ BLACK_SWAN_KEYWORDS = {
 SENTIMENT_CONFIG = {
     "MODELS": {
         "BERT": "cardiffnlp/twitter-roberta-base-sentiment-latest",
+        # 推理后端："pytorch"（fp32）/ "pytorch-int8"（动态量化）/ "onnx"（onnxruntime CPU）
+        "BERT_BACKEND": "pytorch",
+        "ONNX_DIR": "models/onnx",  # ONNX 模型导出目录
         "VADER": True,
         "TEXTBLOB": True
     },
+    "BATCH_SIZE": 16,  # BERT 微批次大小
+    # 分析结果缓存（规范化文本哈希 + 模型版本）
+    "CACHE": {
+        "ENABLED": True,
+        "MAX_ENTRIES": 10000,  # 进程内 LRU 条目上限
+        "PERSISTENT": None,  # None / "sqlite" / "mongodb"
+        "SQLITE_PATH": "analysis_cache.db",
+        "MAX_PERSISTENT_ENTRIES": 200000,  # SQLite 层条目上限
+        "MAX_PERSISTENT_BYTES": 256 * 1024 * 1024  # MongoDB 固定集合大小
+    },
     "THRESHOLDS": {
         "POSITIVE": 0.3,
         "NEGATIVE": -0.3
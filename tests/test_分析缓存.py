@@ -0,0 +1,21 @@
+from 分析缓存 import SQLiteCacheTier
+
+
+def test_sqlite_tier_evicts_least_recently_used_once_over_slack(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / "cache.db"), max_entries=4, slack=2)
+    for i in range(6):
+        tier.put(f"k{i}", {"i": i})
+    assert tier.count == 6  # 仍在余量之内，不淘汰
+
+    assert tier.get("k0") == {"i": 0}  # k0 最近访问过，淘汰时应保留
+    tier.put("k6", {"i": 6})
+    assert tier.count == 4
+    assert tier.get("k0") == {"i": 0}
+    assert tier.get("k1") is None
+
+
+def test_sqlite_tier_put_same_key_does_not_grow(tmp_path):
+    tier = SQLiteCacheTier(str(tmp_path / "cache.db"), max_entries=10)
+    tier.put("k", {"v": 1})
+    tier.put("k", {"v": 1})
+    assert tier.count == 1
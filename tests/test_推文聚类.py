@@ -0,0 +1,34 @@
+from 推文聚类 import REUSED_FIELDS, NearDuplicateIndex
+
+BASE = ("the minister announced a new national energy plan today focusing on "
+        "renewable investment across all provinces and regions")
+
+
+def representative(index):
+    raw = {"id": 1, "text": BASE}
+    assert index.assign(raw) is None
+    index.record_analysis(raw, {
+        "sentiment_label": "中性", "sentiment_score": 0.1, "confidence": 0.5,
+        "is_black_swan": False, "risk_score": 0, "alert_level": "绿色", "detected_categories": [],
+        "analyzed_at": "2024-05-01T00:00:00"
+    })
+    return raw
+
+
+def test_duplicate_reuses_only_sentiment_fields():
+    index = NearDuplicateIndex()
+    representative(index)
+    duplicate = {"id": 2, "text": BASE + "!!"}
+    reused = index.assign(duplicate)
+    assert duplicate["cluster_id"] == 1 and not duplicate["is_cluster_representative"]
+    assert set(reused) == set(REUSED_FIELDS)
+
+
+def test_featureless_texts_are_not_clustered():
+    index = NearDuplicateIndex()
+    for i, text in enumerate(["https://t.co/abc 🎉", "🔥🔥🔥", "@someone #tag"]):
+        raw = {"id": 10 + i, "text": text}
+        assert index.assign(raw) is None
+        assert "cluster_id" not in raw
+    assert index.stats["skipped"] == 3
+    assert index.stats["clusters"] == 0
@@ -0,0 +1,53 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from 推理后端 import PARITY_SAMPLES, check_parity, load_backend  # noqa: E402
+
+# 默认与 config.py 中的情感模型一致；CI 中可换成小模型以缩短下载与导出时间
+PARITY_MODEL = os.getenv("POLITWEET_PARITY_MODEL", "cardiffnlp/twitter-roberta-base-sentiment-latest")
+
+
+class FixedBackend:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+
+    def predict(self, texts):
+        return [[{"label": label, "score": score} for label, score in self.rows[text]] for text in texts]
+
+
+def test_check_parity_reports_score_drift_and_label_flips():
+    reference = FixedBackend("ref", {
+        "a": [("negative", 0.1), ("positive", 0.9)],
+        "b": [("negative", 0.6), ("positive", 0.4)],
+    })
+    candidate = FixedBackend("cand", {
+        "a": [("negative", 0.12), ("positive", 0.88)],
+        "b": [("negative", 0.45), ("positive", 0.55)],
+    })
+    report = check_parity(reference, candidate, ["a", "b"], tolerance=0.05)
+    assert report["label_agreement"] == 0.5
+    assert report["max_score_diff"] == pytest.approx(0.15)
+    assert not report["passed"]
+
+    report = check_parity(reference, candidate, ["a"], tolerance=0.05)
+    assert report["passed"]
+
+
+def test_onnx_matches_pytorch(tmp_path):
+    pytest.importorskip("torch")
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("transformers")
+
+    report = check_parity(
+        load_backend("pytorch", PARITY_MODEL),
+        load_backend("onnx", PARITY_MODEL, onnx_dir=str(tmp_path)),
+        PARITY_SAMPLES,
+        tolerance=1e-3
+    )
+    assert report["label_agreement"] == 1.0
+    assert report["max_score_diff"] <= 1e-3
+    assert report["passed"]
@@ -0,0 +1,29 @@
+import pytest
+
+errors = pytest.importorskip("pymongo.errors")
+
+from 数据存储 import BulkWriteBuffer  # noqa: E402
+
+
+class FlakyCollection:
+    name = "flaky"
+
+    def bulk_write(self, operations, ordered=False):
+        raise errors.AutoReconnect("connection reset")
+
+
+def test_replayable_batch_is_kept_and_error_raised():
+    buffer = BulkWriteBuffer(FlakyCollection(), replay_on_error=True)
+    buffer.add("op-1", key=1)
+    with pytest.raises(errors.AutoReconnect):
+        buffer.flush()
+    assert buffer.pending == ["op-1"]
+    assert buffer.pending_keys == [1]
+
+
+def test_non_replayable_batch_is_dropped():
+    buffer = BulkWriteBuffer(FlakyCollection())
+    buffer.add("inc-1")
+    assert buffer.flush() == 0
+    assert buffer.pending == []
+    assert buffer.stats["dropped"] == 1
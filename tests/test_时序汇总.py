@@ -0,0 +1,37 @@
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from 时序汇总 import bucket_time, rollup_update  # noqa: E402
+
+NOW = datetime(2024, 5, 1, 13, 45, 0)
+
+
+def tweet(**fields):
+    return {"username": "leader", "sentiment_score": 0.5, "risk_score": 42, "alert_level": "黄色",
+            "black_swan": True, **fields}
+
+
+def test_bucket_from_iso_created_at():
+    update = rollup_update(tweet(created_at="2024-04-30T08:15:00+00:00"), "hour", now=NOW)
+    assert update._filter == {"_id": "leader|2024-04-30T08"}
+
+
+def test_bucket_from_datetime_created_at():
+    update = rollup_update(tweet(created_at=datetime(2024, 4, 30, 8, 15)), "day", now=NOW)
+    assert update._filter == {"_id": "leader|2024-04-30"}
+
+
+@pytest.mark.parametrize("created_at", [None, ""])
+def test_missing_created_at_falls_back_to_ingest_time(created_at):
+    assert bucket_time(tweet(created_at=created_at), now=NOW) == NOW.isoformat()
+    update = rollup_update(tweet(created_at=created_at), "hour", now=NOW)
+    assert update._filter == {"_id": "leader|2024-05-01T13"}
+    assert update._doc["$inc"]["count"] == 1
+
+
+def test_missing_created_at_key():
+    update = rollup_update(tweet(), "day", now=NOW)
+    assert update._filter == {"_id": "leader|2024-05-01"}
@@ -0,0 +1,159 @@
+import copy
+import itertools
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("requests")
+pytest.importorskip("pymongo")
+
+from 警报分发 import AlertDispatcher, AlertTransport, _serve_smtp, _serve_webhook  # noqa: E402
+
+
+def _matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(_matches(doc, option) for option in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if isinstance(condition, dict):
+            for op, operand in condition.items():
+                if value is None:
+                    return False
+                if op == "$lte" and not value <= operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeOutbox:
+    """只实现分发器用到的集合操作"""
+
+    def __init__(self):
+        self.docs = {}
+        self.ids = itertools.count(1)
+
+    def insert_one(self, doc):
+        doc.setdefault("_id", next(self.ids))
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def find_one_and_update(self, query, update, sort=None, return_document=None):
+        candidates = [doc for doc in self.docs.values() if _matches(doc, query)]
+        if sort:
+            field, _ = sort[0]
+            candidates.sort(key=lambda doc: doc.get(field) or datetime.min)
+        if not candidates:
+            return None
+        self._apply(candidates[0], update)
+        return copy.deepcopy(candidates[0])
+
+    def update_one(self, query, update):
+        doc = self.docs.get(query["_id"])
+        if doc is not None:
+            self._apply(doc, update)
+
+    def _apply(self, doc, update):
+        doc.update(update.get("$set", {}))
+        for key in update.get("$unset", {}):
+            doc.pop(key, None)
+
+
+def alert(i=0):
+    return {"title": f"🚨 红色警报: user{i}", "message": f"测试消息 {i}", "alert_level": "红色",
+            "risk_score": 80, "username": f"user{i}", "created_at": datetime.now().isoformat()}
+
+
+@pytest.fixture
+def channels():
+    """替身 SMTP / webhook 服务器；webhook 第一次请求返回 503"""
+    mails, hooks = [], []
+    config = {
+        "email": {"enabled": True, "smtp_server": "127.0.0.1", "smtp_port": _serve_smtp(mails),
+                  "username": "alerts@example.com", "password": "", "recipients": ["ops@example.com"],
+                  "starttls": False},
+        "webhook": {"enabled": True, "url": f"http://127.0.0.1:{_serve_webhook(hooks)}/hook", "headers": {}},
+        "dispatch": {"backoff_seconds": 30, "max_attempts": 3, "lease_seconds": 300}
+    }
+    transport = AlertTransport(config, timeout=5)
+    yield config, transport, mails, hooks
+    transport.close()
+
+
+def test_claim_takes_due_records_once(channels):
+    config, transport, _, _ = channels
+    outbox = FakeOutbox()
+    dispatcher = AlertDispatcher(outbox, config, transport=transport)
+    dispatcher.enqueue(alert(0))
+    dispatcher.enqueue(alert(1))
+    outbox.docs[2]["next_attempt_at"] = datetime.now() + timedelta(minutes=5)
+
+    claimed = dispatcher.claim_batch()
+    assert [record["_id"] for record in claimed] == [1]
+    assert outbox.docs[1]["status"] == "sending"
+    assert outbox.docs[1]["claimed_by"] == dispatcher.worker_id
+    # 已认领（租约未过期）与未到期的记录都不会被再次认领
+    assert dispatcher.claim_batch() == []
+
+
+def test_retry_resends_only_failed_channels(channels):
+    config, transport, mails, hooks = channels
+    outbox = FakeOutbox()
+    dispatcher = AlertDispatcher(outbox, config, transport=transport)
+    dispatcher.enqueue(alert())
+
+    dispatcher.dispatch(dispatcher.claim_batch())
+    record = outbox.docs[1]
+    assert record["status"] == "pending"
+    assert record["channels"] == ["webhook"]
+    assert record["attempts"] == 1
+    assert record["next_attempt_at"] > datetime.now() + timedelta(seconds=25)
+    assert "claimed_by" not in record
+    assert len(mails) == 1 and hooks == []
+
+    # 退避结束后重试：只发 webhook，邮件不重复发送
+    record["next_attempt_at"] = datetime.now()
+    dispatcher.dispatch(dispatcher.claim_batch())
+    assert outbox.docs[1]["status"] == "sent"
+    assert len(mails) == 1
+    assert len(hooks) == 1 and hooks[0]["username"] == "user0"
+
+
+def test_gives_up_after_max_attempts(channels):
+    config, transport, _, _ = channels
+    config["webhook"]["url"] = "http://127.0.0.1:9/unreachable"
+    config["email"]["enabled"] = False
+    outbox = FakeOutbox()
+    dispatcher = AlertDispatcher(outbox, config, transport=AlertTransport(config, timeout=1))
+    dispatcher.enqueue(alert())
+
+    for _ in range(3):
+        outbox.docs[1]["next_attempt_at"] = datetime.now()
+        dispatcher.dispatch(dispatcher.claim_batch())
+    assert outbox.docs[1]["status"] == "failed"
+    assert outbox.docs[1]["attempts"] == 3
+    assert dispatcher.claim_batch() == []
+
+
+def test_stale_sending_record_is_reclaimed(channels):
+    config, transport, _, _ = channels
+    outbox = FakeOutbox()
+    crashed = AlertDispatcher(outbox, config, transport=transport)
+    crashed.enqueue(alert(0))
+    crashed.enqueue(alert(1))
+    crashed.claim_batch()
+    # 第一条的认领者早已崩溃（租约过期），第二条刚被认领
+    outbox.docs[1]["claimed_at"] = datetime.now() - timedelta(seconds=301)
+
+    survivor = AlertDispatcher(outbox, config, transport=transport)
+    claimed = survivor.claim_batch()
+    assert [record["_id"] for record in claimed] == [1]
+    assert outbox.docs[1]["claimed_by"] == survivor.worker_id
+    assert outbox.docs[2]["claimed_by"] == crashed.worker_id
+
+    survivor.dispatch(claimed)
+    assert outbox.docs[1]["status"] == "pending"  # webhook 第一次 503，只留下 webhook 通道重试
+    assert outbox.docs[1]["channels"] == ["webhook"]
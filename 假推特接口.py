@@ -0,0 +1,405 @@
+"""
+本地 Twitter v2 接口替身
+提供 get_user / get_users / get_users_tweets 三个接口，数据来自合成语料或录制语料；
+可模拟网络延迟、since_id 翻页与 429 限流，用于离线压测抓取流程
+另提供改写请求地址的 HTTPAdapter，把 tweepy.Client 的请求转发到本地替身
+"""
+
+import json
+import logging
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+TWITTER_API_BASES = ("https://api.twitter.com", "https://api.x.com")
+# 推文 ID 起点：保证合成 ID 单调递增且在 MongoDB 有符号 64 位整数范围内
+TWEET_ID_BASE = 10 ** 15
+USER_ID_BASE = 10 ** 6
+
+
+def _api_time(dt):
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+class SyntheticCorpus:
+    def __init__(self, usernames, tweets_per_user, seed=42, lang_mix=None, black_swan_ratio=0.1,
+                 start=None, interval_seconds=60, text_pool_size=5000):
+        """
+        按需生成推文，不在内存中保存全部语料：第 k 条推文的 ID、时间、文本都由 (账号序号, k) 决定
+        文本从合成文本池中取，并附上推文 ID 使每条不同
+        """
+        from 性能基准 import synthetic_corpus
+
+        self.usernames = list(usernames)
+        self.index = {username: i for i, username in enumerate(self.usernames)}
+        self.tweets_per_user = tweets_per_user
+        self.extra = [0] * len(self.usernames)  # 运行期间新增的推文数
+        self.start = start or datetime.utcnow() - timedelta(seconds=interval_seconds * tweets_per_user)
+        self.interval = timedelta(seconds=interval_seconds)
+        self.pool = [text.rsplit(" #", 1)[0] for text in
+                     synthetic_corpus(text_pool_size, lang_mix, black_swan_ratio, seed)]
+        self.lock = threading.Lock()
+
+    @property
+    def total(self):
+        return self.tweets_per_user * len(self.usernames) + sum(self.extra)
+
+    def user(self, username):
+        if username not in self.index:
+            return None
+        return {"id": str(USER_ID_BASE + self.index[username]), "name": username, "username": username}
+
+    def user_by_id(self, user_id):
+        user_index = int(user_id) - USER_ID_BASE
+        if not 0 <= user_index < len(self.usernames):
+            return None
+        return self.user(self.usernames[user_index])
+
+    def add_tweets(self, count, rng=random):
+        """模拟账号持续发推：随机给账号追加新推文"""
+        with self.lock:
+            for _ in range(count):
+                self.extra[rng.randrange(len(self.usernames))] += 1
+
+    def _tweet(self, user_index, k):
+        tweet_id = TWEET_ID_BASE + k * len(self.usernames) + user_index
+        return {
+            "id": str(tweet_id),
+            "text": f"{self.pool[(k * 7919 + user_index) % len(self.pool)]} #{tweet_id}",
+            "created_at": _api_time(self.start + self.interval * k),
+            "author_id": str(USER_ID_BASE + user_index),
+            "lang": "en",
+            "edit_history_tweet_ids": [str(tweet_id)]
+        }
+
+    def page(self, user_id, since_id=None, max_results=10, offset=0):
+        """按时间倒序返回一页；offset 为已返回的条数，返回 (推文列表, 下一页 offset 或 None)"""
+        user_index = int(user_id) - USER_ID_BASE
+        if not 0 <= user_index < len(self.usernames):
+            return None, None
+        count = self.tweets_per_user + self.extra[user_index]
+        # 只返回 ID 大于 since_id 的推文：求满足条件的最小 k
+        k_min = 0
+        if since_id is not None:
+            k_min = max(0, -(-(int(since_id) + 1 - TWEET_ID_BASE - user_index) // len(self.usernames)))
+        newest = count - 1 - offset
+        ks = range(newest, max(k_min, newest - max_results + 1) - 1, -1)
+        tweets = [self._tweet(user_index, k) for k in ks]
+        next_offset = offset + len(tweets) if tweets and ks[-1] > k_min else None
+        return tweets, next_offset
+
+
+class RecordedCorpus:
+    def __init__(self, jsonl_path):
+        """读取录制的 JSONL 推文（每行含 id / text / username，可选 created_at）"""
+        by_user = {}
+        with open(jsonl_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                payload = json.loads(line)
+                data = payload.get("data", payload)
+                username = data.get("username") or data.get("author_id")
+                by_user.setdefault(username, []).append({
+                    "id": str(data["id"]),
+                    "text": data["text"],
+                    "created_at": data.get("created_at") or _api_time(datetime.utcnow()),
+                    "lang": data.get("lang", "en"),
+                    "edit_history_tweet_ids": [str(data["id"])]
+                })
+        self.usernames = sorted(by_user)
+        self.index = {username: i for i, username in enumerate(self.usernames)}
+        self.tweets = [sorted(by_user[u], key=lambda t: int(t["id"]), reverse=True) for u in self.usernames]
+        for i, tweets in enumerate(self.tweets):
+            for tweet in tweets:
+                tweet["author_id"] = str(USER_ID_BASE + i)
+
+    @property
+    def total(self):
+        return sum(len(tweets) for tweets in self.tweets)
+
+    def user(self, username):
+        if username not in self.index:
+            return None
+        return {"id": str(USER_ID_BASE + self.index[username]), "name": username, "username": username}
+
+    def user_by_id(self, user_id):
+        user_index = int(user_id) - USER_ID_BASE
+        if not 0 <= user_index < len(self.usernames):
+            return None
+        return self.user(self.usernames[user_index])
+
+    def add_tweets(self, count, rng=random):
+        pass
+
+    def page(self, user_id, since_id=None, max_results=10, offset=0):
+        user_index = int(user_id) - USER_ID_BASE
+        if not 0 <= user_index < len(self.tweets):
+            return None, None
+        tweets = self.tweets[user_index]
+        if since_id is not None:
+            tweets = [t for t in tweets if int(t["id"]) > int(since_id)]
+        page = tweets[offset:offset + max_results]
+        next_offset = offset + len(page) if offset + len(page) < len(tweets) else None
+        return page, next_offset
+
+
+class _RouteLimiter:
+    def __init__(self, limit, window_seconds):
+        """固定窗口计数，行为与 x-rate-limit-* 响应头一致"""
+        self.limit = limit
+        self.window = window_seconds
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def hit(self, route):
+        """返回 (是否允许, 剩余额度, 重置时间戳)"""
+        now = time.time()
+        with self.lock:
+            reset_at, used = self.windows.get(route, (0, 0))
+            if now >= reset_at:
+                reset_at, used = int(now + self.window), 0
+            allowed = used < self.limit
+            if allowed:
+                used += 1
+            self.windows[route] = (reset_at, used)
+            return allowed, self.limit - used, reset_at
+
+
+class _FakeTwitterHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        if parts[:3] == ["2", "users", "by"] and len(parts) == 5 and parts[3] == "username":
+            route, handler = "/2/users/by/username/:username", lambda: self._get_user(parts[4])
+        elif parts == ["2", "users", "by"]:
+            route, handler = "/2/users/by", lambda: self._get_users(params.get("usernames", ""))
+        elif parts == ["2", "users"]:
+            route, handler = "/2/users", lambda: self._get_users_by_ids(params.get("ids", ""))
+        elif len(parts) == 4 and parts[:2] == ["2", "users"] and parts[3] == "tweets":
+            route, handler = "/2/users/:id/tweets", lambda: self._get_users_tweets(parts[2], params)
+        else:
+            self._send(404, {"title": "Not Found Error", "detail": self.path})
+            return
+
+        server.stats["requests"] += 1
+        if server.latency:
+            time.sleep(max(0.0, random.gauss(server.latency, server.latency_jitter)))
+
+        allowed, remaining, reset_at = server.limiter.hit(route)
+        headers = {
+            "x-rate-limit-limit": str(server.limiter.limit),
+            "x-rate-limit-remaining": str(max(remaining, 0)),
+            "x-rate-limit-reset": str(reset_at)
+        }
+        if not allowed or random.random() < server.error_rate:
+            server.stats["rate_limited"] += 1
+            self._send(429, {"title": "Too Many Requests", "status": 429}, headers)
+            return
+        status, body = handler()
+        self._send(status, body, headers)
+
+    def do_POST(self):
+        """警报 webhook 接收端，只计数"""
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path.startswith("/hook"):
+            self.server.stats["webhooks"] += 1
+            self.server.stats["webhook_alerts"] += json.loads(body or b"{}").get("count", 1)
+            self._send(200, {"ok": True})
+        else:
+            self._send(404, {"title": "Not Found Error"})
+
+    def _get_user(self, username):
+        user = self.server.corpus.user(username)
+        if user is None:
+            return 200, {"errors": [{"value": username, "detail": f"Could not find user with username: [{username}].",
+                                     "title": "Not Found Error", "resource_type": "user",
+                                     "parameter": "username", "type": "https://api.twitter.com/2/problems/resource-not-found"}]}
+        return 200, {"data": user}
+
+    def _get_users(self, usernames):
+        found, errors = [], []
+        for username in filter(None, usernames.split(",")):
+            user = self.server.corpus.user(username)
+            if user is None:
+                errors.append({"value": username, "detail": f"Could not find user with usernames: [{username}].",
+                               "title": "Not Found Error", "resource_type": "user", "parameter": "usernames",
+                               "type": "https://api.twitter.com/2/problems/resource-not-found"})
+            else:
+                found.append(user)
+        body = {}
+        if found:
+            body["data"] = found
+        if errors:
+            body["errors"] = errors
+        return 200, body
+
+    def _get_users_by_ids(self, ids):
+        found, errors = [], []
+        for user_id in filter(None, ids.split(",")):
+            user = self.server.corpus.user_by_id(user_id) if user_id.isdigit() else None
+            if user is None:
+                errors.append({"value": user_id, "detail": f"Could not find user with ids: [{user_id}].",
+                               "title": "Not Found Error", "resource_type": "user", "parameter": "ids",
+                               "type": "https://api.twitter.com/2/problems/resource-not-found"})
+            else:
+                found.append(user)
+        body = {}
+        if found:
+            body["data"] = found
+        if errors:
+            body["errors"] = errors
+        return 200, body
+
+    def _get_users_tweets(self, user_id, params):
+        max_results = min(int(params.get("max_results", 10)), 100)
+        offset = int(params.get("pagination_token", 0))
+        tweets, next_offset = self.server.corpus.page(user_id, params.get("since_id"), max_results, offset)
+        if tweets is None:
+            return 404, {"title": "Not Found Error", "detail": f"Could not find user with id: [{user_id}]."}
+
+        fields = set(params.get("tweet.fields", "").split(",")) | {"id", "text", "edit_history_tweet_ids"}
+        data = [{key: value for key, value in tweet.items() if key in fields} for tweet in tweets]
+        self.server.stats["tweets_served"] += len(data)
+        meta = {"result_count": len(data)}
+        if data:
+            meta["newest_id"] = data[0]["id"]
+            meta["oldest_id"] = data[-1]["id"]
+        if next_offset is not None:
+            meta["next_token"] = str(next_offset)
+        body = {"meta": meta}
+        if data:
+            body["data"] = data
+        return 200, body
+
+    def _send(self, status, body, headers=None):
+        payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class FakeTwitterServer:
+    def __init__(self, corpus, host="127.0.0.1", port=0, latency=0.0, latency_jitter=0.0,
+                 rate_limit=900, rate_window=900, error_rate=0.0, live_rate=0.0):
+        """
+        latency / latency_jitter: 每个请求的延迟均值与标准差（秒）
+        rate_limit / rate_window: 每个接口每个窗口的请求额度，用尽后返回 429
+        error_rate: 额度内随机返回 429 的概率
+        live_rate: 每秒新增推文数（模拟账号持续发推）
+        """
+        self.httpd = ThreadingHTTPServer((host, port), _FakeTwitterHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.corpus = corpus
+        self.httpd.latency = latency
+        self.httpd.latency_jitter = latency_jitter
+        self.httpd.error_rate = error_rate
+        self.httpd.limiter = _RouteLimiter(rate_limit, rate_window)
+        self.httpd.stats = {"requests": 0, "rate_limited": 0, "tweets_served": 0, "webhooks": 0, "webhook_alerts": 0}
+        self.live_rate = live_rate
+        self._stop = threading.Event()
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def stats(self):
+        return dict(self.httpd.stats)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-twitter", daemon=True).start()
+        if self.live_rate > 0:
+            threading.Thread(target=self._grow, name="fake-twitter-live", daemon=True).start()
+        return self
+
+    def _grow(self):
+        while not self._stop.wait(1.0):
+            self.httpd.corpus.add_tweets(int(self.live_rate))
+
+    def stop(self):
+        self._stop.set()
+        self.httpd.shutdown()
+
+
+class RedirectAdapter(HTTPAdapter):
+    def __init__(self, target_base, source_bases=TWITTER_API_BASES, **kwargs):
+        """把发往 Twitter API 的请求改写到 target_base（保留路径与查询参数）"""
+        super().__init__(**kwargs)
+        self.target_base = target_base.rstrip("/")
+        self.source_bases = source_bases
+
+    def send(self, request, **kwargs):
+        for base in self.source_bases:
+            if request.url.startswith(base):
+                request.url = self.target_base + request.url[len(base):]
+                break
+        return super().send(request, **kwargs)
+
+
+def redirect_client(client, target_base):
+    """让 tweepy.Client 的全部请求改发到本地替身"""
+    adapter = RedirectAdapter(target_base, pool_maxsize=32)
+    for base in TWITTER_API_BASES:
+        client.session.mount(base, adapter)
+    return client
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="本地 Twitter v2 接口替身")
+    parser.add_argument("--corpus", help="录制的推文 JSONL；不指定时生成合成语料")
+    parser.add_argument("--accounts", default="", help="合成语料的账号，逗号分隔（默认取 config.LEADER_ACCOUNTS）")
+    parser.add_argument("--tweets-per-user", type=int, default=1000)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.05, help="平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="延迟标准差（秒）")
+    parser.add_argument("--rate-limit", type=int, default=900, help="每接口每窗口请求额度")
+    parser.add_argument("--rate-window", type=int, default=900, help="限流窗口（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机 429 概率")
+    parser.add_argument("--live-rate", type=float, default=0.0, help="每秒新增推文数")
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = RecordedCorpus(args.corpus)
+    else:
+        accounts = [a for a in args.accounts.split(",") if a]
+        if not accounts:
+            from 配置中心 import get_settings
+            accounts = list(get_settings().accounts)
+        corpus = SyntheticCorpus(accounts, args.tweets_per_user)
+
+    server = FakeTwitterServer(
+        corpus, port=args.port, latency=args.latency, latency_jitter=args.jitter,
+        rate_limit=args.rate_limit, rate_window=args.rate_window, error_rate=args.error_rate,
+        live_rate=args.live_rate
+    ).start()
+    print(f"▶️ Twitter 接口替身已启动: {server.url}（{len(corpus.usernames)} 个账号，{corpus.total} 条推文）")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"📊 {server.stats}")
+    except KeyboardInterrupt:
+        server.stop()
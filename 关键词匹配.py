@@ -0,0 +1,106 @@
+"""
+关键词匹配模块
+把黑天鹅与紧急程度词表一次性编译为基于字典树的正则，单次扫描文本得到全部命中
+"""
+
+import re
+
+# 英文词允许的常见词形变化（wars / bombed / attacking）
+_ENGLISH_SUFFIX = r"(?:es|ed|ing|s|d)?"
+# 英文词边界只看 ASCII 字母数字，避免把紧邻的中文字符当成单词的一部分
+_ENGLISH_BOUNDARY_BEFORE = r"(?<![a-z0-9_])"
+_ENGLISH_BOUNDARY_AFTER = r"(?![a-z0-9_])"
+
+
+def _trie_pattern(words):
+    """把词表构造成字典树形式的正则，匹配开销与词表大小基本无关"""
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        if "" in node and len(node) == 1:
+            return None
+        optional = "" in node
+        branches = []
+        for ch in sorted(k for k in node if k):
+            sub = build(node[ch])
+            branches.append(re.escape(ch) + (sub or ""))
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if optional:
+            body = "(?:" + body + ")?"
+        return body
+
+    return build(trie) if trie else None
+
+
+def _is_english(word):
+    return all(ord(ch) < 128 for ch in word)
+
+
+class KeywordMatcher:
+    def __init__(self, category_keywords, urgency_keywords):
+        """
+        category_keywords: {类别: [关键词...]} 或 {类别: {"keywords": [...], ...}}（config.BLACK_SWAN_KEYWORDS 格式）
+        urgency_keywords: {紧急程度: [关键词...]}，按从高到低排列
+        """
+        self.term_categories = {}
+        for category, entry in category_keywords.items():
+            keywords = entry["keywords"] if isinstance(entry, dict) else entry
+            for kw in keywords:
+                self.term_categories.setdefault(kw.lower(), []).append(category)
+        self.categories = list(category_keywords)
+
+        self.term_urgency = {}
+        self.urgency_rank = {}
+        for rank, (level, keywords) in enumerate(urgency_keywords.items()):
+            self.urgency_rank[level] = rank
+            for kw in keywords:
+                self.term_urgency.setdefault(kw.lower(), level)
+        self.default_urgency = list(urgency_keywords)[-1] if urgency_keywords else None
+
+        self.pattern = self._compile(set(self.term_categories) | set(self.term_urgency))
+
+    def _compile(self, vocabulary):
+        english = _trie_pattern(sorted(w for w in vocabulary if _is_english(w)))
+        cjk = _trie_pattern(sorted(w for w in vocabulary if not _is_english(w)))
+        parts = []
+        if english:
+            parts.append(f"{_ENGLISH_BOUNDARY_BEFORE}(?P<en>{english}){_ENGLISH_SUFFIX}{_ENGLISH_BOUNDARY_AFTER}")
+        if cjk:
+            # 中文没有空格分词，直接按子串匹配
+            parts.append(f"(?P<cjk>{cjk})")
+        return re.compile("|".join(parts)) if parts else None
+
+    def match(self, text):
+        """
+        单次扫描返回：
+        categories: {类别: [命中关键词（去重，按出现顺序）]}
+        counts: {关键词: 出现次数}
+        urgency_level: 命中的最高紧急程度，未命中时为最低档
+        """
+        categories = {}
+        counts = {}
+        urgency_level = self.default_urgency
+        if self.pattern is None:
+            return {"categories": categories, "counts": counts, "urgency_level": urgency_level}
+
+        for m in self.pattern.finditer(text.lower()):
+            term = m.group("en") if m.lastgroup == "en" else m.group("cjk")
+            if term is None:
+                term = m.group(0)
+            counts[term] = counts.get(term, 0) + 1
+            if counts[term] > 1:
+                continue
+            for category in self.term_categories.get(term, ()):
+                categories.setdefault(category, []).append(term)
+            level = self.term_urgency.get(term)
+            if level is not None and self.urgency_rank[level] < self.urgency_rank[urgency_level]:
+                urgency_level = level
+
+        # 按词表中的类别顺序输出，保持结果稳定
+        ordered = {c: categories[c] for c in self.categories if c in categories}
+        return {"categories": ordered, "counts": counts, "urgency_level": urgency_level}
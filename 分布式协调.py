@@ -0,0 +1,382 @@
+"""
+分布式协调模块
+多台抓取主机共用一个 MongoDB：每个工作进程定时写心跳，按存活进程构建一致性哈希环，
+账号映射到环上的唯一负责进程；进程加入或失联时环随之变化，只有少量账号换手
+
+为保证每个账号每个周期只被抓取一次，抓取前还要在 coord_leases 上原子占用租约：
+只有到期（next_due_at 已过）且租约空闲的账号才能被占用，抓取完成后把 next_due_at 推进一个周期。
+加速轮询（如黑天鹅推文后）时本地间隔变短：距上次开始抓取已超过当前间隔的账号也视为到期。
+租约带递增的 epoch 作为防护令牌，租约过期后被他人接手的进程无法再提交完成状态
+
+故障演练（需要本地 mongod）:
+    python 分布式协调.py --simulate --workers 3 --accounts 30 --kill-after 15 --duration 60
+"""
+
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COORDINATION_CONFIG = {
+    "HEARTBEAT_SECONDS": 10,  # 心跳间隔
+    "WORKER_TTL_SECONDS": 30,  # 超过该时长没有心跳视为失联
+    "LEASE_SECONDS": 600,  # 单个账号的抓取租约，持有期间随心跳续期
+    "VIRTUAL_NODES": 64  # 每个进程在哈希环上的虚拟节点数
+}
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes=(), vnodes=64):
+        """一致性哈希环：每个节点放置 vnodes 个虚拟节点，键顺时针归属最近的节点"""
+        self.vnodes = vnodes
+        self.nodes = tuple(sorted(nodes))
+        points = sorted((_hash(f"{node}#{i}"), node) for node in self.nodes for i in range(vnodes))
+        self._hashes = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def owner(self, key):
+        if not self._hashes:
+            return None
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class Coordinator:
+    def __init__(self, db, worker_id=None, config=None):
+        """
+        db: 共享的 MongoDB 数据库
+        coord_workers: {_id: worker_id, host, pid, started_at, heartbeat_at}
+        coord_leases: {_id: username, owner, epoch, lease_until, next_due_at, last_started_at, last_fetched_at}
+        """
+        self.config = {**DEFAULT_COORDINATION_CONFIG, **(config or {})}
+        self.workers = db["coord_workers"]
+        self.leases = db["coord_leases"]
+        self.worker_id = worker_id or default_worker_id()
+        self.ring = HashRing((), self.config["VIRTUAL_NODES"])
+        self.held = {}  # username → epoch，本进程正在持有的租约
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.on_rebalance = None  # 回调 on_rebalance(old_nodes, new_nodes)
+
+    # ---------- 成员与心跳 ----------
+    def start(self):
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name="coord-heartbeat", daemon=True)
+        self._thread.start()
+        logger.info(f"工作进程 {self.worker_id} 已加入，当前存活 {len(self.ring.nodes)} 个")
+        return self
+
+    def stop(self):
+        """正常退出：释放租约并删除心跳，其他进程立即接手，无需等待超时"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self.lock:
+            held = dict(self.held)
+            self.held.clear()
+        for username, epoch in held.items():
+            self._release(username, epoch)
+        self.workers.delete_one({"_id": self.worker_id})
+
+    def _run(self):
+        while not self._stop.wait(self.config["HEARTBEAT_SECONDS"]):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"心跳失败（{self.worker_id}）: {e}")
+
+    def heartbeat(self, now=None):
+        """写心跳、续期持有的租约，并按存活进程刷新哈希环"""
+        now = now or datetime.utcnow()
+        self.workers.update_one(
+            {"_id": self.worker_id},
+            {
+                "$set": {"heartbeat_at": now},
+                "$setOnInsert": {"host": socket.gethostname(), "pid": os.getpid(), "started_at": now}
+            },
+            upsert=True
+        )
+        with self.lock:
+            held = list(self.held)
+        if held:
+            # 只续期仍在有效期内的租约；已过期的可能已被接手
+            self.leases.update_many(
+                {"_id": {"$in": held}, "owner": self.worker_id, "lease_until": {"$gt": now}},
+                {"$set": {"lease_until": now + timedelta(seconds=self.config["LEASE_SECONDS"])}}
+            )
+        self.refresh(now)
+
+    def live_workers(self, now=None):
+        now = now or datetime.utcnow()
+        cutoff = now - timedelta(seconds=self.config["WORKER_TTL_SECONDS"])
+        return sorted(doc["_id"] for doc in self.workers.find({"heartbeat_at": {"$gte": cutoff}}, {"_id": 1}))
+
+    def refresh(self, now=None):
+        nodes = self.live_workers(now)
+        if self.worker_id not in nodes:
+            # 自己的心跳刚写入，查询时仍应在列；网络抖动时至少保证自己在环上
+            nodes = sorted(nodes + [self.worker_id])
+        if tuple(nodes) != self.ring.nodes:
+            old = self.ring.nodes
+            self.ring = HashRing(nodes, self.config["VIRTUAL_NODES"])
+            logger.info(f"哈希环已更新: {len(old)} → {len(nodes)} 个工作进程")
+            if self.on_rebalance is not None:
+                self.on_rebalance(old, self.ring.nodes)
+
+    # ---------- 账号归属 ----------
+    def owns(self, username):
+        return self.ring.owner(username) == self.worker_id
+
+    def owned(self, usernames):
+        return [username for username in usernames if self.owns(username)]
+
+    # ---------- 租约 ----------
+    def claim(self, username, now=None, interval_seconds=None):
+        """
+        占用账号本周期的抓取租约，成功返回 epoch（完成时作为防护令牌），
+        账号未到期或正被他人持有时返回 None
+        interval_seconds: 调用方当前的轮询间隔；比完成时记录的周期短（加速中）时按它判断是否到期
+        """
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        now = now or datetime.utcnow()
+        due = [{"next_due_at": {"$lte": now}}, {"next_due_at": {"$exists": False}}]
+        if interval_seconds is not None:
+            due.append({"last_started_at": {"$lte": now - timedelta(seconds=interval_seconds)}})
+        try:
+            doc = self.leases.find_one_and_update(
+                {
+                    "_id": username,
+                    "$and": [
+                        {"$or": due},
+                        {"$or": [{"lease_until": {"$lte": now}}, {"lease_until": {"$exists": False}}]}
+                    ]
+                },
+                {
+                    "$set": {
+                        "owner": self.worker_id,
+                        "claimed_at": now,
+                        "lease_until": now + timedelta(seconds=self.config["LEASE_SECONDS"])
+                    },
+                    "$inc": {"epoch": 1}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # 文档已存在但未到期或租约未释放，upsert 插入同 _id 失败
+            return None
+        with self.lock:
+            self.held[username] = doc["epoch"]
+        return doc["epoch"]
+
+    def complete(self, username, epoch, interval_seconds, started_at):
+        """抓取完成：下一次到期时间 = 本次开始 + 周期；租约已被接手时返回 False"""
+        with self.lock:
+            self.held.pop(username, None)
+        now = datetime.utcnow()
+        result = self.leases.update_one(
+            {"_id": username, "owner": self.worker_id, "epoch": epoch},
+            {"$set": {
+                "next_due_at": started_at + timedelta(seconds=interval_seconds),
+                "last_started_at": started_at,
+                "lease_until": now,
+                "last_fetched_at": now
+            }}
+        )
+        if result.modified_count != 1:
+            logger.warning(f"{username} 的租约已失效（epoch {epoch}），本次完成状态未提交")
+            return False
+        return True
+
+    def release(self, username, epoch):
+        """抓取失败：释放租约但不推进到期时间，其他进程（或自己）可立即重试"""
+        with self.lock:
+            self.held.pop(username, None)
+        self._release(username, epoch)
+
+    def _release(self, username, epoch):
+        self.leases.update_one(
+            {"_id": username, "owner": self.worker_id, "epoch": epoch},
+            {"$set": {"lease_until": datetime.utcnow()}}
+        )
+
+    def next_due(self, username, interval_seconds=None):
+        """
+        账号在共享租约表中的下一次到期时间，没有记录时返回 None
+        给出 interval_seconds 时取 next_due_at 与「上次开始 + 当前间隔」中较早者
+        """
+        doc = self.leases.find_one({"_id": username}, {"next_due_at": 1, "last_started_at": 1})
+        if not doc:
+            return None
+        due = doc.get("next_due_at")
+        if interval_seconds is not None and doc.get("last_started_at") is not None:
+            boosted = doc["last_started_at"] + timedelta(seconds=interval_seconds)
+            due = boosted if due is None else min(due, boosted)
+        return due
+
+
+def ensure_coordination_indexes(db):
+    db["coord_workers"].create_index("heartbeat_at")
+    db["coord_leases"].create_index("owner")
+
+
+# ---------- 故障演练 ----------
+def _simulate_worker(uri, database, worker_id, accounts, interval, fetch_seconds, config):
+    """演练用工作进程：抓取动作只写一条抓取日志"""
+    import signal
+
+    from pymongo import MongoClient
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    db = MongoClient(uri)[database]
+    coordinator = Coordinator(db, worker_id, config).start()
+    log = db["coord_fetch_log"]
+    try:
+        while True:
+            for username in coordinator.owned(accounts):
+                started = datetime.utcnow()
+                epoch = coordinator.claim(username, started)
+                if epoch is None:
+                    continue
+                time.sleep(fetch_seconds)
+                log.insert_one({"username": username, "worker": worker_id, "epoch": epoch,
+                                "started_at": started, "finished_at": datetime.utcnow()})
+                coordinator.complete(username, epoch, interval, started)
+            time.sleep(0.2)
+    finally:
+        coordinator.stop()
+
+
+def verify_fetch_log(log_docs, interval, max_gap):
+    """
+    检查每个账号的抓取记录：
+    duplicates: 同一周期内被抓取两次（相邻两次开始时间间隔小于周期）
+    gaps: 相邻两次抓取间隔超过 max_gap（失联进程的账号没有及时被接手）
+    """
+    by_account = {}
+    for doc in log_docs:
+        by_account.setdefault(doc["username"], []).append(doc)
+    duplicates, gaps = [], []
+    for username, docs in by_account.items():
+        docs.sort(key=lambda doc: doc["started_at"])
+        for previous, current in zip(docs, docs[1:]):
+            delta = (current["started_at"] - previous["started_at"]).total_seconds()
+            # 允许少量时钟与轮询误差
+            if delta < interval * 0.98:
+                duplicates.append({"username": username, "seconds": round(delta, 2),
+                                   "workers": [previous["worker"], current["worker"]]})
+            elif delta > max_gap:
+                gaps.append({"username": username, "seconds": round(delta, 2),
+                             "workers": [previous["worker"], current["worker"]]})
+    return {"accounts": len(by_account), "fetches": sum(len(docs) for docs in by_account.values()),
+            "duplicates": duplicates, "gaps": gaps}
+
+
+def simulate(args):
+    import multiprocessing
+
+    from pymongo import MongoClient
+
+    from 配置中心 import get_settings
+
+    if args.database == get_settings().mongodb.database_name:
+        raise SystemExit(f"❌ 演练会清空数据库 {args.database}，请用 --database 指定单独的库")
+    uri = get_settings().mongodb.connection_string
+    client = MongoClient(uri)
+    client.drop_database(args.database)
+    db = client[args.database]
+    ensure_coordination_indexes(db)
+
+    config = {"HEARTBEAT_SECONDS": args.heartbeat, "WORKER_TTL_SECONDS": args.ttl,
+              "LEASE_SECONDS": args.lease, "VIRTUAL_NODES": 64}
+    accounts = [f"acct_{i:04d}" for i in range(args.accounts)]
+    ctx = multiprocessing.get_context("spawn")
+
+    def spawn(index):
+        process = ctx.Process(
+            target=_simulate_worker,
+            args=(uri, args.database, f"sim-{index}", accounts, args.interval, args.fetch_seconds, config),
+            name=f"sim-{index}", daemon=True
+        )
+        process.start()
+        return process
+
+    processes = [spawn(i) for i in range(args.workers)]
+    print(f"▶️ 已启动 {args.workers} 个工作进程，{len(accounts)} 个账号，周期 {args.interval} 秒")
+    started = time.monotonic()
+    killed = joined = False
+    while time.monotonic() - started < args.duration:
+        elapsed = time.monotonic() - started
+        if not killed and args.kill_after and elapsed >= args.kill_after:
+            # 模拟宕机：直接杀掉进程，不注销心跳、不释放租约
+            processes[0].kill()
+            killed = True
+            print(f"💥 {elapsed:.0f} 秒: 已杀掉 sim-0")
+        if not joined and args.join_after and elapsed >= args.join_after:
+            processes.append(spawn(len(processes)))
+            joined = True
+            print(f"➕ {elapsed:.0f} 秒: 新工作进程 sim-{len(processes) - 1} 加入")
+        time.sleep(0.5)
+
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(timeout=10)
+
+    # 失联账号最迟在心跳超时 + 一次心跳 + 周期（宕机时若正持有租约，再加租约时长）后被接手
+    max_gap = args.interval + args.ttl + args.heartbeat + args.lease + 2
+    report = verify_fetch_log(list(db["coord_fetch_log"].find()), args.interval, max_gap)
+    per_worker = {}
+    for doc in db["coord_fetch_log"].find({}, {"worker": 1}):
+        per_worker[doc["worker"]] = per_worker.get(doc["worker"], 0) + 1
+    report["per_worker"] = per_worker
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="分布式协调故障演练")
+    parser.add_argument("--simulate", action="store_true", help="启动多个本地工作进程并校验抓取记录")
+    parser.add_argument("--database", default="twitter_monitor_coord", help="演练数据库名（会被清空）")
+    parser.add_argument("--workers", type=int, default=3)
+    parser.add_argument("--accounts", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=5.0, help="每个账号的抓取周期（秒）")
+    parser.add_argument("--fetch-seconds", type=float, default=0.2, help="模拟单次抓取耗时")
+    parser.add_argument("--heartbeat", type=float, default=1.0)
+    parser.add_argument("--ttl", type=float, default=3.0)
+    parser.add_argument("--lease", type=float, default=5.0)
+    parser.add_argument("--kill-after", type=float, default=15.0, help="多少秒后杀掉第一个进程，0 表示不杀")
+    parser.add_argument("--join-after", type=float, default=30.0, help="多少秒后加入新进程，0 表示不加入")
+    parser.add_argument("--duration", type=float, default=60.0)
+    args = parser.parse_args()
+
+    if not args.simulate:
+        parser.print_help()
+        sys.exit(0)
+    report = simulate(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    ok = not report["duplicates"] and not report["gaps"] and report["accounts"] == args.accounts
+    print("✅ 每个账号每个周期恰好抓取一次，故障后按时接手" if ok else "❌ 演练发现问题")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,248 @@
+"""
+分析流水线模块
+抓取线程把原始推文放入有界队列，多个分析进程各持有一个分析器并行消费，
+写入线程负责落库与报警。队列写满时抓取端阻塞，形成背压。
+分析进程意外退出（OOM、推理库崩溃）时主进程将其重启，并重新提交它已取走、尚未返回结果的推文。
+"""
+
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_STOP = None
+
+
+def _analyze_batch(analyze_tweets, batch):
+    """整批分析失败时逐条重试，仍然失败的推文结果为 None"""
+    try:
+        return analyze_tweets([raw["text"] for raw in batch])
+    except Exception as e:
+        logger.error(f"分析进程批量处理失败（{len(batch)} 条），改为逐条分析: {e}")
+    results = []
+    for raw in batch:
+        try:
+            results.append(analyze_tweets([raw["text"]])[0])
+        except Exception as e:
+            logger.error(f"推文分析失败（{raw.get('id')}）: {e}")
+            results.append(None)
+    return results
+
+
+def _worker_main(slot, raw_queue, result_queue, batch_size, lightweight, config_overrides):
+    """
+    分析进程入口：每个进程构建一个分析器，按批次消费 (序号, 原始推文)
+    slot: 共享内存数组，slot[0] 为当前批次条数，其后为各条序号
+    """
+    # Ctrl+C 由主进程统一处理，分析进程只响应结束标记
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    # spawn 出的进程有各自的配置中心：沿用主进程的覆盖项，并自行监视配置文件以热更新关键词
+    from 配置中心 import get_config_center
+    config_center = get_config_center()
+    if config_overrides:
+        config_center.apply_overrides(config_overrides)
+    config_center.start_watching()
+
+    import 语义分析
+    if lightweight:
+        语义分析.set_lightweight_mode(True)
+    语义分析.get_analyzer()
+
+    stopping = False
+    while not stopping:
+        item = raw_queue.get()
+        if item is _STOP:
+            break
+        batch = [item]
+        # 尽量凑满一个批次再推理
+        while len(batch) < batch_size:
+            try:
+                item = raw_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stopping = True
+                break
+            batch.append(item)
+
+        # 先把本批序号写入共享内存（不经过队列的后台线程，进程被杀也不会丢），
+        # 进程意外退出时主进程据此把这些推文重新入队
+        slot[1:len(batch) + 1] = [seq for seq, _ in batch]
+        slot[0] = len(batch)
+        results = _analyze_batch(语义分析.analyze_tweets, [raw for _, raw in batch])
+        for (seq, _), result in zip(batch, results):
+            result_queue.put((seq, result))
+
+    result_queue.put(_STOP)
+
+
+class AnalysisPipeline:
+    def __init__(self, store_fn, workers=2, queue_size=1000, batch_size=16, lightweight=False, poll_seconds=1.0):
+        """
+        store_fn(raw, analysis_result): 写入线程中调用，负责落库与报警
+        workers: 分析进程数
+        queue_size: 原始队列与结果队列的容量上限
+        poll_seconds: 阻塞等待期间检查分析进程存活的间隔
+        """
+        from 配置中心 import get_config_center
+
+        self.store_fn = store_fn
+        self.worker_count = workers
+        self.poll_seconds = poll_seconds
+        # spawn 避免在已加载 torch 或已有线程的进程里 fork
+        self.ctx = multiprocessing.get_context("spawn")
+        self.raw_queue = self.ctx.Queue(maxsize=queue_size)
+        self.result_queue = self.ctx.Queue(maxsize=queue_size)
+        self.worker_args = (self.raw_queue, self.result_queue, batch_size, lightweight,
+                            get_config_center().overrides)
+        # 每个进程一个共享内存槽位，记录它已取走的批次；不加锁，进程退出后才由主进程读取
+        self.slots = [self.ctx.Array("q", batch_size + 1, lock=False) for _ in range(workers)]
+        self.workers = [self._spawn(i) for i in range(workers)]
+        self.writer = threading.Thread(target=self._writer_loop, name="analysis-writer", daemon=True)
+        self.next_seq = 0
+        self.outstanding = {}  # 序号 → 已提交、尚未处理完的原始推文
+        self.submitted = 0
+        self.completed = 0
+        self.restarts = 0
+        # 分析或写入失败的原始推文，由抓取端取走后保留对应账号的检查点
+        self.failures = []
+        self.progress = threading.Condition()
+        self.started = False
+        self.closed = False
+
+    def _spawn(self, index):
+        return self.ctx.Process(
+            target=_worker_main,
+            args=(self.slots[index], *self.worker_args),
+            name=f"analysis-worker-{index}",
+            daemon=True
+        )
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self.writer.start()
+        self.started = True
+        return self
+
+    def submit(self, raw):
+        """提交一条原始推文（可序列化的 dict）；队列满时阻塞"""
+        if self.closed:
+            raise RuntimeError("分析流水线已关闭")
+        with self.progress:
+            seq = self.next_seq
+            self.next_seq += 1
+            self.outstanding[seq] = raw
+            self.submitted += 1
+        self._put((seq, raw))
+
+    def _put(self, item):
+        # 分析进程全部退出时队列不会再被消费，阻塞期间定期检查并重启
+        while True:
+            try:
+                self.raw_queue.put(item, timeout=self.poll_seconds)
+                return
+            except queue.Full:
+                self.check_workers()
+
+    def check_workers(self):
+        """重启意外退出的分析进程，并把它已取走、尚未返回结果的推文重新入队；返回重启的进程数"""
+        if not self.started or self.closed:
+            return 0
+        requeue = []
+        restarted = 0
+        with self.progress:
+            for index, worker in enumerate(self.workers):
+                if worker.is_alive():
+                    continue
+                slot = self.slots[index]
+                # 已返回结果的序号不在 outstanding 中；重复的结果由写入线程丢弃
+                lost = [seq for seq in slot[1:slot[0] + 1] if seq in self.outstanding]
+                slot[0] = 0
+                logger.error(f"{worker.name} 意外退出（exitcode={worker.exitcode}），重启并重新提交 {len(lost)} 条推文")
+                requeue.extend((seq, self.outstanding[seq]) for seq in lost)
+                self.workers[index] = self._spawn(index)
+                self.workers[index].start()
+                self.restarts += 1
+                restarted += 1
+        for item in requeue:
+            self._put(item)
+        return restarted
+
+    def wait_idle(self, timeout=None):
+        """等待已提交的推文全部处理完，期间检查分析进程存活；超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self.progress:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return not self.outstanding
+                wait = self.poll_seconds if remaining is None else min(self.poll_seconds, remaining)
+                if self.progress.wait_for(lambda: not self.outstanding, wait):
+                    return True
+            self.check_workers()
+
+    def abandon(self):
+        """
+        放弃全部未完成的推文（wait_idle 超时后调用），返回这些原始推文；
+        之后到达的对应结果不再落库，调用方须保留相关账号的检查点以便重新抓取
+        """
+        with self.progress:
+            abandoned = list(self.outstanding.values())
+            self.outstanding.clear()
+            self.progress.notify_all()
+        return abandoned
+
+    def take_failures(self):
+        """取出并清空上次调用以来处理失败的原始推文"""
+        with self.progress:
+            failures, self.failures = self.failures, []
+        return failures
+
+    def _writer_loop(self):
+        finished_workers = 0
+        while finished_workers < self.worker_count:
+            item = self.result_queue.get()
+            if item is _STOP:
+                finished_workers += 1
+                continue
+            seq, result = item
+            with self.progress:
+                raw = self.outstanding.get(seq)
+            if raw is None:
+                # 重新入队后的重复结果，或已被放弃的推文
+                continue
+            ok = False
+            try:
+                if result is not None:
+                    self.store_fn(raw, result)
+                    ok = True
+            except Exception as e:
+                logger.error(f"写入失败（{raw.get('id')}）: {e}")
+            finally:
+                with self.progress:
+                    if not ok:
+                        self.failures.append(raw)
+                    self.outstanding.pop(seq, None)
+                    self.completed += 1
+                    self.progress.notify_all()
+
+    def shutdown(self, timeout=60):
+        """优雅关闭：不再接收新推文，处理完队列中剩余推文后结束各进程"""
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.workers:
+            self.raw_queue.put(_STOP)
+        for worker in self.workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                logger.warning(f"{worker.name} 未在 {timeout} 秒内退出，强制终止")
+                worker.terminate()
+        self.writer.join(timeout)
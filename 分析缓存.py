@@ -0,0 +1,200 @@
+"""
+分析结果缓存模块
+按“规范化文本哈希 + 模型版本”缓存分析结果：进程内 LRU 层 + 可选持久层（MongoDB 或 SQLite）
+"""
+
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 转推前缀 "RT @user: " 与多余空白不影响分析结果
+_RETWEET_PREFIX = re.compile(r"^rt @\w+:\s*", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    text = _RETWEET_PREFIX.sub("", text.strip())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(text, model_version):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{model_version}:{digest}"
+
+
+class SQLiteCacheTier:
+    # 命中时只在内存中记录访问时间，攒够这么多条或下次写入时再批量更新，避免每次命中都提交事务
+    TOUCH_BATCH = 256
+
+    def __init__(self, path, max_entries, slack=None):
+        """
+        本地 SQLite 持久层，超出 max_entries + slack 时一次淘汰到 max_entries，淘汰最久未访问的条目
+        slack 默认为 max_entries 的 10%，避免每次写入都触发淘汰
+        """
+        self.max_entries = max_entries
+        self.slack = max(max_entries // 10, 1) if slack is None else slack
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.touched = {}  # key → 尚未写回的访问时间
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache "
+                "(key TEXT PRIMARY KEY, value TEXT, accessed_at REAL)"
+            )
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_accessed ON analysis_cache(accessed_at)"
+            )
+            self.conn.commit()
+            self.count = self.conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.touched[key] = time.time()
+            if len(self.touched) >= self.TOUCH_BATCH:
+                self._write_touched()
+                self.conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        with self.lock:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO analysis_cache (key, value, accessed_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), time.time())
+            )
+            self.count += cursor.rowcount
+            self._write_touched()
+            if self.count > self.max_entries + self.slack:
+                self._evict()
+            self.conn.commit()
+
+    def _write_touched(self):
+        if self.touched:
+            self.conn.executemany(
+                "UPDATE analysis_cache SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self.touched.items()]
+            )
+            self.touched.clear()
+
+    def _evict(self):
+        """删除最久未访问的条目直到回到 max_entries；按 accessed_at 索引顺序读取，不对全表排序"""
+        self.count = self.conn.execute("SELECT COUNT(*) FROM analysis_cache").fetchone()[0]
+        excess = self.count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM analysis_cache WHERE key IN ("
+                "SELECT key FROM analysis_cache ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            self.count -= excess
+
+
+class MongoCacheTier:
+    def __init__(self, db, max_bytes, collection_name="analysis_cache"):
+        """MongoDB 持久层，使用固定大小集合（capped collection），写满后自动淘汰最早的条目"""
+        from pymongo.errors import CollectionInvalid, OperationFailure
+
+        try:
+            db.create_collection(collection_name, capped=True, size=max_bytes)
+        except CollectionInvalid:
+            pass  # 集合已存在
+        self.collection = db[collection_name]
+        try:
+            self.collection.create_index("key", unique=True)
+        except OperationFailure:
+            # 旧版本建的是同名普通索引：删掉后重建为唯一索引
+            try:
+                self.collection.drop_index("key_1")
+                self.collection.create_index("key", unique=True)
+            except OperationFailure as e:
+                # 集合里已有重复条目，只能沿用普通索引；写入是 upsert，不会再新增重复
+                logger.warning(f"分析缓存 key 唯一索引创建失败，沿用普通索引: {e}")
+                self.collection.create_index("key")
+
+    def get(self, key):
+        doc = self.collection.find_one({"key": key}, {"value": 1})
+        return doc["value"] if doc else None
+
+    def put(self, key, value):
+        # 同一 key 对应同一文本与模型版本，结果相同：已存在时不改写（固定集合中的文档不能改变大小）
+        self.collection.update_one(
+            {"key": key},
+            {"$setOnInsert": {"key": key, "value": value}},
+            upsert=True
+        )
+
+
+class AnalysisCache:
+    def __init__(self, model_version, max_entries=10000, persistent=None):
+        """
+        model_version: 模型版本标识，模型或后端变化后旧缓存自动失效
+        max_entries: 进程内 LRU 层的条目上限
+        persistent: 可选持久层（SQLiteCacheTier / MongoCacheTier）
+        """
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, text):
+        key = cache_key(text, self.model_version)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key]
+
+        if self.persistent is not None:
+            try:
+                value = self.persistent.get(key)
+            except Exception as e:
+                logger.warning(f"持久缓存读取失败: {e}")
+                value = None
+            if value is not None:
+                with self.lock:
+                    self.stats["persistent_hits"] += 1
+                self._put_memory(key, value)
+                return value
+
+        with self.lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, text, value):
+        key = cache_key(text, self.model_version)
+        self._put_memory(key, value)
+        if self.persistent is not None:
+            try:
+                self.persistent.put(key, value)
+            except Exception as e:
+                logger.warning(f"持久缓存写入失败: {e}")
+
+    def _put_memory(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def get_stats(self):
+        """命中/未命中计数与命中率"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats["size"] = len(self.entries)
+        lookups = stats["hits"] + stats["persistent_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["hits"] + stats["persistent_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,177 @@
+"""
+压力测试驱动
+启动本地 Twitter 接口替身，把 tweepy 请求转发过去，让 1 万～100 万条推文完整走一遍
+抓取 → 分析 → 存储 → 报警，统计吞吐、轮次耗时、限流次数与峰值内存
+
+数据写入单独的压测数据库（默认 twitter_monitor_load），警报 webhook 发往替身自带的接收端。
+
+用法:
+    python 压力测试.py --tweets 100000 --accounts 50 --no-bert --output load.json
+    python 压力测试.py --tweets 1000000 --workers 4 --latency 0.1 --error-rate 0.01
+"""
+
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+PRODUCTION_DATABASE = "twitter_monitor"
+
+
+def prepare_environment(args):
+    """须在加载配置之前调用：数据库名、令牌等在配置中心首次加载时读取"""
+    os.environ.setdefault("TWITTER_BEARER_TOKEN", "load-test-token")
+    os.environ["MONGODB_DATABASE"] = args.database
+    if args.no_bert:
+        os.environ["POLITWEET_NO_BERT"] = "1"
+
+
+def reset_database(database):
+    from pymongo import MongoClient
+
+    from 配置中心 import get_settings
+
+    if database == PRODUCTION_DATABASE:
+        raise SystemExit(f"❌ 拒绝清空正式数据库 {database}，请用 --database 指定压测库")
+    MongoClient(get_settings().mongodb.connection_string).drop_database(database)
+
+
+def run(args):
+    from 假推特接口 import FakeTwitterServer, RecordedCorpus, SyntheticCorpus, redirect_client
+    from 性能基准 import parse_lang_mix, peak_rss_mb
+
+    if args.corpus:
+        corpus = RecordedCorpus(args.corpus)
+    else:
+        accounts = [f"load_{i:04d}" for i in range(args.accounts)]
+        per_user = -(-args.tweets // args.accounts)
+        corpus = SyntheticCorpus(accounts, per_user, seed=args.seed, lang_mix=parse_lang_mix(args.lang_mix),
+                                 black_swan_ratio=args.black_swan_ratio)
+    server = FakeTwitterServer(
+        corpus, latency=args.latency, latency_jitter=args.latency / 3,
+        rate_limit=args.rate_limit, rate_window=args.rate_window, error_rate=args.error_rate
+    ).start()
+    print(f"▶️ 接口替身: {server.url}，{len(corpus.usernames)} 个账号，{corpus.total} 条推文")
+
+    if args.reset:
+        reset_database(args.database)
+
+    import 自动抓取_修改版 as fetcher
+    from 警报系统 import get_alert_system, shutdown_alert_system
+    from 配置中心 import get_config_center, get_settings
+
+    fetcher.init()
+    redirect_client(fetcher.client_twitter, server.url)
+    # 压测账号与翻页上限作为进程内覆盖项；配置中原有的领导人账号置为 None 即移除
+    accounts = {username: None for username in get_settings().accounts}
+    accounts.update({username: {"name": username, "priority": "medium"} for username in corpus.usernames})
+    get_config_center().apply_overrides({
+        "LEADER_ACCOUNTS": accounts,
+        "FETCH_CONFIG": {"MAX_PAGES_PER_FETCH": args.max_pages}
+    })
+    if args.no_dedup:
+        fetcher.dedup_index = None
+    # 检查点从最早的推文之前开始，第一轮就翻页抓取全部语料
+    for username in corpus.usernames:
+        fetcher.checkpoints.advance(username, 1)
+
+    alert_system = get_alert_system()
+    alert_system.config["email"]["enabled"] = False
+    alert_system.config["webhook"] = {"enabled": True, "url": f"{server.url}/hook", "headers": {}}
+
+    if args.workers > 0:
+        from 分析流水线 import AnalysisPipeline
+
+        settings = get_settings()
+        fetcher.analysis_pipeline = AnalysisPipeline(
+            fetcher.store_analyzed_tweet,
+            workers=args.workers,
+            queue_size=settings.fetch.analysis_queue_size,
+            batch_size=settings.sentiment["BATCH_SIZE"],
+            lightweight=args.no_bert
+        ).start()
+
+    cycles = []
+    started = time.perf_counter()
+    # 未加 --reset 时库里可能有之前压测留下的推文，吞吐与停止条件只看本次新增的条数
+    baseline = stored = fetcher.collection.count_documents({})
+    for cycle in range(1, args.max_cycles + 1):
+        cycle_started = time.perf_counter()
+        fetcher.fetch_all_leaders()
+        before, stored = stored, fetcher.collection.count_documents({})
+        seconds = time.perf_counter() - cycle_started
+        cycles.append({"cycle": cycle, "seconds": round(seconds, 2), "stored": stored - before})
+        print(f"🔁 第 {cycle} 轮: 新增 {stored - before} 条，用时 {seconds:.1f} 秒")
+        if stored - baseline >= corpus.total or stored == before:
+            break
+    elapsed = time.perf_counter() - started
+    stored -= baseline
+
+    if fetcher.analysis_pipeline is not None:
+        fetcher.analysis_pipeline.shutdown()
+    # 给分发线程一点时间发出积压的警报
+    time.sleep(args.alert_drain)
+    outbox = {doc["_id"]: doc["count"] for doc in alert_system.alerts_collection.aggregate(
+        [{"$group": {"_id": "$status", "count": {"$sum": 1}}}]
+    )}
+    shutdown_alert_system()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "database": args.database,
+            "corpus": args.corpus or "synthetic",
+            "accounts": len(corpus.usernames),
+            "workers": args.workers,
+            "bert": not args.no_bert,
+            "dedup": not args.no_dedup,
+            "latency": args.latency,
+            "error_rate": args.error_rate
+        },
+        "tweets_available": corpus.total,
+        "tweets_preexisting": baseline,
+        "tweets_stored": stored,
+        "seconds": round(elapsed, 2),
+        "tweets_per_sec": round(stored / elapsed, 1) if elapsed else 0.0,
+        "cycles": cycles,
+        "api": server.stats,
+        "write_buffer": dict(fetcher.write_buffer.stats),
+        "dedup": dict(fetcher.dedup_index.stats) if fetcher.dedup_index is not None else None,
+        "alerts": outbox,
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="抓取全流程压力测试")
+    parser.add_argument("--tweets", type=int, default=10000, help="合成语料总条数")
+    parser.add_argument("--accounts", type=int, default=20, help="合成账号数")
+    parser.add_argument("--corpus", help="录制的推文 JSONL（含 username），指定后不使用合成语料")
+    parser.add_argument("--lang-mix", default="en=0.8,zh=0.2")
+    parser.add_argument("--black-swan-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database", default="twitter_monitor_load", help="压测数据库名")
+    parser.add_argument("--reset", action="store_true", help="开始前清空压测数据库")
+    parser.add_argument("--workers", type=int, default=0, help="分析进程数")
+    parser.add_argument("--no-bert", action="store_true", help="轻量模式，不加载 BERT")
+    parser.add_argument("--no-dedup", action="store_true", help="关闭近重复复用，每条推文都走模型")
+    parser.add_argument("--latency", type=float, default=0.02, help="替身接口平均延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="随机 429 概率")
+    parser.add_argument("--rate-limit", type=int, default=100000, help="替身每接口每窗口额度")
+    parser.add_argument("--rate-window", type=int, default=60, help="替身限流窗口（秒）")
+    parser.add_argument("--max-pages", type=int, default=100000, help="单账号单轮最多翻页数")
+    parser.add_argument("--max-cycles", type=int, default=10, help="最多抓取轮数")
+    parser.add_argument("--alert-drain", type=float, default=5.0, help="结束前等待警报发送的秒数")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    args = parser.parse_args()
+
+    prepare_environment(args)
+    report = run(args)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if report["tweets_stored"] > 0 else 1)
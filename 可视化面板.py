@@ -6,136 +6,211 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import plotly.express as px
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
+from datetime import datetime
 import numpy as np
 import sys
 import os
 
-# 添加推特文件夹到路径
-sys.path.append(os.path.join(os.path.dirname(__file__), '推特'))
+# 添加面板所在目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 try:
-    from alert_system import alert_system
+    # 警报系统延迟连接数据库，导入本身不加载任何模型
+    from 警报系统 import get_alert_system
+    alert_system = get_alert_system()
 except ImportError:
-    st.error("无法导入alert_system模块，请确保推特文件夹中的文件存在")
+    st.error("无法导入警报系统模块，请确保 警报系统.py 与面板在同一目录")
     alert_system = None
 
+import time
+import urllib.request
+import 面板查询
+import 监控指标
+from 配置中心 import get_config_center, get_settings
+from 实时推送 import LiveFeed
+
 # ---------- 页面设置 ----------
 st.set_page_config(page_title="推特舆情监控", layout="wide", initial_sidebar_state="expanded")
 
+# 每次页面重跑时检查配置文件是否有变化
+get_config_center().check()
+
 # ---------- 连接 MongoDB ----------
+@st.cache_resource
+def get_db():
+    mongodb = get_settings().mongodb
+    client = MongoClient(mongodb.connection_string)
+    return client[mongodb.database_name]
+
+def get_collection():
+    return get_db()[get_settings().mongodb.collection_name]
+
+# 各查询只返回聚合后的结果，统计在数据库端完成
 @st.cache_data(ttl=60)  # 缓存1分钟
-def load_data():
-    try:
-        client = MongoClient("mongodb://localhost:27017/")
-        db = client["twitter_monitor"]
-        collection = db["tweets"]
-        raw_data = list(collection.find().sort("created_at", -1).limit(1000))
-        return pd.DataFrame(raw_data)
-    except Exception as e:
-        st.error(f"❌ 无法连接数据库: {e}")
-        return pd.DataFrame()
+def load_usernames():
+    return 面板查询.list_usernames(get_collection())
+
+@st.cache_data(ttl=60)
+def load_summary():
+    return 面板查询.collection_summary(get_collection())
+
+@st.cache_data(ttl=60)
+def load_overview(usernames=None, since=None, dedup=False):
+    return 面板查询.overview_metrics(get_collection(), 面板查询.build_match(usernames, since, dedup))
+
+@st.cache_data(ttl=60)
+def load_risk_matrix(usernames, since, dedup=False):
+    return pd.DataFrame(面板查询.risk_matrix(get_collection(), 面板查询.build_match(usernames, since, dedup)))
+
+@st.cache_data(ttl=60)
+def load_feed_page(usernames, since, before=None, page_size=10, dedup=False):
+    return 面板查询.feed_page(get_collection(), 面板查询.build_match(usernames, since, dedup), before, page_size)
+
+# 历史趋势读取入库时维护的天级汇总桶（运行 `python 时序汇总.py --backfill` 可从历史推文重建）
+@st.cache_data(ttl=60)
+def load_daily_sentiment():
+    return pd.DataFrame(面板查询.daily_sentiment_from_rollups(get_db()))
+
+@st.cache_data(ttl=60)
+def load_risk_histogram():
+    return pd.DataFrame(面板查询.risk_histogram_from_rollups(get_db()))
+
+@st.cache_data(ttl=60)
+def load_black_swan_counts():
+    return pd.DataFrame(面板查询.black_swan_counts_from_rollups(get_db()))
+
+# 全部会话共享一个变更流监听器，新数据不需要每个会话各自查询数据库
+@st.cache_resource
+def get_live_feed():
+    return LiveFeed(get_db()).start()
+
+LIVE_REFRESH_SECONDS = 3
+
+def read_live_events(limit=50):
+    """增量读取本会话尚未看到的推送事件，保留最近 limit 条"""
+    seq = st.session_state.get("live_seq", 0)
+    events, latest = get_live_feed().read_since(seq)
+    st.session_state["live_seq"] = latest
+    recent = st.session_state.setdefault("live_events", [])
+    recent[:0] = reversed(events)
+    del recent[limit:]
+    return recent
 
-df = load_data()
+# 运行指标由抓取进程的 /metrics 提供
+@st.cache_data(ttl=10)
+def load_metrics():
+    metrics = get_settings().metrics
+    url = f"http://{metrics['HOST']}:{metrics['PORT']}/metrics"
+    with urllib.request.urlopen(url, timeout=2) as response:
+        return 监控指标.parse_metrics(response.read().decode("utf-8"))
+
+try:
+    overall = load_summary()
+except Exception as e:
+    st.error(f"❌ 无法连接数据库: {e}")
+    overall = {"total": 0}
 
 # ---------- 侧边栏导航 ----------
 st.sidebar.title("📊 导航菜单")
 page = st.sidebar.selectbox("选择页面", ["🏠 实时监控", "📈 历史分析", "🚨 警报中心", "⚙️ 系统设置"])
+live_mode = st.sidebar.checkbox("⚡ 实时推送", value=False, help="监听数据库变更，新推文与警报数秒内出现")
 
-# ---------- 数据预处理 ----------
-if df.empty:
-    st.warning("⚠️ 当前数据库中没有任何推文数据，请先运行 auto_fetch.py。")
+# ---------- 数据检查 ----------
+if overall["total"] == 0:
+    st.warning("⚠️ 当前数据库中没有任何推文数据，请先运行 自动抓取_修改版.py。")
     st.stop()
 
-# 清洗字段
-df = df.dropna(subset=["username", "text"])
-df["created_at"] = pd.to_datetime(df["created_at"])
-df = df.sort_values("created_at", ascending=False)
-
-# 确保必要字段存在
-required_fields = ["sentiment_score", "risk_score", "alert_level", "urgency_level"]
-for field in required_fields:
-    if field not in df.columns:
-        df[field] = 0 if "score" in field else "未知"
-
 # ---------- 实时监控页面 ----------
 if page == "🏠 实时监控":
     st.title("🌍 国家领导人推特舆情监控面板")
     
-    # 实时状态指标
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        total_tweets = len(df)
-        st.metric("总推文数", total_tweets)
-    
-    with col2:
-        black_swan_count = len(df[df["black_swan"] == True])
-        st.metric("黑天鹅事件", black_swan_count, delta=f"{black_swan_count/total_tweets*100:.1f}%")
-    
-    with col3:
-        avg_sentiment = df["sentiment_score"].mean() if "sentiment_score" in df.columns else 0
-        st.metric("平均情感分数", f"{avg_sentiment:.2f}")
-    
-    with col4:
-        high_risk_count = len(df[df["risk_score"] > 50])
-        st.metric("高风险推文", high_risk_count)
-    
     # 用户选择
     st.sidebar.subheader("🎯 筛选选项")
-    usernames_list = df["username"].dropna().astype(str).unique()
+    usernames_list = load_usernames()
     usernames = st.sidebar.multiselect(
         "选择领导人",
-        options=sorted(usernames_list),
-        default=list(usernames_list)
+        options=usernames_list,
+        default=usernames_list
     )
     
     # 时间范围选择
     time_range = st.sidebar.selectbox(
         "时间范围",
-        ["最近24小时", "最近3天", "最近7天", "最近30天", "全部"]
+        list(面板查询.TIME_RANGES)
     )
+    since = 面板查询.time_range_start(time_range)
+    selected = tuple(usernames)
+    dedup = st.sidebar.checkbox("🧬 合并近重复推文", value=False, help="每个近重复簇只显示代表推文")
     
-    # 根据时间范围筛选
-    now = datetime.now()
-    if time_range == "最近24小时":
-        time_filter = now - timedelta(hours=24)
-    elif time_range == "最近3天":
-        time_filter = now - timedelta(days=3)
-    elif time_range == "最近7天":
-        time_filter = now - timedelta(days=7)
-    elif time_range == "最近30天":
-        time_filter = now - timedelta(days=30)
-    else:
-        time_filter = None
+    # 实时状态指标（与筛选条件一致）
+    metrics = load_overview(selected, since, dedup)
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        total_tweets = metrics["total"]
+        st.metric("总推文数", total_tweets)
+        if not dedup and metrics["duplicates"]:
+            st.caption(f"其中近重复 {metrics['duplicates']} 条")
+    
+    with col2:
+        black_swan_count = metrics["black_swan"]
+        ratio = black_swan_count / total_tweets * 100 if total_tweets else 0
+        st.metric("黑天鹅事件", black_swan_count, delta=f"{ratio:.1f}%")
+    
+    with col3:
+        st.metric("平均情感分数", f"{metrics['avg_sentiment']:.2f}")
     
-    # 筛选数据
-    filtered_df = df[df["username"].isin(usernames)]
-    if time_filter:
-        filtered_df = filtered_df[filtered_df["created_at"] >= time_filter]
+    with col4:
+        st.metric("高风险推文", metrics["high_risk"])
     
     # ---------- 风险热力图 ----------
     st.subheader("🔥 风险热力图")
     
-    if not filtered_df.empty:
+    risk_counts = load_risk_matrix(selected, since, dedup)
+    if not risk_counts.empty:
         # 创建风险矩阵
-        risk_matrix = filtered_df.groupby(["username", "alert_level"]).size().unstack(fill_value=0)
+        risk_matrix = risk_counts.pivot_table(
+            index="username", columns="alert_level", values="count", fill_value=0
+        )
         
-        if not risk_matrix.empty:
-            fig_heatmap = px.imshow(
-                risk_matrix.values,
-                x=risk_matrix.columns,
-                y=risk_matrix.index,
-                color_continuous_scale="Reds",
-                title="各领导人风险等级分布"
-            )
-            st.plotly_chart(fig_heatmap, use_container_width=True)
+        fig_heatmap = px.imshow(
+            risk_matrix.values,
+            x=risk_matrix.columns,
+            y=risk_matrix.index,
+            color_continuous_scale="Reds",
+            title="各领导人风险等级分布"
+        )
+        st.plotly_chart(fig_heatmap, use_container_width=True)
+    
+    # ---------- 实时推送 ----------
+    if live_mode:
+        st.subheader("🆕 最新动态")
+        live_events = read_live_events()
+        if not live_events:
+            st.caption("等待新的推文或警报...")
+        for _, kind, doc in live_events[:10]:
+            if kind == "alerts":
+                st.error(f"{doc.get('title')} · 风险 {doc.get('risk_score')} · {str(doc.get('created_at'))[:19]}")
+            elif doc.get("username") in selected:
+                st.write(f"**{doc.get('username')}** [{doc.get('alert_level')}] {str(doc.get('text', ''))[:120]}")
+        st.caption(f"推送方式: {', '.join(f'{k}={v}' for k, v in get_live_feed().mode.items())}")
+        st.divider()
     
     # ---------- 实时推文流 ----------
     st.subheader("📱 实时推文流")
     
-    # 显示最新推文，带风险标识
-    for idx, row in filtered_df.head(10).iterrows():
+    # 游标栈：第 n 页的起始游标；筛选条件变化时回到第一页
+    filter_key = (selected, time_range, dedup)
+    if st.session_state.get("feed_filter_key") != filter_key:
+        st.session_state["feed_filter_key"] = filter_key
+        st.session_state["feed_cursors"] = [None]
+    cursors = st.session_state["feed_cursors"]
+    
+    feed_rows, next_cursor = load_feed_page(selected, since, cursors[-1], dedup=dedup)
+    
+    # 显示推文，带风险标识
+    for row in feed_rows:
+        created_at = pd.to_datetime(row["created_at"])
         with st.container():
             col1, col2 = st.columns([1, 4])
             
@@ -151,7 +226,9 @@ if page == "🏠 实时监控":
                     st.success("🟢 正常")
             
             with col2:
-                st.write(f"**{row['username']}** - {row['created_at'].strftime('%Y-%m-%d %H:%M')}")
+                st.write(f"**{row['username']}** - {created_at.strftime('%Y-%m-%d %H:%M')}")
+                if row.get("is_cluster_representative") is False:
+                    st.caption(f"🧬 近重复，簇 {row.get('cluster_id')}")
                 st.write(row['text'][:200] + "..." if len(row['text']) > 200 else row['text'])
                 
                 # 显示分析结果
@@ -164,6 +241,19 @@ if page == "🏠 实时监控":
                     st.caption(f"紧急度: {row.get('urgency_level', '未知')}")
             
             st.divider()
+    
+    # 翻页
+    nav_prev, nav_page, nav_next = st.columns([1, 2, 1])
+    with nav_prev:
+        if len(cursors) > 1 and st.button("⬅️ 较新"):
+            cursors.pop()
+            st.rerun()
+    with nav_page:
+        st.caption(f"第 {len(cursors)} 页")
+    with nav_next:
+        if next_cursor and st.button("较早 ➡️"):
+            cursors.append(next_cursor)
+            st.rerun()
 
 # ---------- 历史分析页面 ----------
 elif page == "📈 历史分析":
@@ -172,37 +262,38 @@ elif page == "📈 历史分析":
     # 时间序列分析
     st.subheader("📊 情感趋势")
     
-    # 按日期聚合数据
-    df_daily = df.copy()
-    df_daily['date'] = df_daily['created_at'].dt.date
-    daily_sentiment = df_daily.groupby(['date', 'username'])['sentiment_score'].mean().reset_index()
-    
-    fig_trend = px.line(
-        daily_sentiment, 
-        x='date', 
-        y='sentiment_score', 
-        color='username',
-        title="各领导人情感分数趋势"
-    )
-    st.plotly_chart(fig_trend, use_container_width=True)
+    # 按日期聚合数据（数据库端完成）
+    daily_sentiment = load_daily_sentiment()
+    
+    if not daily_sentiment.empty:
+        fig_trend = px.line(
+            daily_sentiment, 
+            x='date', 
+            y='sentiment_score', 
+            color='username',
+            title="各领导人情感分数趋势"
+        )
+        st.plotly_chart(fig_trend, use_container_width=True)
     
     # 风险分数分布
     st.subheader("⚠️ 风险分数分布")
     
-    fig_risk_dist = px.histogram(
-        df, 
-        x='risk_score', 
-        color='username',
-        title="风险分数分布",
-        nbins=20
-    )
-    st.plotly_chart(fig_risk_dist, use_container_width=True)
+    risk_hist = load_risk_histogram()
+    if not risk_hist.empty:
+        fig_risk_dist = px.bar(
+            risk_hist, 
+            x='bin', 
+            y='count',
+            color='username',
+            title="风险分数分布",
+            labels={"bin": "risk_score"}
+        )
+        st.plotly_chart(fig_risk_dist, use_container_width=True)
     
     # 黑天鹅事件统计
     st.subheader("🦢 黑天鹅事件统计")
     
-    black_swan_stats = df[df['black_swan'] == True].groupby('username').size().reset_index()
-    black_swan_stats.columns = ['username', 'count']
+    black_swan_stats = load_black_swan_counts()
     
     if not black_swan_stats.empty:
         fig_swan = px.bar(
@@ -290,10 +381,53 @@ elif page == "⚙️ 系统设置":
         
         if st.form_submit_button("保存阈值设置"):
             st.success("阈值设置已保存")
+    
+    st.subheader("📈 运行指标")
+    
+    try:
+        samples = load_metrics()
+    except Exception as e:
+        st.info(f"抓取进程的监控指标不可用（{e}），请确认 自动抓取_修改版.py 正在运行")
+        samples = []
+    
+    if samples:
+        # API 剩余额度
+        remaining = [(labels["route"], value) for name, labels, value in samples
+                     if name == "politweet_rate_limit_remaining"]
+        if remaining:
+            st.write("**Twitter API 剩余额度**")
+            cols = st.columns(min(len(remaining), 4))
+            for i, (route, value) in enumerate(remaining):
+                cols[i % len(cols)].metric(route, int(value))
+        
+        # 各环节耗时
+        stage_rows = 监控指标.summarize_histograms(samples, "politweet_stage_seconds")
+        stage_rows += [
+            {**row, "stage": f"twitter {row.pop('route')}"}
+            for row in 监控指标.summarize_histograms(samples, "politweet_twitter_request_seconds")
+        ]
+        if stage_rows:
+            st.write("**各环节耗时（秒）**")
+            stage_df = pd.DataFrame(stage_rows).sort_values("sum", ascending=False)
+            st.dataframe(stage_df[["stage", "count", "sum", "avg", "p50", "p99"]], use_container_width=True)
+        
+        # 计数器
+        counter_rows = [
+            {"指标": name, "标签": ", ".join(f"{k}={v}" for k, v in labels.items()), "数值": int(value)}
+            for name, labels, value in samples if name.endswith("_total")
+        ]
+        if counter_rows:
+            st.write("**计数**")
+            st.dataframe(pd.DataFrame(counter_rows), use_container_width=True)
 
 # ---------- 页面底部信息 ----------
 st.sidebar.markdown("---")
 st.sidebar.info(f"📊 数据更新时间: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-st.sidebar.info(f"📈 总推文数: {len(df)}")
-if not df.empty:
-    st.sidebar.info(f"⏰ 最新推文: {df['created_at'].max().strftime('%Y-%m-%d %H:%M')}")
\ No newline at end of file
+st.sidebar.info(f"📈 总推文数: {overall['total']}")
+if overall.get("latest"):
+    st.sidebar.info(f"⏰ 最新推文: {pd.to_datetime(overall['latest']).strftime('%Y-%m-%d %H:%M')}")
+
+# ---------- 实时推送自动刷新 ----------
+if live_mode and page == "🏠 实时监控":
+    time.sleep(LIVE_REFRESH_SECONDS)
+    st.rerun()
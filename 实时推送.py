@@ -0,0 +1,116 @@
+"""
+实时推送模块
+监听 tweets / alerts 集合的变更流（无副本集时退化为按 _id 轮询追尾），
+写入进程内共享的环形缓冲区，各面板会话按序号增量读取
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# 推送给面板的字段
+PUSH_FIELDS = {
+    "tweets": ["username", "created_at", "text", "sentiment", "risk_score", "urgency_level", "alert_level"],
+    "alerts": ["title", "username", "alert_level", "risk_score", "urgency_level", "created_at", "status"]
+}
+
+# 面板只展示新文档：警报记录在发送过程中会多次更新状态，监听 update 会把同一条警报重复推送；
+# 与轮询模式（只能看到新插入的文档）保持一致
+WATCH_PIPELINE = [{"$match": {"operationType": "insert"}}]
+
+# 变更流不可用（单机 mongod，非副本集）时的错误码
+CHANGE_STREAM_UNSUPPORTED = {40573, 40324}
+# resume token 失效（oplog 已覆盖断线期间的记录、token 无效）时的错误码，需丢弃 token 重新开始监听
+RESUME_TOKEN_LOST = {136, 260, 280, 286}
+
+
+class LiveFeed:
+    def __init__(self, db, capacity=500, poll_interval=2.0, collections=("tweets", "alerts")):
+        self.db = db
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.collections = collections
+        self.events = deque(maxlen=capacity)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.mode = {}
+        self.threads = []
+
+    def start(self):
+        for name in self.collections:
+            thread = threading.Thread(target=self._run, args=(name,), name=f"live-feed-{name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def read_since(self, seq):
+        """返回序号大于 seq 的事件列表与当前最新序号；事件为 (序号, 集合名, 文档)"""
+        with self.lock:
+            return [event for event in self.events if event[0] > seq], self.seq
+
+    def _push(self, name, doc):
+        if not doc:
+            return
+        fields = PUSH_FIELDS.get(name)
+        doc = {key: doc.get(key) for key in fields} if fields else doc
+        with self.lock:
+            self.seq += 1
+            self.events.append((self.seq, name, doc))
+
+    def _run(self, name):
+        try:
+            self._watch(name)
+        except OperationFailure:
+            # _watch 只在变更流不可用时抛出
+            logger.info(f"{name} 不支持变更流（需要副本集），改为按 _id 轮询")
+            self._tail(name)
+
+    def _watch(self, name):
+        """
+        变更流模式：只推送新插入的文档，断线后用 resume token 续接；
+        token 失效时丢弃并从当前时刻重新监听，其他错误记录后重试，监听线程不会退出
+        """
+        self.mode[name] = "change_stream"
+        resume_token = None
+        while True:
+            try:
+                with self.db[name].watch(WATCH_PIPELINE, resume_after=resume_token) as stream:
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        self._push(name, change.get("fullDocument"))
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED:
+                    raise
+                if e.code in RESUME_TOKEN_LOST:
+                    logger.warning(f"{name} 变更流无法续接（{e}），丢弃 resume token 重新监听，断线期间的推送会缺失")
+                    resume_token = None
+                else:
+                    logger.error(f"{name} 变更流出错，稍后重试: {e}")
+                time.sleep(self.poll_interval)
+            except PyMongoError as e:
+                logger.warning(f"{name} 变更流中断，稍后续接: {e}")
+                time.sleep(self.poll_interval)
+            except Exception as e:
+                logger.exception(f"{name} 变更流处理失败，稍后重试: {e}")
+                time.sleep(self.poll_interval)
+
+    def _tail(self, name):
+        """轮询模式：只追新插入的文档（ObjectId 随时间递增）"""
+        self.mode[name] = "tail"
+        collection = self.db[name]
+        newest = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        last_id = newest["_id"] if newest else None
+        while True:
+            try:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                for doc in collection.find(query).sort("_id", 1).limit(self.capacity):
+                    last_id = doc["_id"]
+                    self._push(name, doc)
+            except PyMongoError as e:
+                logger.warning(f"{name} 轮询失败: {e}")
+            time.sleep(self.poll_interval)
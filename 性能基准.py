@@ -0,0 +1,326 @@
+"""
+性能基准模块
+在合成语料或录制语料上测量分析各环节的吞吐（条/秒）、单次调用 p50/p99 延迟与峰值内存，
+扫描多个批次大小，结果写为 JSON；可与基线结果对比并标记性能回退
+
+用法:
+    python 性能基准.py --size 2000 --lang-mix en=0.7,zh=0.3 --output bench.json
+    python 性能基准.py --corpus tweets.jsonl --compare baseline.json --threshold 0.1
+"""
+
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# 可测量的环节
+TARGETS = ("analyze_tweet", "analyze_tweets", "keywords", "textblob", "vader", "bert")
+# 支持批量调用、参与批次扫描的环节
+BATCHED_TARGETS = ("analyze_tweets", "bert")
+
+_EN_TEMPLATES = [
+    "Today I met with {who} to discuss {topic}. {tail}",
+    "Our nation stands firm on {topic}. {tail}",
+    "Thank you {who} for the productive talks on {topic}!",
+    "We will not tolerate threats regarding {topic}. {tail}",
+    "Great progress on {topic} this week. {tail}",
+]
+_EN_FILL = {
+    "who": ["the Prime Minister", "our allies", "business leaders", "the delegation", "farmers"],
+    "topic": ["trade", "energy security", "the economy", "border security", "climate policy", "healthcare"],
+    "tail": ["More to come.", "The future is bright.", "This is serious.", "We must act now.", ""],
+}
+_ZH_TEMPLATES = [
+    "今天与{who}举行会谈，就{topic}交换了意见。{tail}",
+    "我们在{topic}问题上的立场坚定不移。{tail}",
+    "感谢{who}，{topic}合作取得新进展。",
+    "关于{topic}，我们将采取一切必要措施。{tail}",
+]
+_ZH_FILL = {
+    "who": ["各国领导人", "企业代表", "代表团", "地方官员"],
+    "topic": ["经济发展", "能源安全", "地区安全", "贸易合作", "公共卫生"],
+    "tail": ["形势严峻。", "未来可期。", "请大家保持关注。", ""],
+}
+
+
+def parse_lang_mix(spec):
+    """"en=0.7,zh=0.3" → {"en": 0.7, "zh": 0.3}"""
+    mix = {}
+    for part in spec.split(","):
+        lang, _, weight = part.partition("=")
+        mix[lang.strip()] = float(weight or 1)
+    return mix
+
+
+def synthetic_corpus(size, lang_mix=None, black_swan_ratio=0.1, seed=42):
+    """
+    生成可复现的合成推文：按语言比例套用模板，部分推文注入黑天鹅关键词
+    每条带序号，避免分析缓存把不同推文当作同一条
+    """
+    from 配置中心 import get_settings
+
+    rng = random.Random(seed)
+    lang_mix = lang_mix or {"en": 0.8, "zh": 0.2}
+    langs, weights = zip(*lang_mix.items())
+    keywords = {"en": [], "zh": []}
+    for category in get_settings().black_swan_keywords.values():
+        for keyword in category["keywords"]:
+            keywords["zh" if any("一" <= ch <= "鿿" for ch in keyword) else "en"].append(keyword)
+
+    texts = []
+    for i in range(size):
+        lang = rng.choices(langs, weights)[0]
+        templates, fill = (_ZH_TEMPLATES, _ZH_FILL) if lang == "zh" else (_EN_TEMPLATES, _EN_FILL)
+        text = rng.choice(templates).format(**{key: rng.choice(values) for key, values in fill.items()})
+        if rng.random() < black_swan_ratio and keywords[lang]:
+            injected = rng.choice(keywords[lang])
+            text += f" {injected}" if lang == "en" else injected
+        texts.append(f"{text} #{i}")
+    return texts
+
+
+def load_corpus(path, size=None):
+    """读取录制的 JSONL 推文（简化格式或 v2 信封），不足 size 条时循环补齐"""
+    texts = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                payload = json.loads(line)
+                texts.append(payload.get("data", payload)["text"])
+    if size and texts:
+        # 循环补齐的副本加序号，避免命中分析缓存
+        recorded = len(texts)
+        texts = [texts[i] if i < recorded else f"{texts[i % recorded]} #{i}" for i in range(size)]
+    return texts
+
+
+def peak_rss_mb():
+    """本进程峰值常驻内存（Linux 单位 KB，macOS 为字节）"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _target_fn(target):
+    """返回接收一批文本的调用函数；环节不可用时返回 None"""
+    import 语义分析
+
+    analyzer = 语义分析.get_analyzer()
+    if target == "analyze_tweet":
+        return lambda batch: [语义分析.analyze_tweet(text) for text in batch]
+    if target == "analyze_tweets":
+        return lambda batch: 语义分析.analyze_tweets(batch, batch_size=len(batch))
+    if target == "keywords":
+        return lambda batch: [analyzer.detect_black_swan_events(text) for text in batch]
+    if target == "textblob":
+        return lambda batch: [analyzer._textblob(text).sentiment.polarity for text in batch]
+    if target == "vader":
+        return lambda batch: [analyzer.vader.polarity_scores(text) for text in batch]
+    if target == "bert":
+        if not analyzer.ensure_bert():
+            return None
+        return lambda batch: analyzer.bert_backend.predict(batch)
+    raise ValueError(f"未知的基准环节: {target}")
+
+
+def run_target(target, texts, batch_size=1, warmup=20):
+    """
+    测量一个环节：非批量环节逐条调用，批量环节按 batch_size 分批调用
+    延迟为单次调用耗时；返回结果 dict，环节不可用（如轻量模式下的 BERT）时返回 None
+    """
+    fn = _target_fn(target)
+    if fn is None:
+        return None
+    if target not in BATCHED_TARGETS:
+        batch_size = 1
+
+    for start in range(0, min(warmup, len(texts)), batch_size):
+        fn(texts[start:start + batch_size])
+
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start:start + batch_size]
+        call_started = time.perf_counter()
+        fn(batch)
+        latencies.append(time.perf_counter() - call_started)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "target": target,
+        "batch_size": batch_size,
+        "tweets": len(texts),
+        "seconds": round(elapsed, 4),
+        "tweets_per_sec": round(len(texts) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1)
+    }
+
+
+def _isolated_worker(target, texts, batch_size, warmup, lightweight, use_cache):
+    _configure(lightweight, use_cache)
+    return run_target(target, texts, batch_size, warmup)
+
+
+def _configure(lightweight, use_cache):
+    """须在首次构建分析器之前调用"""
+    from 配置中心 import get_config_center
+    import 语义分析
+
+    get_config_center().apply_overrides({"SENTIMENT_CONFIG": {"CACHE": {"ENABLED": use_cache}}})
+    if lightweight:
+        语义分析.set_lightweight_mode(True)
+
+
+def run_suite(texts, targets=TARGETS, batch_sizes=(1, 8, 16, 32), warmup=20,
+              lightweight=False, use_cache=False, isolate=False):
+    """
+    依次测量各环节；批量环节扫描 batch_sizes
+    isolate=True 时每项在独立进程中运行，峰值内存互不影响（含模型加载）
+    """
+    runs = []
+    for target in targets:
+        sizes = batch_sizes if target in BATCHED_TARGETS else (1,)
+        for batch_size in sizes:
+            runs.append((target, batch_size))
+
+    results = []
+    if isolate:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        ctx = multiprocessing.get_context("spawn")
+        for target, batch_size in runs:
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                result = executor.submit(
+                    _isolated_worker, target, texts, batch_size, warmup, lightweight, use_cache
+                ).result()
+            _report(target, batch_size, result)
+            if result:
+                results.append(result)
+    else:
+        _configure(lightweight, use_cache)
+        for target, batch_size in runs:
+            result = run_target(target, texts, batch_size, warmup)
+            _report(target, batch_size, result)
+            if result:
+                results.append(result)
+    return results
+
+
+def _report(target, batch_size, result):
+    if result is None:
+        print(f"  {target:<16} batch={batch_size:<4} 跳过（不可用）")
+        return
+    print(
+        f"  {target:<16} batch={batch_size:<4} {result['tweets_per_sec']:>10.1f} 条/秒  "
+        f"p50 {result['p50_ms']:>9.3f}ms  p99 {result['p99_ms']:>9.3f}ms  峰值内存 {result['peak_rss_mb']:.0f}MB"
+    )
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(baseline, current, threshold=0.10):
+    """
+    按 (环节, 批次大小) 对比两次结果：吞吐下降或 p99 上升超过 threshold 记为回退
+    返回 [(环节, 批次, 吞吐变化, p99 变化, 是否回退)]
+    """
+    base_index = {(r["target"], r["batch_size"]): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        base = base_index.get((result["target"], result["batch_size"]))
+        if base is None:
+            continue
+        throughput_change = (result["tweets_per_sec"] - base["tweets_per_sec"]) / base["tweets_per_sec"] \
+            if base["tweets_per_sec"] else 0.0
+        p99_change = (result["p99_ms"] - base["p99_ms"]) / base["p99_ms"] if base["p99_ms"] else 0.0
+        regressed = throughput_change < -threshold or p99_change > threshold
+        rows.append((result["target"], result["batch_size"], throughput_change, p99_change, regressed))
+    return rows
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="语义分析性能基准")
+    parser.add_argument("--size", type=int, default=1000, help="语料条数")
+    parser.add_argument("--lang-mix", default="en=0.8,zh=0.2", help="合成语料语言比例，如 en=0.7,zh=0.3")
+    parser.add_argument("--black-swan-ratio", type=float, default=0.1, help="合成语料中注入风险关键词的比例")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--corpus", help="录制的推文 JSONL，指定后不使用合成语料")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"测量的环节，可选 {','.join(TARGETS)}")
+    parser.add_argument("--batch-sizes", default="1,8,16,32", help="批量环节扫描的批次大小")
+    parser.add_argument("--warmup", type=int, default=20, help="预热条数（不计入结果）")
+    parser.add_argument("--no-bert", action="store_true", help="轻量模式，不加载 BERT")
+    parser.add_argument("--with-cache", action="store_true", help="保留分析缓存（默认关闭，测量真实计算开销）")
+    parser.add_argument("--isolate", action="store_true", help="每项在独立进程中运行，峰值内存互不影响")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--compare", help="基线结果 JSON，对比并标记回退")
+    parser.add_argument("--threshold", type=float, default=0.10, help="回退判定阈值（相对变化）")
+    args = parser.parse_args()
+
+    lang_mix = parse_lang_mix(args.lang_mix)
+    if args.corpus:
+        texts = load_corpus(args.corpus, args.size)
+        source = args.corpus
+    else:
+        texts = synthetic_corpus(args.size, lang_mix, args.black_swan_ratio, args.seed)
+        source = "synthetic"
+    targets = [t.strip() for t in args.targets.split(",") if t.strip()]
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",")]
+
+    print(f"⏱ 性能基准: {len(texts)} 条推文（{source}），环节 {', '.join(targets)}")
+    results = run_suite(texts, targets, batch_sizes, args.warmup, args.no_bert, args.with_cache, args.isolate)
+
+    from 配置中心 import get_settings
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "corpus": {"source": source, "size": len(texts), "lang_mix": None if args.corpus else lang_mix,
+                       "black_swan_ratio": None if args.corpus else args.black_swan_ratio, "seed": args.seed},
+            "backend": "none" if args.no_bert else get_settings().sentiment["MODELS"].get("BERT_BACKEND", "pytorch"),
+            "cache": args.with_cache,
+            "isolated": args.isolate
+        },
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.threshold)
+        print(f"\n📊 与基线对比（阈值 {args.threshold:.0%}）")
+        for target, batch_size, throughput_change, p99_change, regressed in rows:
+            flag = "❌ 回退" if regressed else "✅"
+            print(f"  {flag} {target:<16} batch={batch_size:<4} 吞吐 {throughput_change:+.1%}  p99 {p99_change:+.1%}")
+        if any(row[-1] for row in rows):
+            sys.exit(1)
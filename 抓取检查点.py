@@ -0,0 +1,28 @@
+"""
+抓取检查点模块
+按账号记录已见过的最新推文ID，持久化到 MongoDB，用于 since_id 增量抓取
+"""
+
+from datetime import datetime
+
+
+class CheckpointStore:
+    def __init__(self, db, collection_name="fetch_checkpoints"):
+        """每个账号一条文档：{_id: username, since_id, updated_at}"""
+        self.collection = db[collection_name]
+
+    def get(self, username):
+        """返回账号的最新已见推文ID，没有检查点时返回 None"""
+        doc = self.collection.find_one({"_id": username}, {"since_id": 1})
+        return doc["since_id"] if doc else None
+
+    def advance(self, username, tweet_id):
+        """用 $max 单调推进检查点，重复或乱序写入都不会回退"""
+        self.collection.update_one(
+            {"_id": username},
+            {
+                "$max": {"since_id": int(tweet_id)},
+                "$set": {"updated_at": datetime.utcnow().isoformat()}
+            },
+            upsert=True
+        )
@@ -0,0 +1,118 @@
+"""
+推文聚类模块
+入库时为近期推文建立 SimHash 近重复索引：领导人账号与其工作人员账号转发的近似文本归入同一簇（cluster_id），
+簇内后续推文复用代表推文的情感分析结果，不再调用模型；
+关键词检测与风险评分代价很小，且一个词的差别就可能决定是否报警，始终按每条推文自己的文本计算
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from 文本指纹 import SimHashIndex, features, from_hex, simhash, to_hex
+
+# 簇内可复用的字段：只包括需要调用模型的情感分析结果（与 analyze_tweets 返回结构一致）
+REUSED_FIELDS = ("sentiment_label", "sentiment_score", "confidence")
+
+
+def analysis_from_tweet(doc):
+    """从已存储的推文还原可复用的情感分析结果"""
+    return {
+        "sentiment_label": doc.get("sentiment"),
+        "sentiment_score": doc.get("sentiment_score"),
+        "confidence": doc.get("confidence")
+    }
+
+
+class NearDuplicateIndex:
+    def __init__(self, max_distance=3, window_hours=48, max_clusters=50000, min_features=4):
+        """
+        max_distance: 汉明距离不超过该值归入同一簇
+        簇按最近一次命中的时间淘汰：超过 window_hours 未命中或总数超过 max_clusters
+        min_features: 特征数少于该值的推文（只有链接、表情等）指纹不可靠，不参与聚类
+        """
+        self.index = SimHashIndex(max_distance=max_distance)
+        self.window_seconds = window_hours * 3600
+        self.max_clusters = max_clusters
+        self.min_features = min_features
+        self.clusters = OrderedDict()  # cluster_id → {"analysis", "seen_at"}，按最近命中排序
+        self.lock = threading.Lock()
+        self.stats = {"clusters": 0, "duplicates": 0, "reused": 0, "skipped": 0}
+
+    def rebuild(self, collection, window_hours=None):
+        """从 tweets 集合中近期的代表推文重建索引"""
+        hours = window_hours or self.window_seconds / 3600
+        since = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
+        fields = {"_id": 0, "id": 1, "simhash": 1, "sentiment": 1, "sentiment_score": 1, "confidence": 1}
+        cursor = collection.find(
+            {"is_cluster_representative": True, "simhash": {"$exists": True, "$ne": to_hex(0)},
+             "created_at": {"$gte": since}},
+            fields
+        ).sort("created_at", 1)
+        with self.lock:
+            for doc in cursor:
+                self._add(doc["id"], from_hex(doc["simhash"]), analysis_from_tweet(doc))
+        return self
+
+    def assign(self, raw):
+        """
+        为一条原始推文分配簇，写入 raw 的 cluster_id / is_cluster_representative / simhash 字段
+        返回簇内已有的情感分析结果（REUSED_FIELDS），没有时返回 None；
+        特征过少的推文不分配簇，直接返回 None
+        """
+        if len(features(raw["text"])) < self.min_features:
+            with self.lock:
+                self.stats["skipped"] += 1
+            return None
+        fingerprint = simhash(raw["text"])
+        if fingerprint == 0:
+            with self.lock:
+                self.stats["skipped"] += 1
+            return None
+        raw["simhash"] = to_hex(fingerprint)
+        with self.lock:
+            self._evict()
+            matches = self.index.query(fingerprint)
+            if not matches:
+                self._add(raw["id"], fingerprint, None)
+                raw["cluster_id"] = raw["id"]
+                raw["is_cluster_representative"] = True
+                self.stats["clusters"] += 1
+                return None
+
+            cluster_id, distance = matches[0]
+            cluster = self.clusters[cluster_id]
+            cluster["seen_at"] = time.monotonic()
+            self.clusters.move_to_end(cluster_id)
+            raw["cluster_id"] = cluster_id
+            raw["is_cluster_representative"] = False
+            raw["cluster_distance"] = distance
+            self.stats["duplicates"] += 1
+            if cluster["analysis"] is not None:
+                self.stats["reused"] += 1
+                return dict(cluster["analysis"])
+            return None
+
+    def record_analysis(self, raw, analysis_result):
+        """代表推文分析完成后记录情感分析结果，供簇内后续推文复用"""
+        if not raw.get("is_cluster_representative"):
+            return
+        with self.lock:
+            cluster = self.clusters.get(raw["cluster_id"])
+            if cluster is not None and cluster["analysis"] is None:
+                cluster["analysis"] = {field: analysis_result.get(field) for field in REUSED_FIELDS}
+
+    def _add(self, cluster_id, fingerprint, analysis):
+        self.index.add(cluster_id, fingerprint)
+        self.clusters[cluster_id] = {"analysis": analysis, "seen_at": time.monotonic()}
+        self.clusters.move_to_end(cluster_id)
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.window_seconds
+        while self.clusters:
+            cluster_id, cluster = next(iter(self.clusters.items()))
+            if len(self.clusters) <= self.max_clusters and cluster["seen_at"] >= cutoff:
+                break
+            self.clusters.popitem(last=False)
+            self.index.remove(cluster_id)
@@ -0,0 +1,184 @@
+"""
+推理后端模块
+RoBERTa 情感模型的可插拔推理后端：PyTorch fp32、动态 int8 量化 PyTorch、ONNX Runtime（CPU）
+后端由 SENTIMENT_CONFIG["MODELS"]["BERT_BACKEND"] 选择
+"""
+
+import os
+import time
+
+import numpy as np
+
+BACKENDS = ("pytorch", "pytorch-int8", "onnx")
+
+
+class PyTorchBackend:
+    def __init__(self, model_name, quantize=False):
+        """quantize=True 时对全部 Linear 层做动态 int8 量化"""
+        import torch
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+        self.torch = torch
+        self.name = "pytorch-int8" if quantize else "pytorch"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModelForSequenceClassification.from_pretrained(model_name)
+        model.eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model = model
+        self.id2label = model.config.id2label
+
+    def predict(self, texts):
+        """对一个批次推理，返回每条文本各标签的概率"""
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="pt")
+        with self.torch.no_grad():
+            logits = self.model(**encoded).logits
+        return _to_label_scores(self.torch.softmax(logits, dim=-1).tolist(), self.id2label)
+
+
+class OnnxBackend:
+    def __init__(self, model_name, onnx_dir):
+        """使用 onnxruntime 在 CPU 上推理；导出的模型不存在时先从 PyTorch 导出一次"""
+        import onnxruntime
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.name = "onnx"
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.id2label = AutoConfig.from_pretrained(model_name).id2label
+        model_path = os.path.join(onnx_dir, model_name.replace("/", "__") + ".onnx")
+        if not os.path.exists(model_path):
+            export_onnx(model_name, model_path)
+        self.session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def predict(self, texts):
+        encoded = self.tokenizer(texts, padding=True, truncation=True, max_length=512, return_tensors="np")
+        feeds = {name: encoded[name].astype(np.int64) for name in self.input_names}
+        logits = self.session.run(None, feeds)[0]
+        return _to_label_scores(_softmax(logits).tolist(), self.id2label)
+
+
+def export_onnx(model_name, model_path):
+    """把 HuggingFace 模型导出为 ONNX，批次与序列长度均为动态维度"""
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    print(f"📦 正在导出 ONNX 模型: {model_path}")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    os.makedirs(os.path.dirname(model_path) or ".", exist_ok=True)
+    torch.onnx.export(
+        model,
+        (sample["input_ids"], sample["attention_mask"]),
+        model_path,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["logits"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "sequence"},
+            "attention_mask": {0: "batch", 1: "sequence"},
+            "logits": {0: "batch"}
+        },
+        opset_version=14
+    )
+
+
+def _softmax(logits):
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _to_label_scores(probs, id2label):
+    """转换为与 pipeline(return_all_scores=True) 相同的结构"""
+    return [[{"label": id2label[i], "score": score} for i, score in enumerate(row)] for row in probs]
+
+
+def load_backend(kind, model_name, onnx_dir="models/onnx"):
+    """按名称构建推理后端"""
+    if kind == "pytorch":
+        return PyTorchBackend(model_name)
+    if kind == "pytorch-int8":
+        return PyTorchBackend(model_name, quantize=True)
+    if kind == "onnx":
+        return OnnxBackend(model_name, onnx_dir)
+    raise ValueError(f"未知的推理后端: {kind}（可选 {', '.join(BACKENDS)}）")
+
+
+def check_parity(reference, candidate, texts, tolerance=0.05, min_agreement=1.0, batch_size=16):
+    """
+    对比两个后端在同一批文本上的输出
+    返回标签一致率、最大得分偏差、各自耗时，以及是否满足容差与一致率要求
+    """
+    ref_scores, cand_scores = [], []
+    timings = {}
+    for backend, out in ((reference, ref_scores), (candidate, cand_scores)):
+        started = time.perf_counter()
+        for start in range(0, len(texts), batch_size):
+            out.extend(backend.predict(texts[start:start + batch_size]))
+        timings[backend.name] = time.perf_counter() - started
+
+    label_matches = 0
+    max_diff = 0.0
+    for ref, cand in zip(ref_scores, cand_scores):
+        ref_best = max(ref, key=lambda s: s["score"])["label"]
+        cand_best = max(cand, key=lambda s: s["score"])["label"]
+        label_matches += ref_best == cand_best
+        for r, c in zip(ref, cand):
+            max_diff = max(max_diff, abs(r["score"] - c["score"]))
+
+    agreement = label_matches / len(texts) if texts else 1.0
+    return {
+        "reference": reference.name,
+        "candidate": candidate.name,
+        "label_agreement": agreement,
+        "max_score_diff": max_diff,
+        "seconds": timings,
+        "passed": agreement >= min_agreement and max_diff <= tolerance
+    }
+
+
+PARITY_SAMPLES = [
+    "We will never surrender. Our forces are stronger than ever.",
+    "Thank you to everyone who came out today, what an incredible crowd!",
+    "The talks ended without agreement. Further discussion is planned next week.",
+    "BREAKING: Missile attack on the capital. Emergency services responding.",
+    "Inflation is finally coming down and wages are going up.",
+    "今天与各国领导人举行了会谈，讨论了地区安全问题。",
+    "A terrible tragedy. Our thoughts are with the victims and their families.",
+    "The economy is collapsing and this government is to blame.",
+]
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    from 配置中心 import get_settings
+
+    parser = argparse.ArgumentParser(description="推理后端一致性检查")
+    parser.add_argument("--backend", choices=BACKENDS, required=True, help="待检查的后端")
+    parser.add_argument("--reference", choices=BACKENDS, default="pytorch", help="参照后端")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="单个得分允许的最大偏差")
+    parser.add_argument("--min-agreement", type=float, default=1.0, help="最高分标签的最低一致率")
+    parser.add_argument("--texts", help="JSONL 文本文件（每行含 text 字段），默认使用内置样例")
+    args = parser.parse_args()
+
+    texts = PARITY_SAMPLES
+    if args.texts:
+        with open(args.texts, encoding="utf-8") as f:
+            texts = [json.loads(line)["text"] for line in f if line.strip()]
+
+    models = get_settings().sentiment["MODELS"]
+    model_name = models["BERT"]
+    onnx_dir = models.get("ONNX_DIR", "models/onnx")
+    report = check_parity(
+        load_backend(args.reference, model_name, onnx_dir),
+        load_backend(args.backend, model_name, onnx_dir),
+        texts,
+        tolerance=args.tolerance,
+        min_agreement=args.min_agreement
+    )
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    raise SystemExit(0 if report["passed"] else 1)
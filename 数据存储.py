@@ -0,0 +1,158 @@
+"""
+数据存储模块
+写后缓冲：把逐条 upsert 合并为无序 bulk_write 批次；启动时建立查询所需索引
+"""
+
+import logging
+import threading
+import time
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from 监控指标 import MONGO_WRITES, STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class BulkWriteBuffer:
+    def __init__(self, collection, max_batch=500, max_interval=5.0, on_flushed=None, replay_on_error=False):
+        """
+        积累写操作，达到 max_batch 条或距上次刷新超过 max_interval 秒时批量写入
+        on_flushed(keys): 一批写入完成后回调，参数为这批操作在 add() 时附带的 key
+        replay_on_error: 连接类错误时整批放回缓冲区重试并抛出异常；只适用于可重放的操作（如 $set upsert），
+            $inc 等增量更新在服务端可能已生效，重放会重复计数，保持关闭时这批操作记为失败后丢弃
+        """
+        self.collection = collection
+        self.max_batch = max_batch
+        self.max_interval = max_interval
+        self.on_flushed = on_flushed
+        self.replay_on_error = replay_on_error
+        self.pending = []
+        self.pending_keys = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        # 串行化刷新，保证 flush() 返回时之前加入的操作都已写完
+        self.flush_lock = threading.Lock()
+        self.stats = {"written": 0, "failed": 0, "batches": 0, "retained": 0, "dropped": 0}
+        self._stop = threading.Event()
+        self._timer = None
+
+    def add(self, operation, key=None):
+        """加入一个 pymongo 写操作（UpdateOne / InsertOne 等）；key 在写入完成后传给 on_flushed"""
+        with self.lock:
+            self.pending.append(operation)
+            if key is not None:
+                self.pending_keys.append(key)
+            due = (
+                len(self.pending) >= self.max_batch
+                or time.monotonic() - self.last_flush >= self.max_interval
+            )
+        if due:
+            try:
+                self.flush()
+            except Exception as e:
+                # 操作已留在缓冲区，下次刷新重试；轮次结束的 flush() 会把错误抛给调用方
+                logger.error(f"批量写入失败，{len(self.pending)} 条留待重试: {e}")
+
+    def flush(self):
+        """
+        写出当前缓冲区；单条文档失败不影响同批其它文档
+        连接类错误（断线、超时、找不到主节点）时：replay_on_error 开启则整批放回缓冲区并抛出异常，
+        调用方不应推进检查点；关闭则记录日志后丢弃这批操作
+        """
+        with self.flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, []
+            keys, self.pending_keys = self.pending_keys, []
+            self.last_flush = time.monotonic()
+        if not batch:
+            return 0
+
+        try:
+            with STAGE_SECONDS.time(stage="mongo_bulk_write"):
+                result = self.collection.bulk_write(batch, ordered=False)
+            written = result.upserted_count + result.modified_count + result.inserted_count
+            failed = 0
+        except BulkWriteError as e:
+            details = e.details
+            written = details.get("nUpserted", 0) + details.get("nModified", 0) + details.get("nInserted", 0)
+            failed = len(details.get("writeErrors", []))
+            for error in details.get("writeErrors", []):
+                logger.error(f"批量写入失败（第 {error.get('index')} 条）: {error.get('errmsg')}")
+        except Exception as e:
+            if not self.replay_on_error:
+                # 服务端可能已经执行了这批操作，重放会让增量更新重复生效，宁可少计也不重复计
+                logger.error(f"批量写入 {self.collection.name} 结果未知，丢弃 {len(batch)} 条操作不再重放: {e}")
+                MONGO_WRITES.inc(len(batch), collection=self.collection.name, result="error")
+                with self.lock:
+                    self.stats["dropped"] += len(batch)
+                return 0
+            # 整批都未确认写入：放回缓冲区头部，保持原有顺序，下次刷新重试（$set upsert 可重放）
+            with self.lock:
+                self.pending = batch + self.pending
+                self.pending_keys = keys + self.pending_keys
+                self.stats["retained"] += len(batch)
+            raise
+
+        MONGO_WRITES.inc(written, collection=self.collection.name, result="ok")
+        if failed:
+            MONGO_WRITES.inc(failed, collection=self.collection.name, result="error")
+        with self.lock:
+            self.stats["written"] += written
+            self.stats["failed"] += failed
+            self.stats["batches"] += 1
+        if keys and self.on_flushed is not None:
+            self.on_flushed(keys)
+        return written
+
+    def start(self):
+        """启动后台线程，保证缓冲区不会因为没有新写入而滞留超过 max_interval"""
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._run, daemon=True)
+            self._timer.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.max_interval):
+            if time.monotonic() - self.last_flush >= self.max_interval:
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.error(f"定时刷新失败: {e}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+def ensure_indexes(db):
+    """创建推文与警报集合的索引；已存在的索引会被跳过"""
+    specs = {
+        "tweets": [
+            ([("id", ASCENDING)], {"unique": True}),
+            ([("created_at", DESCENDING)], {}),
+            ([("username", ASCENDING), ("alert_level", ASCENDING), ("created_at", DESCENDING)], {}),
+            ([("black_swan", ASCENDING), ("created_at", DESCENDING)], {}),
+            # 面板推文流的游标分页
+            ([("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+            ([("username", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)], {}),
+            # 近重复簇：簇成员查询与启动时重建索引
+            ([("cluster_id", ASCENDING)], {}),
+            ([("is_cluster_representative", ASCENDING), ("created_at", DESCENDING)], {}),
+        ],
+        "alerts": [
+            ([("created_at", DESCENDING)], {}),
+            ([("username", ASCENDING), ("alert_level", ASCENDING), ("created_at", DESCENDING)], {}),
+        ],
+    }
+    for collection_name, indexes in specs.items():
+        for keys, options in indexes:
+            try:
+                db[collection_name].create_index(keys, **options)
+            except OperationFailure as e:
+                # 例如历史数据里已有重复 id，唯一索引建不起来时不阻止启动
+                logger.warning(f"索引创建失败 {collection_name}{keys}: {e}")
@@ -0,0 +1,114 @@
+"""
+文本指纹模块
+SimHash 近重复检测：把推文规范化后切成特征（英文单词 + 中日韩字符二元组），生成 64 位指纹；
+按抽屉原理分段建立索引，汉明距离不超过 max_distance 的指纹可以在常数次字典查找内找到
+"""
+
+import hashlib
+import re
+
+from 分析缓存 import normalize_text
+
+FINGERPRINT_BITS = 64
+
+_URL = re.compile(r"https?://\S+")
+_MENTION = re.compile(r"[@#]\w+")
+_LATIN_WORD = re.compile(r"[a-z0-9']+")
+_CJK_RUN = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+")
+
+
+def features(text):
+    """提取特征及其权重：英文按单词，中日韩文字按相邻二字"""
+    text = normalize_text(text).lower()
+    text = _MENTION.sub(" ", _URL.sub(" ", text))
+    weights = {}
+    for word in _LATIN_WORD.findall(text):
+        if len(word) > 1:
+            weights[word] = weights.get(word, 0) + 1
+    for run in _CJK_RUN.findall(text):
+        grams = [run[i:i + 2] for i in range(len(run) - 1)] or [run]
+        for gram in grams:
+            weights[gram] = weights.get(gram, 0) + 1
+    return weights
+
+
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(text):
+    """64 位 SimHash；无可用特征时返回 0"""
+    totals = [0] * FINGERPRINT_BITS
+    for feature, weight in features(text).items():
+        h = _feature_hash(feature)
+        for bit in range(FINGERPRINT_BITS):
+            totals[bit] += weight if h >> bit & 1 else -weight
+    fingerprint = 0
+    for bit, total in enumerate(totals):
+        if total > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def to_hex(fingerprint):
+    """MongoDB 整数为有符号 64 位，指纹以 16 位十六进制字符串存储"""
+    return f"{fingerprint:016x}"
+
+
+def from_hex(value):
+    return int(value, 16)
+
+
+class SimHashIndex:
+    def __init__(self, max_distance=3):
+        """
+        把指纹分成 max_distance + 1 段：汉明距离不超过 max_distance 的两个指纹至少有一段完全相同，
+        只需比较落在相同段里的候选
+        """
+        self.max_distance = max_distance
+        self.blocks = max_distance + 1
+        self.block_bits = -(-FINGERPRINT_BITS // self.blocks)
+        self.tables = [{} for _ in range(self.blocks)]
+        self.fingerprints = {}
+
+    def _block_values(self, fingerprint):
+        mask = (1 << self.block_bits) - 1
+        return [(fingerprint >> (i * self.block_bits)) & mask for i in range(self.blocks)]
+
+    def add(self, key, fingerprint):
+        if key in self.fingerprints:
+            self.remove(key)
+        self.fingerprints[key] = fingerprint
+        for table, value in zip(self.tables, self._block_values(fingerprint)):
+            table.setdefault(value, set()).add(key)
+
+    def remove(self, key):
+        fingerprint = self.fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        for table, value in zip(self.tables, self._block_values(fingerprint)):
+            keys = table.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del table[value]
+
+    def query(self, fingerprint, max_distance=None):
+        """返回 [(key, 汉明距离)]，按距离升序"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        candidates = set()
+        for table, value in zip(self.tables, self._block_values(fingerprint)):
+            candidates.update(table.get(value, ()))
+        matches = []
+        for key in candidates:
+            distance = hamming(fingerprint, self.fingerprints[key])
+            if distance <= max_distance:
+                matches.append((key, distance))
+        return sorted(matches, key=lambda item: item[1])
+
+    def __len__(self):
+        return len(self.fingerprints)
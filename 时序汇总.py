@@ -0,0 +1,168 @@
+"""
+时序汇总模块
+按账号维护小时/天粒度的汇总桶（数量、情感均值/最值、风险分数直方图、警报级别计数、黑天鹅数），
+入库时用 $inc 增量更新；提供从已有推文重建汇总的回填命令
+"""
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+
+from 数据存储 import BulkWriteBuffer
+
+ROLLUP_COLLECTIONS = {
+    "hour": "tweet_rollups_hourly",
+    "day": "tweet_rollups_daily"
+}
+# created_at 为 ISO 字符串，截取前缀即可得到桶：2024-05-01T13 / 2024-05-01
+BUCKET_PREFIX_LENGTH = {"hour": 13, "day": 10}
+RISK_BIN_WIDTH = 5
+
+
+def risk_bin(risk_score):
+    """风险分数所在区间的下界"""
+    return int(risk_score // RISK_BIN_WIDTH * RISK_BIN_WIDTH)
+
+
+def bucket_time(tweet, now=None):
+    """
+    汇总桶使用的时间（ISO 字符串）：created_at 可能是 datetime，
+    流式或回放推文也可能缺少 created_at，此时按入库时间（UTC）计入
+    """
+    created_at = tweet.get("created_at")
+    if isinstance(created_at, datetime):
+        return created_at.isoformat()
+    if not created_at:
+        return (now or datetime.utcnow()).isoformat()
+    return created_at
+
+
+def rollup_update(tweet, granularity, now=None):
+    """为一条推文生成某个粒度汇总桶的增量更新"""
+    bucket = bucket_time(tweet, now)[:BUCKET_PREFIX_LENGTH[granularity]]
+    username = tweet["username"]
+    sentiment = tweet.get("sentiment_score") or 0.0
+    inc = {
+        "count": 1,
+        "sentiment_sum": sentiment,
+        f"risk_hist.{risk_bin(tweet.get('risk_score') or 0)}": 1,
+        f"alert_levels.{tweet.get('alert_level') or '未知'}": 1,
+        "black_swan": 1 if tweet.get("black_swan") else 0
+    }
+    return UpdateOne(
+        {"_id": f"{username}|{bucket}"},
+        {
+            "$setOnInsert": {"username": username, "bucket": bucket},
+            "$inc": inc,
+            "$min": {"sentiment_min": sentiment},
+            "$max": {"sentiment_max": sentiment}
+        },
+        upsert=True
+    )
+
+
+class RollupWriter:
+    def __init__(self, db, max_batch=500, max_interval=5.0):
+        """
+        每个粒度一个写后缓冲，与推文写入一起批量落库
+        $inc 不可重放：连接出错的批次直接丢弃（可用 --backfill 重建校正），不会重复计数
+        """
+        self.buffers = {
+            granularity: BulkWriteBuffer(db[name], max_batch=max_batch, max_interval=max_interval)
+            for granularity, name in ROLLUP_COLLECTIONS.items()
+        }
+
+    def start(self):
+        for buffer in self.buffers.values():
+            buffer.start()
+        return self
+
+    def record(self, tweet):
+        """记录一条新入库的推文（只应对新推文调用一次，否则会重复计数）"""
+        for granularity, buffer in self.buffers.items():
+            buffer.add(rollup_update(tweet, granularity))
+
+    def flush(self):
+        for buffer in self.buffers.values():
+            buffer.flush()
+
+
+def ensure_rollup_indexes(db):
+    for name in ROLLUP_COLLECTIONS.values():
+        db[name].create_index([("username", 1), ("bucket", 1)])
+        db[name].create_index([("bucket", 1)])
+
+
+def backfill(db, batch_size=1000, tweets_collection=None):
+    """
+    按推文集合重建全部汇总桶，返回处理的推文数
+    先写入临时集合，完成后用 rename(dropTarget=True) 原子替换，重建期间读者看到的始终是完整的旧汇总；
+    替换会覆盖抓取进程同时写入的增量，因此应在抓取停止时运行：
+    重建期间推文集合有新文档写入时放弃替换并抛出 RuntimeError
+    """
+    if tweets_collection is None:
+        from 配置中心 import get_settings
+        tweets_collection = get_settings().mongodb.collection_name
+    tweets = db[tweets_collection]
+    fields = {"created_at": 1, "username": 1, "sentiment_score": 1, "risk_score": 1,
+              "alert_level": 1, "black_swan": 1, "_id": 0}
+    temp_names = {granularity: f"{name}_rebuild" for granularity, name in ROLLUP_COLLECTIONS.items()}
+    for granularity, name in temp_names.items():
+        db[name].drop()
+        db[name].create_index([("username", 1), ("bucket", 1)])
+        db[name].create_index([("bucket", 1)])
+
+    newest_before = _newest_id(tweets)
+    pending = {granularity: [] for granularity in ROLLUP_COLLECTIONS}
+    processed = 0
+    cursor = tweets.find({"created_at": {"$ne": None}, "username": {"$ne": None}}, fields)
+    for tweet in cursor.batch_size(batch_size):
+        for granularity in ROLLUP_COLLECTIONS:
+            pending[granularity].append(rollup_update(tweet, granularity))
+        processed += 1
+        if processed % batch_size == 0:
+            _write_pending(db, temp_names, pending)
+    _write_pending(db, temp_names, pending)
+
+    if _newest_id(tweets) != newest_before:
+        for name in temp_names.values():
+            db[name].drop()
+        raise RuntimeError("重建期间有新推文写入，抓取进程仍在运行；请先停止抓取再回填")
+    for granularity, name in temp_names.items():
+        db[name].rename(ROLLUP_COLLECTIONS[granularity], dropTarget=True)
+    return processed
+
+
+def _newest_id(collection):
+    newest = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return newest["_id"] if newest else None
+
+
+def _write_pending(db, names, pending):
+    for granularity, operations in pending.items():
+        if operations:
+            db[names[granularity]].bulk_write(operations, ordered=False)
+            operations.clear()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from pymongo import MongoClient
+
+    from 配置中心 import get_settings
+
+    parser = argparse.ArgumentParser(description="时序汇总维护")
+    parser.add_argument("--backfill", action="store_true", help="从推文集合重建小时/天汇总（须先停止抓取）")
+    args = parser.parse_args()
+
+    if args.backfill:
+        mongodb = get_settings().mongodb
+        db = MongoClient(mongodb.connection_string)[mongodb.database_name]
+        try:
+            count = backfill(db, tweets_collection=mongodb.collection_name)
+        except RuntimeError as e:
+            raise SystemExit(f"❌ 汇总回填已放弃，原汇总保持不变: {e}")
+        print(f"✅ 汇总回填完成，共处理 {count} 条推文")
+    else:
+        parser.print_help()
@@ -0,0 +1,233 @@
+"""
+流式抓取模块
+基于 v2 filtered stream 实时接收领导人推文；断线后指数退避重连，并触发轮询补抓缺口
+另提供本地回放服务器，把录制的 JSONL 推文按流式接口格式推送，用于离线测试
+"""
+
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import tweepy
+
+logger = logging.getLogger(__name__)
+
+# v2 单条规则长度上限
+MAX_RULE_LENGTH = 512
+RULE_TAG = "politweet-leaders"
+
+
+def build_stream_rules(usernames, max_length=MAX_RULE_LENGTH):
+    """把账号列表拼成若干条 "from:a OR from:b" 规则，每条不超过长度上限"""
+    rules = []
+    current = []
+    for username in usernames:
+        candidate = " OR ".join(current + [f"from:{username}"])
+        if current and len(candidate) > max_length:
+            rules.append(" OR ".join(current))
+            current = []
+        current.append(f"from:{username}")
+    if current:
+        rules.append(" OR ".join(current))
+    return rules
+
+
+def payload_to_raw(payload):
+    """
+    把流式接口的一条 JSON 转成原始推文 dict
+    支持标准 v2 信封 {"data": {...}, "includes": {"users": [...]}} 与简化格式 {id, text, created_at, username}
+    """
+    data = payload.get("data", payload)
+    username = data.get("username")
+    if username is None:
+        users = {u["id"]: u["username"] for u in payload.get("includes", {}).get("users", [])}
+        username = users.get(data.get("author_id"))
+    return {
+        "id": int(data["id"]),
+        "created_at": data.get("created_at"),
+        "text": data["text"],
+        "author_id": data.get("author_id"),
+        "username": username
+    }
+
+
+class _LeaderStreamingClient(tweepy.StreamingClient):
+    def __init__(self, bearer_token, on_tweet, on_reconnect, **kwargs):
+        super().__init__(bearer_token, **kwargs)
+        self._on_tweet = on_tweet
+        self._on_reconnect = on_reconnect
+        self._connected_before = False
+
+    def on_connect(self):
+        logger.info("流式连接已建立")
+        if self._connected_before:
+            # tweepy 内部重连成功，断线期间的推文需要补抓
+            self._on_reconnect()
+        self._connected_before = True
+
+    def on_response(self, response):
+        tweet = response.data
+        users = {u.id: u.username for u in (response.includes or {}).get("users", [])}
+        self._on_tweet({
+            "id": tweet.id,
+            "created_at": tweet.created_at.isoformat() if tweet.created_at else None,
+            "text": tweet.text,
+            "author_id": tweet.author_id,
+            "username": users.get(tweet.author_id)
+        })
+
+    def on_request_error(self, status_code):
+        logger.error(f"流式请求错误: HTTP {status_code}")
+
+    def on_connection_error(self):
+        logger.warning("流式连接中断，tweepy 将自动重连")
+
+
+class TwitterStreamSource:
+    def __init__(self, bearer_token, usernames):
+        self.bearer_token = bearer_token
+        self.usernames = list(usernames)
+        self._client = None
+
+    def update_usernames(self, usernames):
+        """账号列表变化时替换规则；规则对已建立的连接立即生效，无需重连"""
+        self.usernames = list(usernames)
+        if self._client is not None:
+            self.sync_rules(self._client)
+
+    def sync_rules(self, client):
+        """用当前账号列表替换本系统打过标签的旧规则"""
+        existing = client.get_rules().data or []
+        stale = [rule.id for rule in existing if rule.tag == RULE_TAG]
+        if stale:
+            client.delete_rules(stale)
+        client.add_rules([tweepy.StreamRule(value, tag=RULE_TAG) for value in build_stream_rules(self.usernames)])
+
+    def run(self, on_tweet, on_reconnect):
+        """阻塞运行，直到连接彻底失败"""
+        client = _LeaderStreamingClient(self.bearer_token, on_tweet, on_reconnect, wait_on_rate_limit=True)
+        self.sync_rules(client)
+        self._client = client
+        try:
+            client.filter(
+                expansions=["author_id"],
+                tweet_fields=["created_at", "lang", "author_id"],
+                user_fields=["username"]
+            )
+        finally:
+            self._client = None
+
+
+class ReplayStreamSource:
+    def __init__(self, url):
+        """从本地回放服务器（或任何按行输出 JSON 的地址）读取推文"""
+        self.url = url
+
+    def run(self, on_tweet, on_reconnect):
+        with requests.get(self.url, stream=True, timeout=(5, 90)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                # 空行是保活心跳
+                if line:
+                    on_tweet(payload_to_raw(json.loads(line)))
+
+
+def run_stream(source, on_tweet, on_gap, initial_backoff=1, max_backoff=300, stop_event=None):
+    """
+    持续运行流式源；连接异常或结束时按指数退避重连
+    每次断线（包括 tweepy 内部重连）都调用 on_gap()，由调用方用轮询补抓缺口
+    """
+    stop_event = stop_event or threading.Event()
+    backoff = initial_backoff
+    while not stop_event.is_set():
+        started = time.monotonic()
+        try:
+            source.run(on_tweet, on_gap)
+            logger.warning("流式连接已结束")
+        except Exception as e:
+            logger.error(f"流式连接异常: {e}")
+        # 稳定运行过一段时间则重置退避
+        if time.monotonic() - started > max_backoff:
+            backoff = initial_backoff
+        on_gap()
+        logger.info(f"{backoff} 秒后重连...")
+        if stop_event.wait(backoff):
+            break
+        backoff = min(backoff * 2, max_backoff)
+
+
+# ---------- 本地回放服务器 ----------
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if not self.path.startswith("/2/tweets/search/stream"):
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        server = self.server
+        try:
+            with open(server.jsonl_path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    self.wfile.write(line.strip().encode("utf-8") + b"\r\n")
+                    self.wfile.flush()
+                    time.sleep(server.interval)
+            # 回放结束后保持连接，定期发送心跳，模拟空闲的真实流
+            while server.keep_open:
+                self.wfile.write(b"\r\n")
+                self.wfile.flush()
+                time.sleep(20)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+class ReplayServer:
+    def __init__(self, jsonl_path, host="127.0.0.1", port=8765, rate=5.0, keep_open=True):
+        """rate: 每秒推送条数"""
+        self.httpd = ThreadingHTTPServer((host, port), _ReplayHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.jsonl_path = jsonl_path
+        self.httpd.interval = 1.0 / rate if rate > 0 else 0
+        self.httpd.keep_open = keep_open
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/2/tweets/search/stream"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.keep_open = False
+        self.httpd.shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="本地推文流回放服务器")
+    parser.add_argument("jsonl", help="录制的推文 JSONL 文件")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate", type=float, default=5.0, help="每秒推送条数")
+    args = parser.parse_args()
+
+    server = ReplayServer(args.jsonl, port=args.port, rate=args.rate).start()
+    print(f"▶️ 回放服务器已启动: {server.url}")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,243 @@
+"""
+用户 ID 解析模块
+用户名 → user_id 的解析结果持久化到 MongoDB（user_ids 集合）并带有效期，重启后无需重新解析；
+缺失的用户名每 100 个合并为一次 get_users 请求，不再逐个调用 get_user
+
+不存在或被封禁的账号做负缓存，在较短的有效期内不再请求，避免每轮重试；
+已知 user_id 的条目到期后按 ID 批量刷新：ID 不变而用户名变化即为改名，继续按 ID 抓取
+（条目不用 TTL 索引自动删除，正是为了保留 ID 以识别改名与解封）
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+STATUS_OK = "ok"
+STATUS_RENAMED = "renamed"
+STATUS_NOT_FOUND = "not_found"
+STATUS_SUSPENDED = "suspended"
+RESOLVED_STATUSES = (STATUS_OK, STATUS_RENAMED)
+
+# users/by 与 users 接口单次最多 100 个
+MAX_LOOKUP_BATCH = 100
+# 网络错误、限流等暂时性失败后的重试间隔（只记在内存中）
+TRANSIENT_RETRY_MINUTES = 5
+
+
+def classify_error(error):
+    """get_users 返回的 errors 条目 → 负缓存状态"""
+    text = f"{error.get('title', '')} {error.get('detail', '')}".lower()
+    return STATUS_SUSPENDED if "suspend" in text else STATUS_NOT_FOUND
+
+
+def _chunks(items, size=MAX_LOOKUP_BATCH):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class UserIdResolver:
+    def __init__(self, client, collection, ttl_hours=168, negative_ttl_hours=6):
+        """
+        client: tweepy.Client（或 RateLimitedClient）
+        collection: {_id: 小写用户名, username, user_id, status, current_username, resolved_at, expires_at}
+        ttl_hours: 成功解析的有效期；negative_ttl_hours: 不存在 / 被封禁的有效期
+        """
+        self.client = client
+        self.collection = collection
+        self.ttl = timedelta(hours=ttl_hours)
+        self.negative_ttl = timedelta(hours=negative_ttl_hours)
+        self.memory = {}  # 小写用户名 → 条目
+        self.lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "db_hits": 0, "api_calls": 0, "negative": 0, "renamed": 0}
+
+    def load(self):
+        """启动时把全部条目读入内存（每个账号一条，数量很小）"""
+        with self.lock:
+            for doc in self.collection.find():
+                self.memory[doc["_id"]] = doc
+        return self
+
+    def resolve(self, username, now=None):
+        return self.resolve_many([username], now).get(username)
+
+    def resolve_many(self, usernames, now=None):
+        """
+        返回 {用户名: user_id}；不存在、被封禁或暂时无法解析的账号不在结果中
+        依次查内存、MongoDB（其他节点可能刚写入），最后才请求 API
+        """
+        now = now or datetime.utcnow()
+        result, missing = self._lookup_memory(usernames, now)
+        self.stats["memory_hits"] += len(result)
+        if missing:
+            self._load_from_db([username.lower() for username in missing])
+            result_db, missing = self._lookup_memory(missing, now)
+            result.update(result_db)
+            self.stats["db_hits"] += len(result_db)
+
+        stale_ids, unknown = {}, []
+        with self.lock:
+            for username in missing:
+                doc = self.memory.get(username.lower())
+                if doc and doc.get("user_id"):
+                    stale_ids[username] = doc["user_id"]
+                else:
+                    unknown.append(username)
+        if stale_ids:
+            result.update(self._refresh_by_id(stale_ids, now))
+        if unknown:
+            result.update(self._lookup_by_username(unknown, now))
+        return result
+
+    def _lookup_memory(self, usernames, now):
+        """未过期的条目直接使用（负缓存条目视为已处理），返回 (结果, 需要继续解析的用户名)"""
+        result, missing = {}, []
+        with self.lock:
+            for username in usernames:
+                doc = self.memory.get(username.lower())
+                if doc is None or doc["expires_at"] <= now:
+                    missing.append(username)
+                elif doc["status"] in RESOLVED_STATUSES:
+                    result[username] = doc["user_id"]
+        return result, missing
+
+    def _load_from_db(self, keys):
+        docs = list(self.collection.find({"_id": {"$in": keys}}))
+        with self.lock:
+            for doc in docs:
+                self.memory[doc["_id"]] = doc
+
+    def _lookup_by_username(self, usernames, now):
+        """按用户名批量解析未知账号"""
+        result = {}
+        for chunk in _chunks(usernames):
+            try:
+                self.stats["api_calls"] += 1
+                response = self.client.get_users(usernames=chunk, user_fields=["username"])
+            except Exception as e:
+                logger.warning(f"批量解析用户名失败（{len(chunk)} 个），{TRANSIENT_RETRY_MINUTES} 分钟后重试: {e}")
+                self._defer(chunk, now)
+                continue
+
+            requested = {username.lower(): username for username in chunk}
+            entries = []
+            for user in response.data or []:
+                username = requested.get(user.username.lower())
+                if username is not None:
+                    result[username] = user.id
+                    entries.append(self._entry(username, STATUS_OK, user.id, user.username, now))
+            for error in response.errors or []:
+                username = requested.get(str(error.get("value", "")).lower())
+                if username is not None:
+                    entries.append(self._entry(username, classify_error(error), None, None, now))
+            self._save(entries)
+            self._defer_unanswered(chunk, entries, now)
+        return result
+
+    def _refresh_by_id(self, stale_ids, now):
+        """按 ID 刷新到期条目，识别改名、封禁与解封；请求失败时继续使用旧 ID"""
+        result = {}
+        items = list(stale_ids.items())
+        for chunk in _chunks(items):
+            by_id = {str(user_id): username for username, user_id in chunk}
+            try:
+                self.stats["api_calls"] += 1
+                response = self.client.get_users(ids=[user_id for _, user_id in chunk], user_fields=["username"])
+            except Exception as e:
+                logger.warning(f"按 ID 刷新用户失败（{len(chunk)} 个），继续使用缓存的 ID: {e}")
+                with self.lock:
+                    for username, user_id in chunk:
+                        if self.memory[username.lower()]["status"] in RESOLVED_STATUSES:
+                            result[username] = user_id
+                self._defer([username for username, _ in chunk], now)
+                continue
+
+            entries = []
+            for user in response.data or []:
+                username = by_id.get(str(user.id))
+                if username is None:
+                    continue
+                result[username] = user.id
+                if user.username.lower() == username.lower():
+                    entries.append(self._entry(username, STATUS_OK, user.id, user.username, now))
+                else:
+                    entries.append(self._entry(username, STATUS_RENAMED, user.id, user.username, now))
+            for error in response.errors or []:
+                username = by_id.get(str(error.get("value", "")))
+                if username is not None:
+                    # 保留 ID，解封后下次刷新即可恢复
+                    entries.append(self._entry(username, classify_error(error), stale_ids[username], None, now))
+            self._save(entries)
+            # 响应里没有提到的账号按暂时性失败处理：继续使用旧 ID，稍后再刷新
+            for username in self._defer_unanswered([username for username, _ in chunk], entries, now):
+                if self.memory[username.lower()]["status"] in RESOLVED_STATUSES:
+                    result[username] = stale_ids[username]
+        return result
+
+    def _defer_unanswered(self, usernames, entries, now):
+        """data 与 errors 都没有提到的账号推迟重试，避免每轮都重新请求；返回这些账号"""
+        answered = {entry["_id"] for entry in entries}
+        unanswered = [username for username in usernames if username.lower() not in answered]
+        if unanswered:
+            logger.warning(f"get_users 响应未包含 {len(unanswered)} 个账号，{TRANSIENT_RETRY_MINUTES} 分钟后重试: "
+                           f"{', '.join(unanswered)}")
+            self._defer(unanswered, now)
+        return unanswered
+
+    def _entry(self, username, status, user_id, current_username, now):
+        resolved = status in RESOLVED_STATUSES
+        return {
+            "_id": username.lower(),
+            "username": username,
+            "user_id": user_id,
+            "status": status,
+            "current_username": current_username,
+            "resolved_at": now,
+            "expires_at": now + (self.ttl if resolved else self.negative_ttl)
+        }
+
+    def _save(self, entries):
+        from pymongo import ReplaceOne
+
+        if not entries:
+            return
+        with self.lock:
+            for entry in entries:
+                previous = self.memory.get(entry["_id"])
+                self._report_change(previous, entry)
+                self.memory[entry["_id"]] = entry
+        self.collection.bulk_write(
+            [ReplaceOne({"_id": entry["_id"]}, entry, upsert=True) for entry in entries],
+            ordered=False
+        )
+
+    def _report_change(self, previous, entry):
+        """状态变化时记一次日志，之后在有效期内保持安静"""
+        previous_status = previous["status"] if previous else None
+        if entry["status"] == previous_status and entry.get("current_username") == (previous or {}).get("current_username"):
+            return
+        if entry["status"] == STATUS_RENAMED:
+            self.stats["renamed"] += 1
+            logger.warning(f"账号 {entry['username']} 已改名为 @{entry['current_username']}，继续按 user_id 抓取，"
+                           f"请在配置中更新用户名")
+        elif entry["status"] not in RESOLVED_STATUSES:
+            self.stats["negative"] += 1
+            reason = "被封禁" if entry["status"] == STATUS_SUSPENDED else "不存在"
+            hours = self.negative_ttl.total_seconds() / 3600
+            logger.warning(f"账号 {entry['username']} {reason}，{hours:g} 小时内不再解析")
+
+    def _defer(self, usernames, now):
+        """暂时性失败：在内存中推迟重试，不写入数据库，也不覆盖已知的 ID"""
+        retry_at = now + timedelta(minutes=TRANSIENT_RETRY_MINUTES)
+        with self.lock:
+            for username in usernames:
+                key = username.lower()
+                doc = dict(self.memory.get(key) or {"_id": key, "username": username, "user_id": None,
+                                                     "status": STATUS_NOT_FOUND, "current_username": None})
+                doc["expires_at"] = retry_at
+                self.memory[key] = doc
+
+
+def ensure_user_id_indexes(collection):
+    collection.create_index("status")
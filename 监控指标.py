@@ -0,0 +1,292 @@
+"""
+监控指标模块
+轻量的计数器 / 仪表 / 直方图，按 Prometheus 文本格式在本地 HTTP /metrics 暴露；
+抓取、分析、写库、警报发送等热点路径各自记录耗时与次数
+"""
+
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 默认耗时分桶（秒）：覆盖从毫秒级的关键词匹配到数十秒的 API 等待
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} 需要标签 {self.label_names}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self.lock:
+            items = sorted(self.values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            state["counts"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 块的耗时；块内抛出异常也会记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), state["counts"]):
+            cumulative += count
+            labels = _format_labels(self.label_names, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, documentation, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labels=()):
+        return self._register(Counter, name, documentation, labels=labels)
+
+    def gauge(self, name, documentation, labels=()):
+        return self._register(Gauge, name, documentation, labels=labels)
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labels=labels, buckets=buckets)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# ---------- 各环节指标 ----------
+STAGE_SECONDS = REGISTRY.histogram(
+    "politweet_stage_seconds", "各处理环节耗时（秒）", labels=("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "politweet_stage_errors_total", "各处理环节抛出异常的次数", labels=("stage",)
+)
+TWITTER_REQUEST_SECONDS = REGISTRY.histogram(
+    "politweet_twitter_request_seconds", "Twitter API 请求耗时（秒，含令牌等待）", labels=("route",)
+)
+TWITTER_REQUESTS = REGISTRY.counter(
+    "politweet_twitter_requests_total", "Twitter API 请求数", labels=("route", "status")
+)
+RATE_LIMIT_REMAINING = REGISTRY.gauge(
+    "politweet_rate_limit_remaining", "Twitter API 当前窗口剩余额度", labels=("route",)
+)
+TWEETS_PROCESSED = REGISTRY.counter(
+    "politweet_tweets_processed_total", "已分析入库的推文数"
+)
+MONGO_WRITES = REGISTRY.counter(
+    "politweet_mongo_writes_total", "MongoDB 批量写入的文档数", labels=("collection", "result")
+)
+ALERTS_SENT = REGISTRY.counter(
+    "politweet_alerts_sent_total", "警报发送次数", labels=("channel", "result")
+)
+
+
+def timed(stage):
+    """装饰器：把函数耗时记入 politweet_stage_seconds{stage=...}"""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.inc(stage=stage)
+                raise
+            finally:
+                STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        return wrapper
+    return decorator
+
+
+# ---------- HTTP 暴露 ----------
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(host="127.0.0.1", port=9108, registry=REGISTRY, port_attempts=10):
+    """
+    在后台线程中启动 /metrics 服务，返回 HTTP 服务器对象（实际端口见 server_address）
+    端口被占用时（同一主机上运行多个抓取进程）依次尝试后续 port_attempts - 1 个端口，全部失败时抛出 OSError
+    """
+    for offset in range(port_attempts):
+        try:
+            httpd = ThreadingHTTPServer((host, port + offset), _MetricsHandler)
+            break
+        except OSError:
+            if offset == port_attempts - 1:
+                raise
+    httpd.daemon_threads = True
+    httpd.registry = registry
+    threading.Thread(target=httpd.serve_forever, name="metrics-server", daemon=True).start()
+    return httpd
+
+
+# ---------- 解析（面板读取抓取进程的指标） ----------
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(.*)\})?\s+(\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    """把 Prometheus 文本格式解析为 [(指标名, 标签 dict, 数值)]"""
+    samples = []
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = _SAMPLE.match(line)
+        if not match:
+            continue
+        name, _, label_text, value = match.groups()
+        labels = {key: raw.replace('\\"', '"').replace("\\n", "\n").replace("\\\\", "\\")
+                  for key, raw in _LABEL.findall(label_text or "")}
+        samples.append((name, labels, float(value.replace("+Inf", "inf"))))
+    return samples
+
+
+def summarize_histograms(samples, name):
+    """从解析结果汇总某个直方图：每组标签的次数、总耗时、平均值及 p50/p99 估计（取所在分桶上界）"""
+    groups = {}
+    for sample_name, labels, value in samples:
+        if not sample_name.startswith(name):
+            continue
+        suffix = sample_name[len(name):]
+        if suffix not in ("_bucket", "_sum", "_count"):
+            continue
+        key = tuple(sorted((k, v) for k, v in labels.items() if k != "le"))
+        group = groups.setdefault(key, {"buckets": [], "sum": 0.0, "count": 0})
+        if suffix == "_bucket":
+            group["buckets"].append((float(labels["le"].replace("+Inf", "inf")), value))
+        elif suffix == "_sum":
+            group["sum"] = value
+        elif suffix == "_count":
+            group["count"] = int(value)
+
+    rows = []
+    for key, group in groups.items():
+        buckets = sorted(group["buckets"])
+        row = dict(key)
+        row.update({
+            "count": group["count"],
+            "sum": group["sum"],
+            "avg": group["sum"] / group["count"] if group["count"] else 0.0,
+            "p50": _bucket_quantile(buckets, group["count"], 0.5),
+            "p99": _bucket_quantile(buckets, group["count"], 0.99)
+        })
+        rows.append(row)
+    return rows
+
+
+def _bucket_quantile(buckets, count, q):
+    if not count:
+        return 0.0
+    for bound, cumulative in buckets:
+        if cumulative >= q * count:
+            return bound
+    return float("inf")
@@ -1,85 +1,137 @@
-import tweepy
-from pymongo import MongoClient
-from textblob import TextBlob
+from pymongo import MongoClient, UpdateOne
 import schedule
 import time
+import threading
+import signal
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import sys
 import io
-import os
 from dotenv import load_dotenv
-from 语义分析 import analyze_tweet
-from 警报系统 import send_alert_if_needed
+from 语义分析 import analyze_tweets, analyze_with_sentiment, get_cache_stats, set_lightweight_mode, warm_up
+from 警报系统 import send_alert_if_needed, shutdown_alert_system
+from 速率限制 import RateLimiter, RateLimitedClient
+from 抓取检查点 import CheckpointStore
+from 数据存储 import BulkWriteBuffer, ensure_indexes
+from 分析流水线 import AnalysisPipeline
+from 时序汇总 import RollupWriter, ensure_rollup_indexes
+from 流式抓取 import TwitterStreamSource, ReplayStreamSource, run_stream
+from 推文聚类 import NearDuplicateIndex
+from 监控指标 import TWEETS_PROCESSED, start_metrics_server, timed
+from 配置中心 import get_config_center, get_settings, on_reload
+from 自适应调度 import AdaptiveScheduler
+from 分布式协调 import Coordinator, ensure_coordination_indexes
+from 用户解析 import UserIdResolver, ensure_user_id_indexes
 
 # 加载环境变量
 load_dotenv()
 
 # ---------- 配置区 ----------
-# 从环境变量获取API密钥，如果没有则使用占位符
-BEARER_TOKEN = os.getenv("TWITTER_BEARER_TOKEN")  
-
-# 如果使用占位符，提示用户配置
-if BEARER_TOKEN == "your_bearer_token_here":
-    print("⚠️ 请在.env文件中配置TWITTER_BEARER_TOKEN")
-    print("或者直接在此处替换BEARER_TOKEN变量")
-
-MAX_TWEETS_PER_PERSON = 5
-SLEEP_BETWEEN_USERS = 10  # 秒
-FETCH_INTERVAL_HOURS = 2  # 每几小时抓一次
-
-# 领导人账号（用户名 → 中文名称）
-LEADER_ACCOUNTS = {
-    "realDonaldTrump": "特朗普",
-    "POTUS": "拜登",
-    "KremlinRussia_E": "普京",
-    "RishiSunak": "苏纳克",
-    "EmmanuelMacron": "马克龙",
-    "netanyahu": "内塔尼亚胡",
-    "ZelenskyyUa": "泽连斯基"
-}
-
-# 黑天鹅关键词
-BLACK_SWAN_KEYWORDS = [
-    "resign", "nuclear", "assassinate", "collapse", "shutdown", "default",
-    "emergency", "war", "coup", "strike", "riot", "dead", "爆炸", "危机"
-]
+# 账号、关键词、抓取参数统一由配置中心提供（config.py + settings.json），运行中可热更新；
+# 抓取逻辑每次使用时读取 get_settings()，不在模块里缓存副本
+BEARER_TOKEN = None
 
 # ---------- 初始化 ----------
-# 输出防 emoji 报错
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+# 连接、索引与后台线程都在 init() 中创建：分析进程以 spawn 方式启动时会重新导入主模块，
+# 导入本身不能连接数据库或启动线程
+rate_limiter = None
+client_twitter = None
+client_mongo = None
+db = None
+collection = None
+checkpoints = None
+write_buffer = None
+rollup_writer = None
+# 近重复推文索引：同簇推文复用代表推文的分析结果；未启用时为 None
+dedup_index = None
+# user_id 解析结果持久化在 user_ids 集合，重启与多节点之间共享；缺失的账号整批解析
+user_resolver = None
 
-# 检查API密钥
-if BEARER_TOKEN == "your_bearer_token_here":
-    print("❌ 请先配置Twitter API密钥")
-    sys.exit(1)
+# 已通过去重、尚未写入 MongoDB 的推文 ID：推文在写缓冲中停留期间，
+# 流式推送与轮询/补抓可能同时送来同一条推文，只查数据库会让两者都通过
+unflushed_ids = set()
+unflushed_lock = threading.Lock()
 
-client_twitter = tweepy.Client(
-    bearer_token=BEARER_TOKEN,
-    wait_on_rate_limit=True
-)
+# 待推进的检查点，须等对应推文真正落库后再写入
+pending_checkpoints = {}
+# 本轮有推文处理失败的账号，检查点不推进，下一轮从原位置重新抓取
+held_checkpoints = set()
+pending_checkpoints_lock = threading.Lock()
 
-client_mongo = MongoClient("mongodb://localhost:27017/")
-db = client_mongo["twitter_monitor"]
-collection = db["tweets"]
+# 多进程分析流水线，--workers 大于 0 时在启动时创建；为 None 时在抓取线程内直接分析
+analysis_pipeline = None
 
-# ⚠️ 缓存 user_id，避免多次请求 get_user()
-USER_ID_CACHE = {}
+# 自适应轮询调度，定时模式启动时创建；固定周期或流式模式下为 None
+poll_scheduler = None
 
-# ---------- 工具函数 ----------
+def init():
+    """建立 Twitter / MongoDB 客户端、索引与写后缓冲；重复调用时直接返回"""
+    global BEARER_TOKEN, rate_limiter, client_twitter, client_mongo, db, collection, checkpoints
+    global write_buffer, rollup_writer, dedup_index, user_resolver
+    if client_mongo is not None:
+        return
 
-def analyze_sentiment(text):
-    blob = TextBlob(text)
-    polarity = blob.sentiment.polarity
-    if polarity > 0.2:
-        return "正面"
-    elif polarity < -0.2:
-        return "负面"
-    else:
-        return "中性"
+    settings = get_settings()
+    BEARER_TOKEN = settings.twitter.get("BEARER_TOKEN")
+
+    # 输出防 emoji 报错
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+
+    # 检查API密钥
+    if BEARER_TOKEN == "your_bearer_token_here":
+        print("⚠️ 请在.env文件中配置TWITTER_BEARER_TOKEN")
+        print("❌ 请先配置Twitter API密钥")
+        sys.exit(1)
+
+    # 所有抓取线程共享同一个限流器
+    rate_limiter = RateLimiter()
+    client_twitter = RateLimitedClient(
+        bearer_token=BEARER_TOKEN,
+        wait_on_rate_limit=True,
+        rate_limiter=rate_limiter
+    )
+
+    # 数据库连接在启动时确定，修改连接配置需要重启
+    client_mongo = MongoClient(settings.mongodb.connection_string)
+    db = client_mongo[settings.mongodb.database_name]
+    collection = db[settings.mongodb.collection_name]
+    checkpoints = CheckpointStore(db)
+    ensure_indexes(db)
 
-def contains_black_swan_keywords(text):
-    text_lower = text.lower()
-    return any(kw.lower() in text_lower for kw in BLACK_SWAN_KEYWORDS)
+    # 推文写后缓冲：按批量/时间/轮次结束刷新
+    write_buffer = BulkWriteBuffer(
+        collection,
+        max_batch=settings.mongodb.bulk_batch_size,
+        max_interval=settings.mongodb.bulk_flush_seconds,
+        on_flushed=release_ids,
+        # 推文写入是按 id 的 $set upsert，连接出错时整批重放是安全的
+        replay_on_error=True
+    ).start()
+    # 小时/天汇总桶，随新推文增量更新
+    ensure_rollup_indexes(db)
+    rollup_writer = RollupWriter(
+        db,
+        max_batch=settings.mongodb.bulk_batch_size,
+        max_interval=settings.mongodb.bulk_flush_seconds
+    ).start()
+
+    if settings.dedup["ENABLED"]:
+        dedup_index = NearDuplicateIndex(
+            max_distance=settings.dedup["MAX_DISTANCE"],
+            window_hours=settings.dedup["WINDOW_HOURS"],
+            max_clusters=settings.dedup["MAX_CLUSTERS"],
+            min_features=settings.dedup.get("MIN_FEATURES", 4)
+        ).rebuild(collection)
+
+    ensure_user_id_indexes(db["user_ids"])
+    user_resolver = UserIdResolver(
+        client_twitter,
+        db["user_ids"],
+        ttl_hours=settings.fetch.user_id_ttl_hours,
+        negative_ttl_hours=settings.fetch.user_id_negative_ttl_hours
+    ).load()
+
+# ---------- 工具函数 ----------
 
 def safe_print(msg):
     try:
@@ -88,85 +140,516 @@ def safe_print(msg):
         print(msg.encode("utf-8", errors="ignore").decode("utf-8"))
 
 # ---------- 抓取单账号 ----------
-def fetch_user_tweets(username):
+def iter_new_tweet_pages(user_id, since_id):
+    """按 since_id 翻页抓取新推文，直到追平；无检查点时只取最新一页"""
+    fetch_config = get_settings().fetch
+    pagination_token = None
+    pages = 0
+    while True:
+        params = {
+            "id": user_id,
+            "max_results": fetch_config.page_size if since_id else fetch_config.max_tweets_per_person,
+            "tweet_fields": ["created_at", "text", "lang"],
+        }
+        if since_id:
+            params["since_id"] = since_id
+        if pagination_token:
+            params["pagination_token"] = pagination_token
+
+        response = client_twitter.get_users_tweets(**params)
+        if response.data:
+            yield response.data
+
+        pages += 1
+        pagination_token = (response.meta or {}).get("next_token")
+        if not since_id or not pagination_token or pages >= fetch_config.max_pages_per_fetch:
+            break
+
+def filter_unseen(raws):
+    """
+    去掉库中已存在或正在处理的推文，返回的推文 ID 记为已占用；
+    占用在推文写入 MongoDB 后（或处理失败时）通过 release_ids 撤销
+    """
+    with unflushed_lock:
+        claimed = []
+        for raw in raws:
+            if raw["id"] not in unflushed_ids:
+                unflushed_ids.add(raw["id"])
+                claimed.append(raw)
+    if not claimed:
+        return []
+    ids = [raw["id"] for raw in claimed]
+    try:
+        stored = {doc["id"] for doc in collection.find({"id": {"$in": ids}}, {"id": 1})}
+    except Exception:
+        release_ids(ids)
+        raise
+    release_ids(stored)
+    return [raw for raw in claimed if raw["id"] not in stored]
+
+def release_ids(ids):
+    """撤销 filter_unseen 的占用：推文已落库，或处理失败需要下次重新抓取"""
+    with unflushed_lock:
+        unflushed_ids.difference_update(ids)
+
+def tweet_to_raw(username, tweet):
+    """把 tweepy 推文对象转成可跨进程传递的原始 dict"""
+    return {
+        "id": tweet.id,
+        "created_at": tweet.created_at.isoformat(),
+        "text": tweet.text,
+        "author_id": tweet.author_id,
+        "username": username
+    }
+
+def store_analyzed_tweet(raw, analysis_result):
+    """写入分析结果并按需报警"""
+    tweet_dict = {
+        **raw,
+        # 保持向后兼容
+        "sentiment": analysis_result['sentiment_label'],
+        "black_swan": analysis_result['is_black_swan'],
+        # 新增字段
+        "sentiment_score": analysis_result['sentiment_score'],
+        "confidence": analysis_result['confidence'],
+        "risk_score": analysis_result['risk_score'],
+        "urgency_level": analysis_result['urgency_level'],
+        "alert_level": analysis_result['alert_level'],
+        "detected_categories": analysis_result['detected_categories'],
+        "analyzed_at": analysis_result['analyzed_at']
+    }
+
+    write_buffer.add(UpdateOne(
+        {"id": raw["id"]},
+        {"$set": tweet_dict},
+        upsert=True
+    ), key=raw["id"])
+    # 推文已交给写缓冲，重新抓取时会被过滤；之后的步骤失败只记录日志，不能靠保留检查点重试
     try:
-        # 从缓存中获取 user_id，避免重复请求
-        if username in USER_ID_CACHE:
-            user_id = USER_ID_CACHE[username]
+        # 只有新推文会走到这里（已存储或正在处理的在分析前已被过滤），汇总不会重复计数
+        rollup_writer.record(tweet_dict)
+        if dedup_index is not None:
+            dedup_index.record_analysis(raw, analysis_result)
+        if poll_scheduler is not None and raw.get("created_at"):
+            poll_scheduler.observe(raw["username"], raw["created_at"], analysis_result['is_black_swan'])
+        TWEETS_PROCESSED.inc()
+
+        # 检查是否需要发送警报
+        if analysis_result['is_black_swan']:
+            send_alert_if_needed(tweet_dict)
+    except Exception as e:
+        safe_print(f"❌ 推文入库后的汇总/报警失败（{raw['id']}）: {e}")
+
+    # 显示状态
+    if analysis_result['is_black_swan']:
+        flag = f"🚨 {analysis_result['alert_level']}"
+    else:
+        flag = "✅"
+    
+    msg = f"{flag} [{raw['created_at']}] {raw['username']}: {raw['text'][:60]}..."
+    safe_print(msg)
+
+def process_raw_tweets(raws):
+    """分析并存储一批原始推文，返回新推文条数；启用流水线时只负责入队"""
+    raws = filter_unseen(raws)
+    if not raws:
+        return 0
+
+    handed = set()  # 已交给写缓冲或流水线的推文，由它们负责撤销占用
+    try:
+        _process_unseen(raws, handed)
+    except Exception:
+        release_ids([raw["id"] for raw in raws if raw["id"] not in handed])
+        raise
+    return len(raws)
+
+def _process_unseen(raws, handed):
+    def store(raw, analysis_result):
+        store_analyzed_tweet(raw, analysis_result)
+        handed.add(raw["id"])
+
+    # 近重复推文复用所在簇的情感分析结果，黑天鹅检测按自己的文本重新计算
+    pending, reused = [], []
+    for raw in raws:
+        sentiment_result = dedup_index.assign(raw) if dedup_index is not None else None
+        if sentiment_result is not None:
+            reused.append((raw, sentiment_result))
         else:
-            user = client_twitter.get_user(username=username)
-            user_id = user.data.id
-            USER_ID_CACHE[username] = user_id
-
-        tweets = client_twitter.get_users_tweets(
-            id=user_id,
-            max_results=MAX_TWEETS_PER_PERSON,
-            tweet_fields=["created_at", "text", "lang"]
+            pending.append(raw)
+    if reused:
+        analysis_results = analyze_with_sentiment([raw["text"] for raw, _ in reused], [s for _, s in reused])
+        for (raw, _), analysis_result in zip(reused, analysis_results):
+            store(raw, analysis_result)
+
+    if analysis_pipeline is not None:
+        for raw in pending:
+            analysis_pipeline.submit(raw)
+            handed.add(raw["id"])
+        return
+
+    # 代表推文在本批内的簇成员，等代表推文分析完再复用其结果
+    batch_representatives = {raw["id"] for raw in pending if raw.get("is_cluster_representative")}
+    to_analyze = [raw for raw in pending
+                  if raw.get("is_cluster_representative") or raw.get("cluster_id") not in batch_representatives]
+    deferred = [raw for raw in pending
+                if not raw.get("is_cluster_representative") and raw.get("cluster_id") in batch_representatives]
+
+    # 整批推文一次性交给批量分析
+    analysis_results = analyze_tweets([raw["text"] for raw in to_analyze])
+    cluster_results = {}
+    for raw, analysis_result in zip(to_analyze, analysis_results):
+        store(raw, analysis_result)
+        if raw.get("is_cluster_representative"):
+            cluster_results[raw["cluster_id"]] = analysis_result
+    if deferred:
+        analysis_results = analyze_with_sentiment(
+            [raw["text"] for raw in deferred], [cluster_results[raw["cluster_id"]] for raw in deferred]
         )
+        for raw, analysis_result in zip(deferred, analysis_results):
+            store(raw, analysis_result)
+
+def process_tweet_page(username, tweets):
+    """分析并存储一页推文"""
+    return process_raw_tweets([tweet_to_raw(username, tweet) for tweet in tweets])
+
+@timed("fetch_user_tweets")
+def fetch_user_tweets(username, user_id=None):
+    """抓取单个账号的新推文，成功返回 True"""
+    try:
+        user_id = user_id or user_resolver.resolve(username)
+        if user_id is None:
+            # 不存在、被封禁或暂时无法解析，由解析缓存决定何时再试
+            return True
 
-        if tweets.data is None:
+        since_id = checkpoints.get(username)
+        processed = 0
+        for tweets in iter_new_tweet_pages(user_id, since_id):
+            processed += process_tweet_page(username, tweets)
+            newest_id = max(tweet.id for tweet in tweets)
+            with pending_checkpoints_lock:
+                pending_checkpoints[username] = max(newest_id, pending_checkpoints.get(username, 0))
+
+        if processed == 0:
             safe_print(f"⚠️ {username} 无新推文。")
-            return
-
-        for tweet in tweets.data:
-            # 使用增强的语义分析
-            analysis_result = analyze_tweet(tweet.text)
-            
-            tweet_dict = {
-                "id": tweet.id,
-                "created_at": tweet.created_at.isoformat(),
-                "text": tweet.text,
-                "author_id": tweet.author_id,
-                "username": username,
-                # 保持向后兼容
-                "sentiment": analysis_result['sentiment_label'],
-                "black_swan": analysis_result['is_black_swan'],
-                # 新增字段
-                "sentiment_score": analysis_result['sentiment_score'],
-                "confidence": analysis_result['confidence'],
-                "risk_score": analysis_result['risk_score'],
-                "urgency_level": analysis_result['urgency_level'],
-                "alert_level": analysis_result['alert_level'],
-                "detected_categories": analysis_result['detected_categories'],
-                "analyzed_at": analysis_result['analyzed_at']
-            }
-
-            collection.update_one(
-                {"id": tweet.id},
-                {"$set": tweet_dict},
-                upsert=True
-            )
-
-            # 检查是否需要发送警报
-            if analysis_result['is_black_swan']:
-                send_alert_if_needed(tweet_dict)
-
-            # 显示状态
-            if analysis_result['is_black_swan']:
-                flag = f"🚨 {analysis_result['alert_level']}"
-            else:
-                flag = "✅"
-            
-            msg = f"{flag} [{tweet.created_at}] {username}: {tweet.text[:60]}..."
-            safe_print(msg)
+        return True
 
     except Exception as e:
         safe_print(f"❌ 错误（{username}）: {e}")
+        with pending_checkpoints_lock:
+            held_checkpoints.add(username)
+        return False
 
 # ---------- 批量抓取 ----------
-def fetch_all_leaders():
+def get_priority(username, accounts=None):
+    account = (accounts if accounts is not None else get_settings().accounts).get(username)
+    return account.priority if account else "low"
+
+def build_tier_semaphores(usernames, max_workers, priority_weights, accounts=None):
+    """按优先级权重划分并发份额，每个档位至少一个槽"""
+    tiers = {get_priority(u, accounts) for u in usernames}
+    total_weight = sum(priority_weights.get(t, 1) for t in tiers) or 1
+    return {
+        tier: threading.Semaphore(max(1, round(max_workers * priority_weights.get(tier, 1) / total_weight)))
+        for tier in tiers
+    }
+
+def flush_cycle():
+    """
+    轮次结束：等流水线排空、刷新写缓冲，再推进本轮的检查点（有推文处理失败的账号除外）
+    返回检查点未推进的账号
+    """
+    held = set()
+    drained = True
+    if analysis_pipeline is not None:
+        wait_seconds = get_settings().fetch.analysis_wait_seconds
+        drained = analysis_pipeline.wait_idle(wait_seconds)
+        if not drained:
+            abandoned = analysis_pipeline.abandon()
+            release_ids([raw["id"] for raw in abandoned])
+            safe_print(f"❌ 分析流水线 {wait_seconds:g} 秒内未排空（{len(abandoned)} 条未完成），本轮不推进检查点")
+        failures = analysis_pipeline.take_failures()
+        release_ids([raw["id"] for raw in failures])
+        held.update(raw["username"] for raw in failures)
+    try:
+        write_buffer.flush()
+        rollup_writer.flush()
+    except Exception as e:
+        # 未写入的操作留在缓冲区，下次刷新重试
+        safe_print(f"❌ 写入 MongoDB 失败，本轮不推进检查点: {e}")
+        drained = False
+    with pending_checkpoints_lock:
+        advanced = dict(pending_checkpoints)
+        pending_checkpoints.clear()
+        held.update(held_checkpoints)
+        held_checkpoints.clear()
+    if not drained:
+        return held | set(advanced)
+    for username in sorted(held & set(advanced)):
+        safe_print(f"⚠️ {username} 有推文未能分析或写入，检查点保持不变，下一轮重新抓取")
+        del advanced[username]
+    for username, newest_id in advanced.items():
+        checkpoints.advance(username, newest_id)
+    return held
+
+def fetch_all_leaders(usernames=None):
+    """抓取一轮；usernames 为空时抓取配置中的全部账号。返回抓取失败的账号"""
     safe_print(f"\n🕐 {datetime.utcnow().isoformat()} 正在抓取推文...\n")
-    for username in LEADER_ACCOUNTS:
-        fetch_user_tweets(username)
-        safe_print(f"⏱ 已抓取 {username}，等待 {SLEEP_BETWEEN_USERS} 秒...\n")
-        time.sleep(SLEEP_BETWEEN_USERS)
+    # 整轮使用同一份配置快照，中途热更新从下一轮开始生效
+    current = get_settings()
+    accounts = current.accounts
+    weights = current.fetch.priority_weights
+    # 高优先级账号先提交
+    usernames = sorted(
+        usernames if usernames is not None else accounts,
+        key=lambda u: -weights.get(get_priority(u, accounts), 1)
+    )
+    max_workers = current.fetch.max_workers
+    semaphores = build_tier_semaphores(usernames, max_workers, weights, accounts)
+    # 缺失的 user_id 整批解析（每 100 个一次请求），解析不到的账号本轮跳过
+    user_ids = user_resolver.resolve_many(usernames)
+    skipped = [username for username in usernames if username not in user_ids]
+    if skipped:
+        safe_print(f"⏭ 跳过无法解析的账号: {', '.join(skipped)}")
+    usernames = [username for username in usernames if username in user_ids]
+
+    def fetch_with_share(username):
+        with semaphores[get_priority(username, accounts)]:
+            return username, fetch_user_tweets(username, user_ids[username])
+
+    started = time.monotonic()
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(fetch_with_share, u) for u in usernames]
+        for future in as_completed(futures):
+            username, ok = future.result()
+            if not ok:
+                failed.append(username)
+            safe_print(f"⏱ 已抓取 {username}\n")
+    # 检查点未推进的账号同样视为失败，多节点模式下释放租约以便尽快重试
+    failed.extend(sorted(set(flush_cycle()) & set(usernames) - set(failed)))
+    safe_print(f"✅ 本轮抓取完成，用时 {time.monotonic() - started:.1f} 秒")
+    cache_stats = get_cache_stats()
+    if cache_stats:
+        safe_print(
+            f"🗂 分析缓存: 命中 {cache_stats['hits'] + cache_stats['persistent_hits']} / "
+            f"未命中 {cache_stats['misses']}（命中率 {cache_stats['hit_rate']:.1%}）"
+        )
+    if dedup_index is not None:
+        dedup_stats = dedup_index.stats
+        safe_print(
+            f"🧬 近重复: 新簇 {dedup_stats['clusters']} / 近重复 {dedup_stats['duplicates']}"
+            f"（复用情感分析 {dedup_stats['reused']}）/ 特征过少未聚类 {dedup_stats['skipped']}"
+        )
+    return failed
+
+def fetch_added_accounts(new, old):
+    """配置热更新新增了账号时，立即在后台抓取一轮这些账号，不等下一个周期"""
+    added = sorted(set(new.accounts) - set(old.accounts))
+    if not added:
+        return
+    safe_print(f"➕ 新增监控账号: {', '.join(added)}")
+    threading.Thread(target=fetch_all_leaders, args=(added,), name="fetch-added-accounts", daemon=True).start()
+
+# ---------- 流式接收 ----------
+backfill_lock = threading.Lock()
+
+def backfill_after_gap():
+    """流式断线后在后台跑一轮轮询抓取，按 since_id 检查点补齐断线期间的推文"""
+    if not backfill_lock.acquire(blocking=False):
+        return  # 已有补抓在进行
+
+    def run():
+        try:
+            safe_print("🔁 流式连接中断过，开始轮询补抓...")
+            fetch_all_leaders()
+        finally:
+            backfill_lock.release()
+
+    threading.Thread(target=run, name="stream-backfill", daemon=True).start()
+
+def handle_stream_tweet(raw):
+    """流式推文直接进入 分析 → 存储 → 报警；不推进检查点，缺口由轮询补抓"""
+    if raw["username"] not in get_settings().accounts:
+        return
+    try:
+        process_raw_tweets([raw])
+    except Exception as e:
+        safe_print(f"❌ 流式推文处理失败（{raw.get('id')}）: {e}")
+
+def run_streaming(stream_url=None):
+    if stream_url:
+        source = ReplayStreamSource(stream_url)
+    else:
+        source = TwitterStreamSource(BEARER_TOKEN, get_settings().accounts)
+
+        def sync_stream_accounts(new, old):
+            if set(new.accounts) != set(old.accounts):
+                source.update_usernames(new.accounts)
+
+        on_reload(sync_stream_accounts)
+    # 启动时先轮询一次，补齐上次运行以来的推文
+    backfill_after_gap()
+    run_stream(source, handle_stream_tweet, backfill_after_gap)
 
 # ---------- 定时调度 ----------
-if __name__ == "__main__":
-    safe_print(f"📡 舆情监控启动，每 {FETCH_INTERVAL_HOURS} 小时执行一次...")
+def schedule_fetch(interval_hours):
+    """按间隔（小时）重建抓取任务，返回新任务"""
+    schedule.clear("fetch")
+    return schedule.every(interval_hours).hours.do(fetch_all_leaders).tag("fetch")
+
+def run_fixed_schedule():
+    """固定周期：所有账号每 FETCH_INTERVAL_HOURS 小时抓取一次"""
+    on_reload(fetch_added_accounts)
+    interval_hours = get_settings().fetch.fetch_interval_hours
+    safe_print(f"📡 舆情监控启动，每 {interval_hours} 小时执行一次...")
     fetch_all_leaders()  # 启动即执行一次
-    schedule.every(FETCH_INTERVAL_HOURS).hours.do(fetch_all_leaders)
+    schedule_fetch(interval_hours)
 
     while True:
         schedule.run_pending()
+        # 抓取间隔被热更新时，在主线程里重建任务（schedule 不是线程安全的）
+        if get_settings().fetch.fetch_interval_hours != interval_hours:
+            interval_hours = get_settings().fetch.fetch_interval_hours
+            schedule_fetch(interval_hours)
+            safe_print(f"🔄 抓取间隔已改为每 {interval_hours} 小时")
         time.sleep(10)
+
+def run_adaptive_schedule(max_sleep=60):
+    """自适应调度：只抓取已到期的账号；新增账号立即到期，黑天鹅推文后该账号加速轮询"""
+    global poll_scheduler
+    poll_scheduler = AdaptiveScheduler(get_settings()).rebuild(collection)
+    on_reload(lambda new, old: poll_scheduler.update_settings(new))
+
+    safe_print(f"📡 舆情监控启动（自适应调度，每小时 {poll_scheduler.budget():.1f} 次轮询）...")
+    for row in poll_scheduler.plan():
+        safe_print(f"   {row['username']}: 约 {row['tweets_per_day']} 条/天，每 {row['interval_minutes']} 分钟")
+
+    while True:
+        due = poll_scheduler.due()
+        if due:
+            try:
+                fetch_all_leaders(due)
+            finally:
+                poll_scheduler.done(due)
+        # 最多睡 max_sleep 秒，加速与配置变化能及时生效
+        wait = poll_scheduler.seconds_until_next()
+        time.sleep(max(1.0, min(max_sleep, wait if wait is not None else max_sleep)))
+
+def run_coordinated_schedule(max_sleep=30):
+    """
+    多节点：账号按一致性哈希分给存活的工作进程，各进程只调度自己负责的账号；
+    抓取前在共享租约表上占用本周期，保证每个账号每个周期只被一个进程抓取
+    """
+    global poll_scheduler
+    ensure_coordination_indexes(db)
+    coordinator = Coordinator(db, config=get_settings().coordination).start()
+    poll_scheduler = AdaptiveScheduler(get_settings()).rebuild(collection)
+    on_reload(lambda new, old: poll_scheduler.update_settings(new))
+    safe_print(f"📡 舆情监控启动（多节点，工作进程 {coordinator.worker_id}，"
+               f"当前 {len(coordinator.ring.nodes)} 个节点）...")
+
+    try:
+        while True:
+            intervals = poll_scheduler.intervals()
+            due = poll_scheduler.due(accept=coordinator.owns)
+            claimed = {}
+            for username in due:
+                started = datetime.utcnow()
+                # 带上当前间隔：加速中的账号不必等到上次完成时记录的到期时间
+                interval = intervals.get(username, 3600)
+                epoch = coordinator.claim(username, started, interval)
+                if epoch is None:
+                    # 本周期已由其他进程抓取（或正在抓取），按共享的到期时间推迟
+                    poll_scheduler.postpone(username, coordinator.next_due(username, interval))
+                else:
+                    claimed[username] = (epoch, started)
+            poll_scheduler.done([username for username in due if username not in claimed])
+
+            if claimed:
+                failed = set()
+                try:
+                    failed = set(fetch_all_leaders(list(claimed)))
+                finally:
+                    # 推文落库、检查点推进之后才提交完成；失败的账号释放租约，允许重试
+                    for username, (epoch, started) in claimed.items():
+                        if username in failed:
+                            coordinator.release(username, epoch)
+                        else:
+                            coordinator.complete(username, epoch, intervals.get(username, 3600), started)
+                    poll_scheduler.done(claimed)
+
+            wait = poll_scheduler.seconds_until_next(accept=coordinator.owns)
+            time.sleep(max(1.0, min(max_sleep, wait if wait is not None else max_sleep)))
+    finally:
+        coordinator.stop()
+
+if __name__ == "__main__":
+    import argparse
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="推特舆情定时抓取")
+    parser.add_argument("--no-bert", action="store_true", help="轻量模式：不加载 BERT，仅用 TextBlob/VADER")
+    parser.add_argument(
+        "--workers", type=int, default=settings.fetch.analysis_workers,
+        help="分析进程数，0 表示在抓取线程内直接分析"
+    )
+    parser.add_argument("--stream", action="store_true", help="流式接收模式（filtered stream），断线时轮询补抓")
+    parser.add_argument("--stream-url", help="从本地回放服务器读取推文流（配合 流式抓取.py 使用）")
+    parser.add_argument("--coordinated", action="store_true",
+                        help="多节点模式：与其他抓取进程通过 MongoDB 分摊账号（也可在 COORDINATION_CONFIG 中开启）")
+    args = parser.parse_args()
+    init()
+    if args.no_bert:
+        set_lightweight_mode(True)
+
+    # 配置文件变化时热更新关键词、账号与抓取参数
+    get_config_center().start_watching()
+
+    if settings.metrics["ENABLED"]:
+        try:
+            metrics_server = start_metrics_server(settings.metrics["HOST"], settings.metrics["PORT"])
+        except OSError as e:
+            safe_print(f"⚠️ 监控指标端口 {settings.metrics['PORT']} 起的端口均不可用，不暴露 /metrics: {e}")
+        else:
+            host, port = metrics_server.server_address[:2]
+            if port != settings.metrics["PORT"]:
+                safe_print(f"⚠️ 端口 {settings.metrics['PORT']} 已被占用（可能有其他抓取进程），改用 {port}")
+            safe_print(f"📈 监控指标: http://{host}:{port}/metrics")
+
+    if args.workers > 0:
+        analysis_pipeline = AnalysisPipeline(
+            store_analyzed_tweet,
+            workers=args.workers,
+            queue_size=settings.fetch.analysis_queue_size,
+            batch_size=settings.sentiment["BATCH_SIZE"],
+            lightweight=args.no_bert
+        ).start()
+
+        def graceful_shutdown(signum, frame):
+            safe_print("🛑 正在关闭分析流水线...")
+            analysis_pipeline.shutdown()
+            write_buffer.close()
+            rollup_writer.flush()
+            # 未发出的警报留在发件箱中，下次启动继续发送
+            shutdown_alert_system()
+            sys.exit(0)
+
+        signal.signal(signal.SIGTERM, graceful_shutdown)
+        signal.signal(signal.SIGINT, graceful_shutdown)
+        safe_print(f"🧵 已启动 {args.workers} 个分析进程")
+    else:
+        # 模型在后台加载，与首轮 user_id 解析等网络请求并行
+        warm_up(background=True)
+
+    if args.stream or args.stream_url:
+        safe_print("📡 舆情监控启动（流式模式）...")
+        on_reload(fetch_added_accounts)
+        run_streaming(args.stream_url)
+        sys.exit(0)
+
+    if args.coordinated or get_settings().coordination.get("ENABLED"):
+        run_coordinated_schedule()
+    elif get_settings().scheduler.get("ENABLED"):
+        run_adaptive_schedule()
+    else:
+        run_fixed_schedule()
@@ -0,0 +1,266 @@
+"""
+自适应调度模块
+按账号估计发推频率（已存储推文的 created_at，指数衰减加权），乘以优先级权重后
+在共享的轮询预算内分配各账号的轮询频率：频率 ∝ √(权重 × 发推频率)，
+使加权平均发现延迟最小；出现黑天鹅推文的账号在一段时间内需求乘以 BOOST_FACTOR，
+从其他账号处匀出预算加密轮询，总轮询次数不变（只有保底间隔会突破预算）
+
+推导：发推近似泊松过程，轮询间隔 T 时新推文平均等待 T/2，
+在 Σf = 预算 的约束下最小化 Σ wλ/(2f)，拉格朗日条件给出 f ∝ √(wλ)
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from 监控指标 import REGISTRY
+
+DEFAULT_SCHEDULER_CONFIG = {
+    "POLL_BUDGET_PER_HOUR": None,  # 每小时轮询次数上限，None 表示与固定周期（账号数 / 抓取间隔）相同
+    "MIN_INTERVAL_MINUTES": 5,  # 单账号最短轮询间隔
+    "MAX_INTERVAL_HOURS": 6,  # 单账号最长轮询间隔，再不活跃的账号也保证按此频率检查
+    "BOOST_MINUTES": 60,  # 黑天鹅推文后加速轮询的时长
+    "BOOST_FACTOR": 16,  # 加速期间需求的倍数（轮询频率约为 √16 = 4 倍）
+    "HALF_LIFE_DAYS": 7,  # 发推频率估计的衰减半衰期
+    "PRIOR_TWEETS_PER_DAY": 2,  # 历史不足时的先验发推频率
+    "PRIOR_HOURS": 24  # 先验相当于多少小时的观测
+}
+
+POLL_INTERVAL = REGISTRY.gauge(
+    "politweet_poll_interval_seconds", "自适应调度分配的轮询间隔", labels=("username",)
+)
+POSTING_RATE = REGISTRY.gauge(
+    "politweet_posting_rate_per_hour", "估计的账号发推频率（条/小时）", labels=("username",)
+)
+
+
+def to_timestamp(value):
+    """created_at（ISO 字符串或 datetime）→ UTC 秒级时间戳"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def sqrt_allocation(demands, budget, f_min, f_max):
+    """
+    在 [f_min, f_max] 范围内按 f = c·√d 分配总量 budget，二分求 c
+    预算不足以让每个账号达到 f_min 时全部取 f_min（保底检查优先于预算）
+    """
+    if not demands:
+        return {}
+    roots = {key: math.sqrt(max(demand, 0.0)) for key, demand in demands.items()}
+
+    def total(c):
+        return sum(min(f_max, max(f_min, c * root)) for root in roots.values())
+
+    if total(0.0) >= budget:
+        return {key: f_min for key in roots}
+    low, high = 0.0, 1.0
+    while total(high) < budget and high < 1e12:
+        high *= 2
+    for _ in range(60):
+        mid = (low + high) / 2
+        if total(mid) < budget:
+            low = mid
+        else:
+            high = mid
+    return {key: min(f_max, max(f_min, high * root)) for key, root in roots.items()}
+
+
+class PostingRateEstimator:
+    def __init__(self, half_life_hours, prior_rate, prior_hours):
+        """
+        每个账号维护衰减计数 score（每条推文贡献 e^(-age/τ)）与观测起点，
+        频率 = (score + 先验条数) / (τ·(1 - e^(-跨度/τ)) + 先验小时数)
+        没有任何推文的账号从估计器创建时开始计算跨度，频率随时间降到先验以下
+        """
+        self.tau = half_life_hours / math.log(2)
+        self.prior_rate = prior_rate
+        self.prior_hours = prior_hours
+        self.started = time.time()
+        self.accounts = {}  # 用户名 → {"score", "ref", "first"}
+
+    def observe(self, username, created_at):
+        ts = to_timestamp(created_at)
+        state = self.accounts.setdefault(username, {"score": 0.0, "ref": ts, "first": ts})
+        if ts > state["ref"]:
+            state["score"] *= math.exp(-(ts - state["ref"]) / 3600 / self.tau)
+            state["ref"] = ts
+            state["score"] += 1.0
+        else:
+            state["score"] += math.exp(-(state["ref"] - ts) / 3600 / self.tau)
+        state["first"] = min(state["first"], ts)
+
+    def rate(self, username, now=None):
+        """估计的发推频率（条/小时）"""
+        now = now or time.time()
+        prior_count = self.prior_rate * self.prior_hours
+        state = self.accounts.get(username, {"score": 0.0, "ref": now, "first": self.started})
+        score = state["score"] * math.exp(-max(0.0, now - state["ref"]) / 3600 / self.tau)
+        span = max(0.0, now - min(state["first"], self.started)) / 3600
+        exposure = self.tau * (1 - math.exp(-span / self.tau))
+        return (score + prior_count) / (exposure + self.prior_hours)
+
+
+class AdaptiveScheduler:
+    def __init__(self, settings):
+        """settings: 配置中心的 Settings；账号、权重与调度参数在每次规划时从最新配置读取"""
+        self.settings = settings
+        self.config = {**DEFAULT_SCHEDULER_CONFIG, **settings.scheduler}
+        self.estimator = PostingRateEstimator(
+            self.config["HALF_LIFE_DAYS"] * 24,
+            self.config["PRIOR_TWEETS_PER_DAY"] / 24,
+            self.config["PRIOR_HOURS"]
+        )
+        self.last_polled = {}  # 用户名 → 上次开始轮询的时间戳
+        self.not_before = {}  # 用户名 → 最早可再次轮询的时间戳（多节点时由共享租约决定）
+        self.in_flight = set()
+        self.boosted_until = {}  # 用户名 → 加速截止时间戳
+        self.lock = threading.Lock()
+
+    def update_settings(self, settings):
+        """配置热更新：新账号下一次规划即到期，移除的账号不再调度"""
+        with self.lock:
+            self.settings = settings
+            self.config = {**DEFAULT_SCHEDULER_CONFIG, **settings.scheduler}
+
+    def rebuild(self, collection):
+        """从 tweets 集合中近期的推文估计各账号发推频率"""
+        lookback = timedelta(days=self.config["HALF_LIFE_DAYS"] * 4)
+        since = (datetime.utcnow() - lookback).isoformat()
+        cursor = collection.find(
+            {"username": {"$in": list(self.settings.accounts)}, "created_at": {"$gte": since}},
+            {"_id": 0, "username": 1, "created_at": 1}
+        )
+        with self.lock:
+            for doc in cursor:
+                if doc.get("created_at"):
+                    self.estimator.observe(doc["username"], doc["created_at"])
+        return self
+
+    def observe(self, username, created_at, black_swan=False):
+        """新推文入库时调用；黑天鹅推文使该账号进入加速轮询"""
+        with self.lock:
+            self.estimator.observe(username, created_at)
+            if black_swan:
+                self.boosted_until[username] = time.time() + self.config["BOOST_MINUTES"] * 60
+                # 之前按未加速的共享到期时间推迟过的账号，立即按加速后的间隔重新计算
+                self.not_before.pop(username, None)
+
+    def budget(self):
+        """每小时轮询预算；默认等于固定周期下的轮询次数，不额外消耗 API 额度"""
+        budget = self.config["POLL_BUDGET_PER_HOUR"]
+        if budget is None:
+            budget = len(self.settings.accounts) / self.settings.fetch.fetch_interval_hours
+        return budget
+
+    def intervals(self, now=None):
+        """各账号当前的轮询间隔（秒）：预算按 √(权重 × 频率 × 加速倍数) 分配"""
+        now = now or time.time()
+        with self.lock:
+            accounts = self.settings.accounts
+            weights = self.settings.fetch.priority_weights
+            f_max = 60 / self.config["MIN_INTERVAL_MINUTES"]
+            f_min = 1 / self.config["MAX_INTERVAL_HOURS"]
+            for username in [u for u, until in self.boosted_until.items() if until <= now]:
+                del self.boosted_until[username]
+
+            demands = {
+                username: (weights.get(account.priority, 1) * self.estimator.rate(username, now)
+                           * (self.config["BOOST_FACTOR"] if username in self.boosted_until else 1))
+                for username, account in accounts.items()
+            }
+            frequencies = sqrt_allocation(demands, self.budget(), f_min, f_max)
+
+        intervals = {username: 3600 / frequency for username, frequency in frequencies.items()}
+        for username, interval in intervals.items():
+            POLL_INTERVAL.set(interval, username=username)
+            POSTING_RATE.set(self.estimator.rate(username, now), username=username)
+        return intervals
+
+    def _next_due(self, username, interval):
+        return max(self.last_polled.get(username, 0) + interval, self.not_before.get(username, 0))
+
+    def due(self, now=None, accept=None):
+        """
+        已到期的账号（从未轮询过的账号立即到期），并标记为轮询中
+        accept: 只考虑 accept(username) 为真的账号（多节点时为本进程负责的账号）
+        """
+        now = now or time.time()
+        intervals = self.intervals(now)
+        with self.lock:
+            due = [
+                username for username, interval in intervals.items()
+                if username not in self.in_flight and (accept is None or accept(username))
+                and now >= self._next_due(username, interval)
+            ]
+            for username in due:
+                self.last_polled[username] = now
+                self.in_flight.add(username)
+        return due
+
+    def done(self, usernames):
+        with self.lock:
+            self.in_flight.difference_update(usernames)
+
+    def postpone(self, username, until):
+        """推迟账号的下一次轮询（until 为 datetime 或时间戳，None 表示不推迟）"""
+        if until is None:
+            return
+        with self.lock:
+            self.not_before[username] = until if isinstance(until, (int, float)) else to_timestamp(until)
+
+    def seconds_until_next(self, now=None, accept=None):
+        """距下一个账号到期的秒数"""
+        now = now or time.time()
+        intervals = self.intervals(now)
+        with self.lock:
+            waits = [
+                self._next_due(username, interval) - now
+                for username, interval in intervals.items()
+                if username not in self.in_flight and (accept is None or accept(username))
+            ]
+        return max(0.0, min(waits)) if waits else None
+
+    def plan(self, now=None):
+        """各账号的调度概况，用于启动日志与命令行预览"""
+        now = now or time.time()
+        intervals = self.intervals(now)
+        return [
+            {
+                "username": username,
+                "priority": self.settings.accounts[username].priority,
+                "tweets_per_day": round(self.estimator.rate(username, now) * 24, 2),
+                "interval_minutes": round(interval / 60, 1),
+                "boosted": username in self.boosted_until
+            }
+            for username, interval in sorted(intervals.items(), key=lambda item: item[1])
+        ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from pymongo import MongoClient
+
+    from 配置中心 import get_settings
+
+    parser = argparse.ArgumentParser(description="预览自适应调度分配的轮询间隔")
+    parser.add_argument("--budget", type=float, help="每小时轮询预算（默认取配置）")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    scheduler = AdaptiveScheduler(settings)
+    if args.budget is not None:
+        scheduler.config["POLL_BUDGET_PER_HOUR"] = args.budget
+    db = MongoClient(settings.mongodb.connection_string)[settings.mongodb.database_name]
+    scheduler.rebuild(db[settings.mongodb.collection_name])
+
+    print(f"📅 轮询预算: 每小时 {scheduler.budget():.1f} 次")
+    for row in scheduler.plan():
+        flag = "🚨" if row["boosted"] else "  "
+        print(f"{flag} {row['username']:<20} {row['priority']:<7} "
+              f"约 {row['tweets_per_day']:>6} 条/天  每 {row['interval_minutes']:>6} 分钟")
@@ -0,0 +1,433 @@
+"""
+警报分发模块
+以 alerts 集合作为持久化发件箱：抓取流程只写入 pending 记录，
+后台分发线程认领记录并通过复用的 SMTP 连接与 HTTP 连接池发送，失败按指数退避重试，
+同时积压多条时合并为一封摘要发送
+状态流转: pending → sending → sent / failed
+"""
+
+import json
+import logging
+import smtplib
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from 监控指标 import ALERTS_SENT, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DISPATCH_CONFIG = {
+    "poll_seconds": 2,  # 发件箱为空时的轮询间隔
+    "batch_size": 20,  # 每轮最多认领的记录数
+    "digest_threshold": 3,  # 一轮认领数达到该值时合并为摘要发送
+    "max_attempts": 5,  # 超过后标记为 failed
+    "backoff_seconds": 30,  # 首次重试等待，之后每次翻倍
+    "max_backoff_seconds": 1800,
+    "lease_seconds": 300,  # sending 状态超过该时长视为分发进程已崩溃，重新认领
+    "smtp_idle_seconds": 60,  # SMTP 连接空闲超过该时长后关闭
+    "timeout_seconds": 10
+}
+
+
+def enabled_channels(config):
+    return [channel for channel in ("email", "webhook") if config.get(channel, {}).get("enabled")]
+
+
+def webhook_payload(alert_record):
+    return {
+        "alert_level": alert_record['alert_level'],
+        "title": alert_record['title'],
+        "message": alert_record['message'],
+        "risk_score": alert_record['risk_score'],
+        "username": alert_record['username'],
+        "timestamp": alert_record['created_at']
+    }
+
+
+def retry_delay(attempts, base, cap):
+    """第 attempts 次失败后的等待秒数"""
+    return min(base * 2 ** (attempts - 1), cap)
+
+
+class AlertTransport:
+    def __init__(self, config, timeout=10, smtp_idle_seconds=60):
+        """
+        复用连接的发送通道
+        webhook: 带连接池的 requests.Session
+        email: 保持一个已登录的 SMTP 连接，空闲超时或断开后再重连
+        """
+        self.config = config
+        self.timeout = timeout
+        self.smtp_idle_seconds = smtp_idle_seconds
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.smtp = None
+        self.smtp_used_at = 0.0
+
+    def send(self, channel, records):
+        """发送一条或一组（摘要）警报，失败时抛出异常"""
+        senders = {"email": self._send_email, "webhook": self._send_webhook}
+        if channel not in senders:
+            raise ValueError(f"未知的警报通道: {channel}")
+        try:
+            senders[channel](records)
+        except Exception:
+            ALERTS_SENT.inc(channel=channel, result="error")
+            raise
+        ALERTS_SENT.inc(channel=channel, result="ok")
+
+    @timed("send_webhook")
+    def _send_webhook(self, records):
+        webhook_config = self.config['webhook']
+        if len(records) == 1:
+            payload = webhook_payload(records[0])
+        else:
+            payload = {
+                "digest": True,
+                "count": len(records),
+                "title": f"🚨 警报摘要: {len(records)} 条",
+                "alerts": [webhook_payload(record) for record in records]
+            }
+        headers = dict(webhook_config.get('headers', {}))
+        headers['Content-Type'] = 'application/json'
+        response = self.session.post(webhook_config['url'], json=payload, headers=headers, timeout=self.timeout)
+        if response.status_code >= 300:
+            raise RuntimeError(f"Webhook 返回 HTTP {response.status_code}")
+
+    @timed("send_email")
+    def _send_email(self, records):
+        email_config = self.config['email']
+        msg = MIMEMultipart()
+        msg['From'] = email_config['username']
+        msg['To'] = ', '.join(email_config['recipients'])
+        if len(records) == 1:
+            msg['Subject'] = records[0]['title']
+            body = records[0]['message']
+        else:
+            msg['Subject'] = f"🚨 警报摘要: {len(records)} 条"
+            body = ("\n" + "-" * 40 + "\n").join(record['message'] for record in records)
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+
+        text = msg.as_string()
+        try:
+            self._smtp_connection().sendmail(email_config['username'], email_config['recipients'], text)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout):
+            # 复用的连接已被服务器关闭，重连后再试一次
+            self.close_smtp()
+            self._smtp_connection().sendmail(email_config['username'], email_config['recipients'], text)
+        self.smtp_used_at = time.monotonic()
+
+    def _smtp_connection(self):
+        if self.smtp is not None and time.monotonic() - self.smtp_used_at > self.smtp_idle_seconds:
+            self.close_smtp()
+        if self.smtp is None:
+            email_config = self.config['email']
+            server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'], timeout=self.timeout)
+            if email_config.get('starttls', True):
+                server.starttls()
+            if email_config.get('password'):
+                server.login(email_config['username'], email_config['password'])
+            self.smtp = server
+            self.smtp_used_at = time.monotonic()
+        return self.smtp
+
+    def close_smtp(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except Exception:
+                pass
+            self.smtp = None
+
+    def close(self):
+        self.close_smtp()
+        self.session.close()
+
+
+class AlertDispatcher:
+    def __init__(self, collection, config, transport=None):
+        """
+        collection: alerts 集合（发件箱）
+        config: 警报配置（email / webhook / dispatch）
+        """
+        self.collection = collection
+        self.config = config
+        self.options = dict(DEFAULT_DISPATCH_CONFIG, **config.get('dispatch', {}))
+        self.transport = transport or AlertTransport(
+            config,
+            timeout=self.options['timeout_seconds'],
+            smtp_idle_seconds=self.options['smtp_idle_seconds']
+        )
+        self.worker_id = f"{socket.gethostname()}:{id(self)}"
+        self.wakeup = threading.Event()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"sent": 0, "retried": 0, "failed": 0, "digests": 0}
+
+    def enqueue(self, alert_record):
+        """写入发件箱，立即返回；由后台线程发送"""
+        channels = enabled_channels(self.config)
+        if not channels:
+            return False
+        now = datetime.now()
+        alert_record.update({
+            "status": "pending",
+            "channels": channels,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "queued_at": now
+        })
+        self.collection.insert_one(alert_record)
+        self.wakeup.set()
+        return True
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self, timeout=10):
+        self.stop_event.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.transport.close()
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            try:
+                records = self.claim_batch()
+                if records:
+                    self.dispatch(records)
+                    continue
+            except Exception as e:
+                logger.error(f"警报分发出错: {e}")
+            # 空闲时关掉 SMTP 连接，不占用服务器资源
+            if time.monotonic() - self.transport.smtp_used_at > self.options['smtp_idle_seconds']:
+                self.transport.close_smtp()
+            self.wakeup.wait(self.options['poll_seconds'])
+            self.wakeup.clear()
+
+    def claim_batch(self):
+        """逐条原子认领到期的 pending 记录（及租约过期的 sending 记录）"""
+        from pymongo import ReturnDocument
+
+        now = datetime.now()
+        stale = now - timedelta(seconds=self.options['lease_seconds'])
+        records = []
+        while len(records) < self.options['batch_size']:
+            record = self.collection.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "claimed_at": {"$lt": stale}}
+                ]},
+                {"$set": {"status": "sending", "claimed_at": now, "claimed_by": self.worker_id}},
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER
+            )
+            if record is None:
+                break
+            records.append(record)
+        return records
+
+    def dispatch(self, records):
+        """按通道发送；积压达到阈值时整批合并为摘要"""
+        digest = len(records) >= self.options['digest_threshold']
+        if digest:
+            self.stats["digests"] += 1
+            logger.info(f"积压 {len(records)} 条警报，合并为摘要发送")
+
+        failures = {}  # 记录 _id → (未成功的通道, 错误信息)
+        channels = sorted({channel for record in records for channel in record.get("channels", [])})
+        for channel in channels:
+            targets = [record for record in records if channel in record.get("channels", [])]
+            groups = [targets] if digest else [[record] for record in targets]
+            for group in groups:
+                try:
+                    self.transport.send(channel, group)
+                except Exception as e:
+                    logger.error(f"{channel} 警报发送失败: {e}")
+                    for record in group:
+                        failed, _ = failures.get(record["_id"], ([], None))
+                        failures[record["_id"]] = (failed + [channel], f"{channel}: {e}")
+
+        for record in records:
+            if record["_id"] in failures:
+                failed_channels, error = failures[record["_id"]]
+                self._mark_failed(record, failed_channels, error)
+            else:
+                self._mark_sent(record)
+
+    def _mark_sent(self, record):
+        self.collection.update_one(
+            {"_id": record["_id"]},
+            {"$set": {"status": "sent", "sent_at": datetime.now().isoformat()},
+             "$unset": {"claimed_at": "", "claimed_by": ""}}
+        )
+        self.stats["sent"] += 1
+        logger.info(f"警报已发送: {record.get('title')}")
+
+    def _mark_failed(self, record, failed_channels, error):
+        """只重试失败的通道；超过最大次数后标记为 failed"""
+        attempts = record.get("attempts", 0) + 1
+        update = {"attempts": attempts, "channels": failed_channels, "last_error": error}
+        if attempts >= self.options['max_attempts']:
+            update["status"] = "failed"
+            self.stats["failed"] += 1
+            logger.error(f"警报重试 {attempts} 次后放弃: {record.get('title')}")
+        else:
+            delay = retry_delay(attempts, self.options['backoff_seconds'], self.options['max_backoff_seconds'])
+            update["status"] = "pending"
+            update["next_attempt_at"] = datetime.now() + timedelta(seconds=delay)
+            self.stats["retried"] += 1
+        self.collection.update_one(
+            {"_id": record["_id"]},
+            {"$set": update, "$unset": {"claimed_at": "", "claimed_by": ""}}
+        )
+
+
+def ensure_outbox_indexes(collection):
+    collection.create_index([("status", 1), ("next_attempt_at", 1)])
+
+
+# ---------- 本地替身服务器（发送通道自检） ----------
+
+class _StandInSMTPHandler:
+    """极简 SMTP 服务端，只记录收到的邮件，不支持 STARTTLS"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    def __call__(self, conn):
+        reader = conn.makefile("rb")
+        conn.sendall(b"220 stand-in ESMTP\r\n")
+        in_data = False
+        lines = []
+        for raw in reader:
+            line = raw.decode("utf-8", "replace").rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    self.messages.append("\n".join(lines))
+                    lines = []
+                    in_data = False
+                    conn.sendall(b"250 OK\r\n")
+                else:
+                    lines.append(line)
+                continue
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                conn.sendall(b"250 stand-in\r\n")
+            elif command == "DATA":
+                in_data = True
+                conn.sendall(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+            elif command == "QUIT":
+                conn.sendall(b"221 Bye\r\n")
+                break
+            else:
+                conn.sendall(b"250 OK\r\n")
+        conn.close()
+
+
+def _serve_smtp(messages):
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen()
+    handler = _StandInSMTPHandler(messages)
+
+    def accept_loop():
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=handler, args=(conn,), daemon=True).start()
+
+    threading.Thread(target=accept_loop, daemon=True).start()
+    return server.getsockname()[1]
+
+
+def _serve_webhook(received, fail_first=1):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    state = {"remaining_failures": fail_first}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if state["remaining_failures"] > 0:
+                state["remaining_failures"] -= 1
+                status = 503
+            else:
+                received.append(json.loads(body))
+                status = 200
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd.server_address[1]
+
+
+def self_check():
+    """用本地替身 SMTP / HTTP 服务器检查发送通道：单条、摘要、失败后重试、SMTP 连接复用"""
+    mails, hooks = [], []
+    config = {
+        "email": {"enabled": True, "smtp_server": "127.0.0.1", "smtp_port": _serve_smtp(mails),
+                  "username": "alerts@example.com", "password": "", "recipients": ["ops@example.com"],
+                  "starttls": False},
+        "webhook": {"enabled": True, "url": f"http://127.0.0.1:{_serve_webhook(hooks)}/hook", "headers": {}}
+    }
+    transport = AlertTransport(config, timeout=5)
+    records = [
+        {"title": f"🚨 红色警报: user{i}", "message": f"测试消息 {i}", "alert_level": "红色",
+         "risk_score": 80, "username": f"user{i}", "created_at": datetime.now().isoformat()}
+        for i in range(3)
+    ]
+
+    results = []
+    try:
+        transport.send("webhook", records[:1])
+        results.append(("webhook 失败时抛出异常", False))
+    except RuntimeError:
+        results.append(("webhook 失败时抛出异常", True))
+    transport.send("webhook", records[:1])
+    transport.send("webhook", records)
+    results.append(("webhook 重试后送达", len(hooks) == 2 and hooks[0]["username"] == "user0"))
+    results.append(("webhook 摘要", hooks[-1].get("digest") is True and hooks[-1]["count"] == 3))
+
+    transport.send("email", records[:1])
+    first_connection = transport.smtp
+    transport.send("email", records)
+    results.append(("SMTP 连接复用", transport.smtp is first_connection))
+    results.append(("邮件送达", len(mails) == 2 and "user2" in mails[-1]))
+    results.append(("退避时长翻倍且有上限", [retry_delay(n, 30, 100) for n in (1, 2, 3)] == [30, 60, 100]))
+    transport.close()
+
+    for name, ok in results:
+        print(f"{'✅' if ok else '❌'} {name}")
+    return all(ok for _, ok in results)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="警报分发")
+    parser.add_argument("--self-check", action="store_true", help="用本地替身 SMTP / HTTP 服务器检查发送通道")
+    args = parser.parse_args()
+
+    if args.self_check:
+        raise SystemExit(0 if self_check() else 1)
+    parser.print_help()
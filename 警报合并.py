@@ -0,0 +1,244 @@
+"""
+警报合并模块
+危机期间多位领导人会在几分钟内就同一事件发推；按文本相似度（SimHash）与风险类别重合度
+把时间窗口内的候选警报归入同一个事件（incidents 集合），每个事件只发送首条警报，
+之后仅在级别升高或相关推文数达到阈值时发送升级通知；
+通知被冷却/限流拦下时事件保持待通知状态，由下一条相关推文重试
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from 文本指纹 import SimHashIndex, from_hex, hamming, simhash, to_hex
+
+logger = logging.getLogger(__name__)
+
+LEVEL_RANK = {"绿色": 0, "黄色": 1, "橙色": 2, "红色": 3}
+
+DEFAULT_COALESCING_CONFIG = {
+    "enabled": True,
+    "window_minutes": 30,  # 事件在最后一条相关推文之后保持打开的时长
+    "max_distance": 6,  # 汉明距离不超过该值视为同一文本的转述/转发
+    "loose_distance": 20,  # 风险类别高度重合时放宽的文本距离
+    "category_overlap": 0.5,  # 风险类别 Jaccard 重合度下限
+    "escalate_counts": [5, 20, 50],  # 相关推文数达到这些值时发送升级通知
+    "max_members": 200  # 事件记录中保留的最近成员推文数
+}
+
+
+def category_names(detected_categories):
+    return {cat["category"] if isinstance(cat, dict) else cat for cat in detected_categories or []}
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class IncidentCoalescer:
+    def __init__(self, collection, config=None):
+        """
+        collection: incidents 集合
+        打开中的事件同时保存在内存（指纹索引 + 类别倒排）与 MongoDB，进程重启时从集合重建
+        """
+        self.collection = collection
+        self.options = dict(DEFAULT_COALESCING_CONFIG, **(config or {}))
+        self.window = timedelta(minutes=self.options["window_minutes"])
+        self.index = SimHashIndex(max_distance=self.options["max_distance"])
+        self.incidents = {}
+        self.by_category = {}
+        self.lock = threading.Lock()
+
+    def rebuild(self, now=None):
+        now = now or datetime.now()
+        with self.lock:
+            self.incidents.clear()
+            self.by_category.clear()
+            self.index = SimHashIndex(max_distance=self.options["max_distance"])
+            for doc in self.collection.find({"status": "open", "last_seen": {"$gte": now - self.window}}):
+                member_count = doc.get("member_count", 0)
+                self._remember(doc["_id"], {
+                    "fingerprint": from_hex(doc["fingerprint"]),
+                    "categories": set(doc.get("categories", [])),
+                    "alert_level": doc.get("alert_level", "绿色"),
+                    "member_count": member_count,
+                    "usernames": set(doc.get("usernames", [])),
+                    "last_seen": doc["last_seen"],
+                    # 没有这些字段的旧记录在打开时即已通知
+                    "notified": doc.get("notified", True),
+                    "notified_level": doc.get("notified_level", doc.get("alert_level", "绿色")),
+                    "notified_milestone": doc.get("notified_milestone", self._milestone(member_count)),
+                    "pending": False
+                })
+        return self
+
+    def observe(self, tweet_data, alert_level, now=None):
+        """
+        把一条候选警报归入事件（新事件或已有事件），返回是否需要通知：
+        {"action": "new" | "escalate" | "absorb", "incident_id", "member_count", "usernames", "alert_level"}
+        new/escalate 表示已为调用方预留本次通知：警报真正入队后调用 mark_notified()，
+        被冷却/限流拦下或入队失败时调用 release()，事件的下一条相关推文会再次尝试通知
+        """
+        now = now or datetime.now()
+        fingerprint = simhash(tweet_data.get("text", ""))
+        categories = category_names(tweet_data.get("detected_categories"))
+        username = tweet_data.get("username", "")
+        member = {
+            "tweet_id": tweet_data.get("id", ""),
+            "username": username,
+            "alert_level": alert_level,
+            "risk_score": tweet_data.get("risk_score", 0),
+            "text": tweet_data.get("text", "")[:280],
+            "seen_at": now
+        }
+
+        with self.lock:
+            expired = self._expire(now)
+            incident_id = self._match(fingerprint, categories)
+            opened = incident_id is None
+            if opened:
+                incident_id = ObjectId()
+                self._remember(incident_id, {
+                    "fingerprint": fingerprint,
+                    "categories": set(categories),
+                    "alert_level": alert_level,
+                    "member_count": 0,
+                    "usernames": set(),
+                    "last_seen": now,
+                    "notified": False,
+                    "notified_level": None,
+                    "notified_milestone": 0,
+                    "pending": False
+                })
+
+            state = self.incidents[incident_id]
+            state["member_count"] += 1
+            state["usernames"].add(username)
+            state["last_seen"] = now
+            level_raised = LEVEL_RANK.get(alert_level, 0) > LEVEL_RANK.get(state["alert_level"], 0)
+            if level_raised:
+                state["alert_level"] = alert_level
+            for category in categories - state["categories"]:
+                state["categories"].add(category)
+                self.by_category.setdefault(category, set()).add(incident_id)
+            action = self._decide(state)
+            if action != "absorb":
+                state["pending"] = True
+            decision = {
+                "action": action,
+                "incident_id": incident_id,
+                "member_count": state["member_count"],
+                "usernames": sorted(state["usernames"]),
+                "alert_level": state["alert_level"]
+            }
+
+        # 数据库写入都在锁外进行；每次写入都是 upsert 且只用可交换的操作符，先后顺序不影响结果
+        self._close(expired)
+        update = {
+            "$setOnInsert": {"status": "open", "fingerprint": to_hex(fingerprint), "first_seen": now,
+                             "escalations": 0, "notified": False},
+            "$push": {"members": {"$each": [member], "$slice": -self.options["max_members"]}},
+            "$inc": {"member_count": 1},
+            "$addToSet": {"usernames": username, "categories": {"$each": sorted(categories)}},
+            "$max": {"max_risk_score": member["risk_score"], "last_seen": now}
+        }
+        if opened or level_raised:
+            update["$set"] = {"alert_level": alert_level}
+        self.collection.update_one({"_id": incident_id}, update, upsert=True)
+        return decision
+
+    def mark_notified(self, decision):
+        """observe() 预留的通知已入队：记录已通知的级别与成员数档位"""
+        milestone = self._milestone(decision["member_count"])
+        with self.lock:
+            state = self.incidents.get(decision["incident_id"])
+            if state is not None:
+                state["pending"] = False
+                state["notified"] = True
+                if LEVEL_RANK.get(decision["alert_level"], 0) >= LEVEL_RANK.get(state["notified_level"], 0):
+                    state["notified_level"] = decision["alert_level"]
+                state["notified_milestone"] = max(state["notified_milestone"], milestone)
+        update = {
+            "$set": {"notified": True, "notified_level": decision["alert_level"]},
+            "$max": {"notified_milestone": milestone}
+        }
+        if decision["action"] == "escalate":
+            update["$inc"] = {"escalations": 1}
+        self.collection.update_one({"_id": decision["incident_id"]}, update)
+
+    def release(self, decision):
+        """observe() 预留的通知未能发出：撤销预留，事件保持待通知状态"""
+        with self.lock:
+            state = self.incidents.get(decision["incident_id"])
+            if state is not None:
+                state["pending"] = False
+
+    def _milestone(self, member_count):
+        """成员数已达到的最高升级档位"""
+        return max((count for count in self.options["escalate_counts"] if count <= member_count), default=0)
+
+    def _decide(self, state):
+        """事件尚未通知过则发首条警报；已通知则在级别升高或成员数越过新档位时发升级通知"""
+        if state["pending"]:
+            # 已有线程在发送本事件的通知
+            return "absorb"
+        if not state["notified"]:
+            return "new"
+        if LEVEL_RANK.get(state["alert_level"], 0) > LEVEL_RANK.get(state["notified_level"], 0):
+            return "escalate"
+        if self._milestone(state["member_count"]) > state["notified_milestone"]:
+            return "escalate"
+        return "absorb"
+
+    def _match(self, fingerprint, categories):
+        """优先找文本近重复的事件，其次找风险类别高度重合且文本相近的事件"""
+        for incident_id, _ in self.index.query(fingerprint):
+            state = self.incidents[incident_id]
+            if not categories or not state["categories"] or categories & state["categories"]:
+                return incident_id
+
+        best, best_distance = None, None
+        candidates = set()
+        for category in categories:
+            candidates.update(self.by_category.get(category, ()))
+        for incident_id in candidates:
+            state = self.incidents[incident_id]
+            if jaccard(categories, state["categories"]) < self.options["category_overlap"]:
+                continue
+            distance = hamming(fingerprint, state["fingerprint"])
+            if distance <= self.options["loose_distance"] and (best_distance is None or distance < best_distance):
+                best, best_distance = incident_id, distance
+        return best
+
+    def _remember(self, incident_id, state):
+        self.incidents[incident_id] = state
+        self.index.add(incident_id, state["fingerprint"])
+        for category in state["categories"]:
+            self.by_category.setdefault(category, set()).add(incident_id)
+
+    def _expire(self, now):
+        """从内存中移除窗口内没有新推文的事件（调用方持有锁），返回这些事件的 ID"""
+        expired = [incident_id for incident_id, state in self.incidents.items()
+                   if now - state["last_seen"] > self.window]
+        for incident_id in expired:
+            state = self.incidents.pop(incident_id)
+            self.index.remove(incident_id)
+            for category in state["categories"]:
+                ids = self.by_category.get(category)
+                if ids is not None:
+                    ids.discard(incident_id)
+                    if not ids:
+                        del self.by_category[category]
+        return expired
+
+    def _close(self, expired):
+        if expired:
+            self.collection.update_many({"_id": {"$in": expired}}, {"$set": {"status": "closed"}})
+
+
+def ensure_incident_indexes(collection):
+    collection.create_index([("status", 1), ("last_seen", -1)])
@@ -3,29 +3,233 @@
 处理黑天鹅事件的实时报警和通知
 """
 
-import smtplib
 import json
-import requests
+import threading
+from collections import deque
 from datetime import datetime, timedelta
-from pymongo import MongoClient
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import logging
 
+from 警报分发 import AlertDispatcher, ensure_outbox_indexes
+from 警报合并 import IncidentCoalescer, ensure_incident_indexes
+from 配置中心 import get_settings
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 全局限流状态文档的 _id
+RATE_STATE_ID = "__rate__"
+
+class CooldownIndex:
+    def __init__(self, state_collection, cooldown_minutes, max_alerts_per_hour):
+        """
+        内存中的冷却与限流索引：
+        last_sent: (username, alert_level) → 最近发送时间
+        sent_times: 最近一小时内的发送时间（滑动窗口，执行 max_alerts_per_hour）
+        跨进程一致性由 state_collection 上的原子 upsert 保证
+        """
+        self.state = state_collection
+        self.cooldown = timedelta(minutes=cooldown_minutes)
+        self.window = timedelta(hours=1)
+        self.max_alerts_per_hour = max_alerts_per_hour
+        self.last_sent = {}
+        self.sent_times = deque()
+        self.lock = threading.Lock()
+    
+    def rebuild(self, alerts_collection, now=None):
+        """启动时从警报集合与状态集合重建索引"""
+        now = now or datetime.now()
+        since = now - max(self.cooldown, self.window)
+        sent_times = []
+        with self.lock:
+            self.last_sent.clear()
+            for doc in alerts_collection.find(
+                {"created_at": {"$gte": since.isoformat()}},
+                {"username": 1, "alert_level": 1, "created_at": 1}
+            ):
+                sent_at = datetime.fromisoformat(doc["created_at"])
+                self._remember(doc.get("username", ""), doc.get("alert_level"), sent_at)
+                sent_times.append(sent_at)
+            for doc in self.state.find({"_id": {"$ne": RATE_STATE_ID}}):
+                self._remember(doc.get("username", ""), doc.get("alert_level"), doc["last_sent_at"])
+            rate_doc = self.state.find_one({"_id": RATE_STATE_ID})
+            if rate_doc:
+                sent_times.extend(rate_doc.get("sent", []))
+            self.sent_times = deque(sorted(t for t in set(sent_times) if t >= now - self.window))
+    
+    def _remember(self, username, alert_level, sent_at):
+        key = (username, alert_level)
+        if key not in self.last_sent or self.last_sent[key] < sent_at:
+            self.last_sent[key] = sent_at
+    
+    def try_acquire(self, username, alert_level, now=None):
+        """
+        尝试占用一次发送名额，返回 (占用凭据, 拒绝原因)：允许时凭据为 dict、原因为 None，拒绝时凭据为 None；
+        占用后警报未能发出时须用凭据调用 release 归还
+        """
+        now = now or datetime.now()
+        # MongoDB 只保存到毫秒：截断后归还名额时才能按原值匹配到状态文档
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        key = (username, alert_level)
+        
+        # 先查内存，绝大多数被拒的候选警报不需要访问数据库
+        with self.lock:
+            last = self.last_sent.get(key)
+            if last is not None and now - last < self.cooldown:
+                return None, "cooldown"
+            while self.sent_times and self.sent_times[0] < now - self.window:
+                self.sent_times.popleft()
+            if len(self.sent_times) >= self.max_alerts_per_hour:
+                return None, "rate_limit"
+        
+        # 再在状态集合上原子占用，防止多个进程同时发送
+        previous = self._claim_cooldown(username, alert_level, now)
+        if previous is False:
+            with self.lock:
+                self._remember(username, alert_level, now - self.cooldown / 2)
+            return None, "cooldown"
+        if not self._claim_rate(now):
+            self._release_cooldown(username, alert_level, now, previous)
+            return None, "rate_limit"
+        
+        with self.lock:
+            memory_previous = self.last_sent.get(key)
+            self._remember(username, alert_level, now)
+            self.sent_times.append(now)
+        return {"username": username, "alert_level": alert_level, "now": now,
+                "previous": previous, "memory_previous": memory_previous}, None
+    
+    def release(self, claim):
+        """归还 try_acquire 占用的冷却时间与限流名额（警报未能入队时调用）"""
+        username, alert_level, now = claim["username"], claim["alert_level"], claim["now"]
+        self._release_cooldown(username, alert_level, now, claim["previous"])
+        self.state.update_one({"_id": RATE_STATE_ID}, {"$pull": {"sent": now}})
+        with self.lock:
+            key = (username, alert_level)
+            if self.last_sent.get(key) == now:
+                if claim["memory_previous"] is None:
+                    del self.last_sent[key]
+                else:
+                    self.last_sent[key] = claim["memory_previous"]
+            try:
+                self.sent_times.remove(now)
+            except ValueError:
+                pass  # 已滑出窗口
+    
+    def _claim_cooldown(self, username, alert_level, now):
+        """冷却期外才能写入新的发送时间；成功返回原发送时间（可能为 None），失败返回 False"""
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+        
+        try:
+            before = self.state.find_one_and_update(
+                {
+                    "_id": f"{username}|{alert_level}",
+                    "$or": [
+                        {"last_sent_at": {"$lt": now - self.cooldown}},
+                        {"last_sent_at": {"$exists": False}}
+                    ]
+                },
+                {"$set": {"last_sent_at": now, "username": username, "alert_level": alert_level}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            # 文档已存在且仍在冷却期内，upsert 插入同 _id 失败
+            return False
+        return before.get("last_sent_at") if before else None
+    
+    def _release_cooldown(self, username, alert_level, now, previous):
+        """限流拒绝或警报未能入队时撤销刚占用的冷却时间"""
+        key_filter = {"_id": f"{username}|{alert_level}", "last_sent_at": now}
+        if previous is None:
+            self.state.delete_one(key_filter)
+        else:
+            self.state.update_one(key_filter, {"$set": {"last_sent_at": previous}})
+    
+    def _claim_rate(self, now):
+        """最近一小时内发送数未满才追加；sent 数组只保留最后 max_alerts_per_hour 个时间"""
+        from pymongo.errors import DuplicateKeyError
+        
+        limit = self.max_alerts_per_hour
+        try:
+            self.state.update_one(
+                {
+                    "_id": RATE_STATE_ID,
+                    "$or": [
+                        {f"sent.{limit - 1}": {"$exists": False}},
+                        {"sent.0": {"$lt": now - self.window}}
+                    ]
+                },
+                {"$push": {"sent": {"$each": [now], "$sort": 1, "$slice": -limit}}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
 class AlertSystem:
     def __init__(self, config_file="alert_config.json"):
         """初始化报警系统"""
         self.config = self._load_config(config_file)
-        self.mongo_client = MongoClient("mongodb://localhost:27017/")
-        self.db = self.mongo_client["twitter_monitor"]
-        self.alerts_collection = self.db["alerts"]
+        self._alerts_collection = None
+        self._cooldown_index = None
+        self._dispatcher = None
+        self._coalescer = None
+    
+    @property
+    def alerts_collection(self):
+        """首次访问时才连接 MongoDB"""
+        if self._alerts_collection is None:
+            from pymongo import MongoClient
+            mongodb = get_settings().mongodb
+            self.mongo_client = MongoClient(mongodb.connection_string)
+            self.db = self.mongo_client[mongodb.database_name]
+            self._alerts_collection = self.db["alerts"]
+        return self._alerts_collection
+    
+    @property
+    def cooldown_index(self):
+        """首次使用时从警报记录重建冷却索引"""
+        if self._cooldown_index is None:
+            index = CooldownIndex(
+                self.alerts_collection.database["alert_state"],
+                self.config['cooldown_minutes'],
+                self.config['max_alerts_per_hour']
+            )
+            index.rebuild(self.alerts_collection)
+            self._cooldown_index = index
+        return self._cooldown_index
+    
+    @property
+    def dispatcher(self):
+        """首次使用时启动后台分发线程"""
+        if self._dispatcher is None:
+            ensure_outbox_indexes(self.alerts_collection)
+            self._dispatcher = AlertDispatcher(self.alerts_collection, self.config).start()
+        return self._dispatcher
+    
+    @property
+    def coalescer(self):
+        """首次使用时从 incidents 集合重建打开中的事件；配置关闭合并时为 None"""
+        options = self.config['coalescing']
+        if not options.get('enabled', True):
+            return None
+        if self._coalescer is None:
+            collection = self.alerts_collection.database["incidents"]
+            ensure_incident_indexes(collection)
+            self._coalescer = IncidentCoalescer(collection, options).rebuild()
+        return self._coalescer
+    
+    def close(self):
+        """停止分发线程，关闭复用的连接"""
+        if self._dispatcher is not None:
+            self._dispatcher.stop()
         
     def _load_config(self, config_file):
-        """加载配置文件"""
+        """加载配置文件；阈值、冷却与限额缺省取自 config.ALERT_CONFIG，文件中设置时以文件为准"""
+        alert_config = get_settings().alert
+        levels = alert_config.get("LEVELS", {})
         default_config = {
             "email": {
                 "enabled": False,
@@ -41,11 +245,13 @@ class AlertSystem:
                 "headers": {}
             },
             "alert_thresholds": {
-                "red": 70,
-                "orange": 40,
-                "yellow": 20
+                level.lower(): levels[level]["threshold"]
+                for level in ("RED", "ORANGE", "YELLOW") if level in levels
             },
-            "cooldown_minutes": 30  # 同类型警报冷却时间
+            "cooldown_minutes": alert_config.get("COOLDOWN_MINUTES", 30),  # 同类型警报冷却时间
+            "max_alerts_per_hour": alert_config.get("MAX_ALERTS_PER_HOUR", 10),  # 全局每小时最多发送数
+            "dispatch": {},  # 分发队列参数，缺省项见 警报分发.DEFAULT_DISPATCH_CONFIG
+            "coalescing": {}  # 事件合并参数，缺省项见 警报合并.DEFAULT_COALESCING_CONFIG
         }
         
         try:
@@ -62,64 +268,96 @@ class AlertSystem:
     
     def check_and_send_alerts(self, tweet_data):
         """检查并发送警报"""
-        if not tweet_data.get('is_black_swan', False):
+        # 抓取端存储的字段名为 black_swan，分析结果中为 is_black_swan
+        if not tweet_data.get('is_black_swan', tweet_data.get('black_swan', False)):
             return False
         
         alert_level = tweet_data.get('alert_level', '绿色')
         risk_score = tweet_data.get('risk_score', 0)
+        username = tweet_data.get('username', '')
         
-        # 检查是否需要发送警报
-        if not self._should_send_alert(tweet_data, alert_level):
+        if not self._passes_thresholds(alert_level, risk_score):
             return False
         
-        # 创建警报记录
-        alert_record = self._create_alert_record(tweet_data, alert_level, risk_score)
-        
-        # 发送警报
-        success = False
-        if self.config['email']['enabled']:
-            success |= self._send_email_alert(alert_record)
+        # 合并同一事件的近重复警报：只有新事件与事件升级才发送
+        incident = None
+        cooldown_key = username
+        if self.coalescer is not None:
+            incident = self.coalescer.observe(tweet_data, alert_level)
+            if incident['action'] == 'absorb':
+                logger.info(f"警报并入事件 {incident['incident_id']}（{incident['member_count']} 条）: {username}")
+                return False
+            if incident['action'] == 'escalate':
+                alert_level = incident['alert_level']
+                cooldown_key = f"incident:{incident['incident_id']}"
         
-        if self.config['webhook']['enabled']:
-            success |= self._send_webhook_alert(alert_record)
+        queued = False
+        try:
+            queued = self._send_alert(tweet_data, alert_level, risk_score, cooldown_key, incident)
+        finally:
+            # 只有真正入队才算事件已通知；被冷却/限流拦下时由事件的下一条推文重试
+            if incident is not None:
+                if queued:
+                    self.coalescer.mark_notified(incident)
+                else:
+                    self.coalescer.release(incident)
+        return queued
+    
+    def _send_alert(self, tweet_data, alert_level, risk_score, cooldown_key, incident):
+        """通过冷却与限流检查后写入发件箱，返回是否已入队"""
+        claim = self._should_send_alert(cooldown_key, alert_level)
+        if claim is None:
+            return False
         
-        # 保存警报记录
-        if success:
-            self.alerts_collection.insert_one(alert_record)
-            logger.info(f"警报已发送: {alert_record['title']}")
+        queued = False
+        try:
+            # 创建警报记录
+            alert_record = self._create_alert_record(tweet_data, alert_level, risk_score)
+            if incident is not None:
+                alert_record['incident_id'] = incident['incident_id']
+                if incident['action'] == 'escalate':
+                    alert_record['title'] = f"⬆️ {alert_level}事件升级: {incident['member_count']} 条相关推文"
+                    alert_record['message'] = (
+                        f"⬆️ 事件升级: 已有 {incident['member_count']} 条相关推文，"
+                        f"涉及 {', '.join(incident['usernames'])}\n" + alert_record['message']
+                    )
+            
+            # 写入发件箱，由后台分发线程发送，不阻塞抓取流程
+            queued = self.dispatcher.enqueue(alert_record)
+            if queued:
+                logger.info(f"警报已入队: {alert_record['title']}")
+        finally:
+            # 没有入队（无可用渠道或写入出错）时归还名额，否则整个冷却期内该账号的警报都会被拦下
+            if not queued:
+                try:
+                    self.cooldown_index.release(claim)
+                except Exception as e:
+                    logger.error(f"归还警报冷却/限流名额失败: {e}")
         
-        return success
+        return queued
     
-    def _should_send_alert(self, tweet_data, alert_level):
-        """判断是否应该发送警报"""
-        risk_score = tweet_data.get('risk_score', 0)
-        username = tweet_data.get('username', '')
-        
-        # 检查风险评分阈值
+    def _passes_thresholds(self, alert_level, risk_score):
+        """检查风险评分阈值"""
         thresholds = self.config['alert_thresholds']
-        if alert_level == '红色' and risk_score < thresholds['red']:
+        if alert_level == '红色' and risk_score < thresholds.get('red', 0):
             return False
-        elif alert_level == '橙色' and risk_score < thresholds['orange']:
+        elif alert_level == '橙色' and risk_score < thresholds.get('orange', 0):
             return False
-        elif alert_level == '黄色' and risk_score < thresholds['yellow']:
-            return False
-        
-        # 检查冷却时间
-        cooldown_minutes = self.config['cooldown_minutes']
-        cutoff_time = datetime.now() - timedelta(minutes=cooldown_minutes)
-        
-        recent_alerts = self.alerts_collection.find({
-            "username": username,
-            "alert_level": alert_level,
-            "created_at": {"$gte": cutoff_time.isoformat()}
-        })
-        
-        if recent_alerts.count() > 0:
-            logger.info(f"警报冷却中，跳过发送: {username} - {alert_level}")
+        elif alert_level == '黄色' and risk_score < thresholds.get('yellow', 0):
             return False
-        
         return True
     
+    def _should_send_alert(self, cooldown_key, alert_level):
+        """检查冷却时间与每小时上限（内存索引 + 跨进程原子占用），通过时返回占用凭据，否则返回 None"""
+        claim, reason = self.cooldown_index.try_acquire(cooldown_key, alert_level)
+        if claim is None:
+            if reason == "cooldown":
+                logger.info(f"警报冷却中，跳过发送: {cooldown_key} - {alert_level}")
+            else:
+                logger.info(f"已达每小时警报上限，跳过发送: {cooldown_key} - {alert_level}")
+        
+        return claim
+    
     def _create_alert_record(self, tweet_data, alert_level, risk_score):
         """创建警报记录"""
         return {
@@ -162,69 +400,6 @@ class AlertSystem:
         
         return message
     
-    def _send_email_alert(self, alert_record):
-        """发送邮件警报"""
-        try:
-            email_config = self.config['email']
-            
-            msg = MIMEMultipart()
-            msg['From'] = email_config['username']
-            msg['To'] = ', '.join(email_config['recipients'])
-            msg['Subject'] = alert_record['title']
-            
-            body = alert_record['message']
-            msg.attach(MIMEText(body, 'plain', 'utf-8'))
-            
-            server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'])
-            server.starttls()
-            server.login(email_config['username'], email_config['password'])
-            
-            text = msg.as_string()
-            server.sendmail(email_config['username'], email_config['recipients'], text)
-            server.quit()
-            
-            logger.info("邮件警报发送成功")
-            return True
-            
-        except Exception as e:
-            logger.error(f"邮件发送失败: {e}")
-            return False
-    
-    def _send_webhook_alert(self, alert_record):
-        """发送Webhook警报"""
-        try:
-            webhook_config = self.config['webhook']
-            
-            payload = {
-                "alert_level": alert_record['alert_level'],
-                "title": alert_record['title'],
-                "message": alert_record['message'],
-                "risk_score": alert_record['risk_score'],
-                "username": alert_record['username'],
-                "timestamp": alert_record['created_at']
-            }
-            
-            headers = webhook_config.get('headers', {})
-            headers['Content-Type'] = 'application/json'
-            
-            response = requests.post(
-                webhook_config['url'],
-                json=payload,
-                headers=headers,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                logger.info("Webhook警报发送成功")
-                return True
-            else:
-                logger.error(f"Webhook发送失败: {response.status_code}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Webhook发送失败: {e}")
-            return False
-    
     def get_recent_alerts(self, hours=24):
         """获取最近的警报"""
         cutoff_time = datetime.now() - timedelta(hours=hours)
@@ -249,9 +424,27 @@ class AlertSystem:
         stats = list(self.alerts_collection.aggregate(pipeline))
         return {item['_id']: item['count'] for item in stats}
 
-# 全局警报系统实例
-alert_system = AlertSystem()
+# 全局警报系统实例（首次使用时才构建）
+_alert_system = None
+
+def get_alert_system():
+    """返回全局警报系统实例"""
+    global _alert_system
+    if _alert_system is None:
+        _alert_system = AlertSystem()
+    return _alert_system
+
+def __getattr__(name):
+    """兼容旧代码对模块级 alert_system 的访问"""
+    if name == "alert_system":
+        return get_alert_system()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def shutdown_alert_system():
+    """进程退出前调用，停止分发线程"""
+    if _alert_system is not None:
+        _alert_system.close()
 
 def send_alert_if_needed(tweet_data):
     """如果需要则发送警报"""
-    return alert_system.check_and_send_alerts(tweet_data)
\ No newline at end of file
+    return get_alert_system().check_and_send_alerts(tweet_data)
\ No newline at end of file
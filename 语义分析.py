@@ -3,68 +3,151 @@
 使用多种模型进行情感分析和黑天鹅事件检测
 """
 
-import torch
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-from textblob import TextBlob
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 import numpy as np
-import re
+import os
+import sys
+import threading
+import time
 from datetime import datetime
+from 关键词匹配 import KeywordMatcher
+from 分析缓存 import AnalysisCache, SQLiteCacheTier, MongoCacheTier
+from 推理后端 import load_backend
+from 监控指标 import STAGE_SECONDS, timed
+from 配置中心 import get_settings, on_reload
+
+# 分析逻辑版本号：评分规则变化时递增，使旧缓存失效
+ANALYZER_VERSION = "2"
+
+# 轻量模式：不加载 BERT（也可通过环境变量 POLITWEET_NO_BERT=1 开启）
+LIGHTWEIGHT_MODE = os.getenv("POLITWEET_NO_BERT", "").lower() in ("1", "true", "yes")
+
+# ALERT_CONFIG["LEVELS"] 中的级别名 → 分析结果中的警报级别
+ALERT_LEVEL_NAMES = {"RED": "红色", "ORANGE": "橙色", "YELLOW": "黄色", "GREEN": "绿色"}
+
+def set_lightweight_mode(enabled=True):
+    """切换轻量模式，需在首次使用分析器之前调用"""
+    global LIGHTWEIGHT_MODE
+    LIGHTWEIGHT_MODE = enabled
+
+def alert_thresholds(alert_config):
+    """按阈值从高到低排列的 (阈值, 警报级别)"""
+    levels = [
+        (spec["threshold"], ALERT_LEVEL_NAMES.get(level, level))
+        for level, spec in alert_config.get("LEVELS", {}).items()
+    ]
+    return sorted(levels, reverse=True)
 
 class EnhancedSentimentAnalyzer:
-    def __init__(self):
-        """初始化多个情感分析模型"""
+    def __init__(self, batch_size=None, use_bert=None):
+        """初始化轻量模型；BERT 延迟到第一次需要时再加载"""
+        from textblob import TextBlob
+        from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+        
+        settings = get_settings()
+        # 模型相关配置在构建时固定，更换模型或后端需要重启；关键词与警报阈值可热更新
+        self.models = dict(settings.sentiment["MODELS"])
+        self._textblob = TextBlob
         self.vader = SentimentIntensityAnalyzer()
+        self.batch_size = batch_size or settings.sentiment.get("BATCH_SIZE", 16)
         
-        # 加载预训练的情感分析模型
-        try:
-            self.bert_analyzer = pipeline(
-                "sentiment-analysis",
-                model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-                return_all_scores=True
-            )
-        except:
-            print("⚠️ BERT模型加载失败，使用基础模型")
-            self.bert_analyzer = None
-        
-        # 黑天鹅关键词（分类）
-        self.black_swan_keywords = {
-            "政治危机": ["resign", "impeach", "coup", "revolution", "overthrow", "crisis", "scandal"],
-            "军事冲突": ["war", "attack", "invasion", "missile", "bomb", "military", "conflict"],
-            "核威胁": ["nuclear", "atomic", "warhead", "radiation", "reactor"],
-            "经济危机": ["crash", "collapse", "default", "bankruptcy", "recession", "inflation"],
-            "恐怖主义": ["terrorist", "attack", "bomb", "explosion", "assassination"],
-            "自然灾害": ["earthquake", "tsunami", "hurricane", "flood", "disaster"],
-            "健康危机": ["pandemic", "virus", "outbreak", "epidemic", "disease"]
-        }
+        if use_bert is None:
+            use_bert = bool(self.models.get("BERT")) and not LIGHTWEIGHT_MODE
+        self.use_bert = use_bert
+        self.bert_backend = None
+        self.bert_analyzer = None
+        self._bert_loaded = False
+        self._bert_lock = threading.Lock()
         
-        # 紧急程度关键词
+        # 紧急程度关键词（按从高到低排列）
         self.urgency_keywords = {
             "极高": ["emergency", "urgent", "immediate", "breaking", "alert"],
             "高": ["serious", "critical", "important", "significant"],
             "中": ["concern", "issue", "problem", "matter"],
             "低": ["discuss", "consider", "review", "study"]
         }
+        
+        self.apply_settings(settings)
+    
+    def apply_settings(self, settings):
+        """
+        按新配置编译黑天鹅关键词（分类）与警报阈值，编译完成后整体替换，
+        正在分析的推文要么用旧规则、要么用新规则，不会混用
+        """
+        self._rules = {
+            # 词表只编译一次，每条推文单次扫描
+            "matcher": KeywordMatcher(settings.black_swan_keywords, self.urgency_keywords),
+            "alert_levels": alert_thresholds(settings.alert),
+            "digest": settings.keyword_digest
+        }
     
-    def analyze_sentiment_comprehensive(self, text):
-        """综合情感分析"""
-        results = {}
+    @property
+    def keyword_matcher(self):
+        return self._rules["matcher"]
+    
+    @property
+    def model_version(self):
+        """缓存键使用的模型版本，包含推理后端与关键词摘要；BERT 不可用时与完整模式区分开"""
+        rules = f"kw:{self._rules['digest']}"
+        if not self.use_bert:
+            return f"v{ANALYZER_VERSION}|{rules}|no-bert"
+        return f"v{ANALYZER_VERSION}|{rules}|{self.models['BERT']}|{self.backend_name}"
+    
+    @property
+    def backend_name(self):
+        return self.models.get("BERT_BACKEND", "pytorch")
+    
+    def ensure_bert(self):
+        """首次调用时加载 BERT 推理后端（torch/transformers 也在此时才导入），线程安全"""
+        if self._bert_loaded:
+            return self.bert_analyzer
+        with self._bert_lock:
+            if self._bert_loaded:
+                return self.bert_analyzer
+            if self.use_bert:
+                try:
+                    self.bert_backend = load_backend(
+                        self.backend_name,
+                        self.models["BERT"],
+                        self.models.get("ONNX_DIR", "models/onnx")
+                    )
+                    self.bert_analyzer = True
+                except Exception as e:
+                    print(f"⚠️ BERT模型加载失败（{self.backend_name}），使用基础模型: {e}")
+                    self.use_bert = False
+            self._bert_loaded = True
+        return self.bert_analyzer
+    
+    def bert_scores(self, texts, batch_size=None):
+        """按微批次运行BERT，返回与 pipeline(return_all_scores=True) 相同结构的每条得分列表"""
+        if not texts or not self.ensure_bert():
+            return [None] * len(texts)
         
+        batch_size = batch_size or self.batch_size
+        results = []
+        for start in range(0, len(texts), batch_size):
+            chunk = texts[start:start + batch_size]
+            try:
+                with STAGE_SECONDS.time(stage="bert"):
+                    results.extend(self.bert_backend.predict(chunk))
+            except Exception:
+                results.extend([None] * len(chunk))
+        return results
+    
+    @timed("analyze_sentiment_comprehensive")
+    def analyze_sentiment_comprehensive(self, text, bert_score=None):
+        """综合情感分析"""
         # TextBlob分析
-        blob = TextBlob(text)
-        textblob_score = blob.sentiment.polarity
+        with STAGE_SECONDS.time(stage="textblob"):
+            blob = self._textblob(text)
+            textblob_score = blob.sentiment.polarity
         
         # VADER分析
-        vader_scores = self.vader.polarity_scores(text)
+        with STAGE_SECONDS.time(stage="vader"):
+            vader_scores = self.vader.polarity_scores(text)
         
-        # BERT分析（如果可用）
-        bert_score = None
-        if self.bert_analyzer:
-            try:
-                bert_result = self.bert_analyzer(text[:512])  # BERT有长度限制
-                bert_score = bert_result[0]
-            except:
-                pass
+        # BERT分析（如果可用且调用方未预先批量计算）
+        if bert_score is None:
+            bert_score = self.bert_scores([text])[0]
         
         # 综合评分
         sentiment_score = self._calculate_composite_score(textblob_score, vader_scores, bert_score)
@@ -79,29 +162,23 @@ class EnhancedSentimentAnalyzer:
             "confidence": self._calculate_confidence(textblob_score, vader_scores, bert_score)
         }
     
+    @timed("detect_black_swan_events")
     def detect_black_swan_events(self, text):
         """检测黑天鹅事件"""
-        text_lower = text.lower()
+        rules = self._rules
+        match_result = rules["matcher"].match(text)
         detected_categories = []
-        urgency_level = "低"
+        urgency_level = match_result["urgency_level"]
         risk_score = 0
         
         # 检测各类黑天鹅事件
-        for category, keywords in self.black_swan_keywords.items():
-            matches = [kw for kw in keywords if kw in text_lower]
-            if matches:
-                detected_categories.append({
-                    "category": category,
-                    "matched_keywords": matches,
-                    "count": len(matches)
-                })
-                risk_score += len(matches) * 10
-        
-        # 检测紧急程度
-        for level, keywords in self.urgency_keywords.items():
-            if any(kw in text_lower for kw in keywords):
-                urgency_level = level
-                break
+        for category, matches in match_result["categories"].items():
+            detected_categories.append({
+                "category": category,
+                "matched_keywords": matches,
+                "count": len(matches)
+            })
+            risk_score += len(matches) * 10
         
         # 计算最终风险评分
         if urgency_level == "极高":
@@ -116,7 +193,7 @@ class EnhancedSentimentAnalyzer:
             "risk_score": min(risk_score, 100),  # 限制在100以内
             "urgency_level": urgency_level,
             "detected_categories": detected_categories,
-            "alert_level": self._get_alert_level(risk_score)
+            "alert_level": self._get_alert_level(risk_score, rules["alert_levels"])
         }
     
     def _calculate_composite_score(self, textblob_score, vader_scores, bert_score):
@@ -157,27 +234,166 @@ class EnhancedSentimentAnalyzer:
         
         return min(np.mean(scores), 1.0)
     
-    def _get_alert_level(self, risk_score):
-        """根据风险评分确定警报级别"""
-        if risk_score >= 70:
-            return "红色"
-        elif risk_score >= 40:
-            return "橙色"
-        elif risk_score >= 20:
-            return "黄色"
-        else:
-            return "绿色"
+    def _get_alert_level(self, risk_score, alert_levels=None):
+        """根据风险评分确定警报级别，阈值取自 ALERT_CONFIG["LEVELS"]"""
+        for threshold, level in alert_levels or self._rules["alert_levels"]:
+            if risk_score >= threshold:
+                return level
+        return "绿色"
+
+def build_analysis_cache(model_version):
+    """按 SENTIMENT_CONFIG["CACHE"] 构建分析缓存，未启用时返回 None"""
+    settings = get_settings()
+    cache_config = settings.sentiment.get("CACHE", {})
+    if not cache_config.get("ENABLED"):
+        return None
+    
+    persistent = None
+    try:
+        if cache_config.get("PERSISTENT") == "sqlite":
+            persistent = SQLiteCacheTier(cache_config["SQLITE_PATH"], cache_config["MAX_PERSISTENT_ENTRIES"])
+        elif cache_config.get("PERSISTENT") == "mongodb":
+            from pymongo import MongoClient
+            db = MongoClient(settings.mongodb.connection_string)[settings.mongodb.database_name]
+            persistent = MongoCacheTier(db, cache_config["MAX_PERSISTENT_BYTES"])
+    except Exception as e:
+        print(f"⚠️ 持久缓存初始化失败，仅使用内存缓存: {e}")
+    
+    return AnalysisCache(model_version, cache_config.get("MAX_ENTRIES", 10000), persistent)
+
+# 全局分析器实例（首次使用时才构建）
+_analyzer = None
+_analysis_cache = None
+_init_lock = threading.Lock()
+
+def get_analyzer():
+    """返回全局分析器，首次调用时构建"""
+    global _analyzer
+    if _analyzer is None:
+        with _init_lock:
+            if _analyzer is None:
+                _analyzer = EnhancedSentimentAnalyzer()
+                on_reload(_reload_rules)
+    return _analyzer
+
+def _reload_rules(new, old):
+    """配置变化时只重新编译关键词与阈值，模型保持加载；缓存随关键词摘要切换版本"""
+    if new.keyword_digest == old.keyword_digest:
+        return
+    _analyzer.apply_settings(new)
+    if _analysis_cache:
+        _analysis_cache.model_version = _analyzer.model_version
+    print(f"🔄 关键词与警报阈值已更新（{len(new.black_swan_keywords)} 类，摘要 {new.keyword_digest}）")
+
+def get_analysis_cache():
+    """返回全局分析缓存；须在 BERT 加载结果确定后构建，保证模型版本准确"""
+    global _analysis_cache
+    if _analysis_cache is None:
+        analyzer = get_analyzer()
+        analyzer.ensure_bert()
+        with _init_lock:
+            if _analysis_cache is None:
+                _analysis_cache = build_analysis_cache(analyzer.model_version) or False
+    return _analysis_cache or None
+
+def warm_up(background=True):
+    """预先加载模型并跑一次推理，background=True 时在后台线程执行"""
+    def run():
+        started = time.perf_counter()
+        analyze_tweets(["warm up"])
+        print(f"🔥 分析模型预热完成，用时 {time.perf_counter() - started:.1f} 秒")
+    
+    if not background:
+        run()
+        return None
+    thread = threading.Thread(target=run, name="analyzer-warm-up", daemon=True)
+    thread.start()
+    return thread
 
-# 全局分析器实例
-analyzer = EnhancedSentimentAnalyzer()
+def __getattr__(name):
+    """兼容旧代码对模块级 analyzer / analysis_cache 的访问"""
+    if name == "analyzer":
+        return get_analyzer()
+    if name == "analysis_cache":
+        return get_analysis_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def analyze_tweet(text):
     """分析单条推文"""
-    sentiment_result = analyzer.analyze_sentiment_comprehensive(text)
-    black_swan_result = analyzer.detect_black_swan_events(text)
-    
-    return {
-        **sentiment_result,
-        **black_swan_result,
-        "analyzed_at": datetime.now().isoformat()
-    }
\ No newline at end of file
+    return analyze_tweets([text])[0]
+
+def analyze_tweets(texts, batch_size=None):
+    """批量分析推文：先查缓存，未命中的BERT按微批次推理，其余阶段逐条执行"""
+    texts = list(texts)
+    analyzed_at = datetime.now().isoformat()
+    analyzer = get_analyzer()
+    analysis_cache = get_analysis_cache()
+    
+    cached = [analysis_cache.get(text) if analysis_cache else None for text in texts]
+    misses = [i for i, hit in enumerate(cached) if hit is None]
+    bert_results = analyzer.bert_scores([texts[i] for i in misses], batch_size=batch_size)
+    
+    for i, bert_score in zip(misses, bert_results):
+        text = texts[i]
+        sentiment_result = analyzer.analyze_sentiment_comprehensive(text, bert_score=bert_score)
+        black_swan_result = analyzer.detect_black_swan_events(text)
+        cached[i] = {**sentiment_result, **black_swan_result}
+        if analysis_cache:
+            analysis_cache.put(text, cached[i])
+    
+    return [{**result, "analyzed_at": analyzed_at} for result in cached]
+
+def analyze_with_sentiment(texts, sentiment_results):
+    """近重复推文复用已有的情感分析结果，黑天鹅检测与风险评分仍按各自文本计算"""
+    analyzed_at = datetime.now().isoformat()
+    analyzer = get_analyzer()
+    return [
+        {**sentiment_result, **analyzer.detect_black_swan_events(text), "analyzed_at": analyzed_at}
+        for text, sentiment_result in zip(texts, sentiment_results)
+    ]
+
+def get_cache_stats():
+    """分析缓存命中统计，未启用缓存时返回空字典"""
+    return _analysis_cache.get_stats() if _analysis_cache else {}
+
+def startup_report():
+    """逐项计时：依赖导入、分析器构建、BERT 加载与首次推理"""
+    stages = []
+    
+    def timed(label, fn):
+        started = time.perf_counter()
+        try:
+            fn()
+            status = "ok"
+        except Exception as e:
+            status = f"失败: {e}"
+        stages.append((label, time.perf_counter() - started, status))
+    
+    for module in ["numpy", "textblob", "vaderSentiment.vaderSentiment", "pymongo", "torch", "transformers"]:
+        if module in sys.modules:
+            stages.append((f"import {module}", 0.0, "已加载"))
+        else:
+            timed(f"import {module}", lambda m=module: __import__(m))
+    
+    timed("构建分析器", get_analyzer)
+    timed("加载 BERT", lambda: get_analyzer().ensure_bert())
+    timed("首次推理", lambda: analyze_tweets(["startup report"]))
+    
+    print("⏱ 启动耗时报告")
+    for label, seconds, status in stages:
+        print(f"  {label:<40} {seconds:8.3f}s  {status}")
+    print(f"  {'合计':<40} {sum(s for _, s, _ in stages):8.3f}s")
+    return stages
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="语义分析模块")
+    parser.add_argument("--no-bert", action="store_true", help="轻量模式，不加载 BERT")
+    parser.add_argument("--startup-report", action="store_true", help="输出启动耗时报告")
+    args = parser.parse_args()
+    
+    if args.no_bert:
+        set_lightweight_mode(True)
+    if args.startup_report:
+        startup_report()
\ No newline at end of file
@@ -0,0 +1,107 @@
+"""
+速率限制模块
+基于 Twitter 返回的 x-rate-limit-* 响应头维护各接口共享的令牌桶
+"""
+
+import threading
+import time
+
+import tweepy
+
+from 监控指标 import RATE_LIMIT_REMAINING, TWITTER_REQUESTS, TWITTER_REQUEST_SECONDS
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        """令牌桶：容量 capacity，每秒补充 refill_per_second 个令牌"""
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated_at
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_per_second)
+        self.updated_at = now
+
+    def acquire(self):
+        """取一个令牌，不足时阻塞等待"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.refill_per_second if self.refill_per_second > 0 else 1
+            time.sleep(min(wait, 60))
+
+    def sync(self, limit, remaining, reset_at):
+        """用响应头校准：剩余额度作为当前令牌，在重置前均匀补充"""
+        with self.lock:
+            now = time.time()
+            window = max(reset_at - now, 1)
+            self.capacity = max(limit, 1)
+            self.tokens = float(remaining)
+            # 剩余额度摊到窗口剩余时间内；窗口重置后按完整额度补充
+            self.refill_per_second = max(remaining, 1) / window
+            self.updated_at = time.monotonic()
+
+
+class RateLimiter:
+    def __init__(self, default_limit=900, default_window=900):
+        """按接口路由维护令牌桶，未见过响应头的接口使用默认额度"""
+        self.default_limit = default_limit
+        self.default_window = default_window
+        self.buckets = {}
+        self.remaining = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, route):
+        with self.lock:
+            if route not in self.buckets:
+                self.buckets[route] = TokenBucket(
+                    self.default_limit, self.default_limit / self.default_window
+                )
+            return self.buckets[route]
+
+    def acquire(self, route):
+        self._bucket(route).acquire()
+
+    def update_from_headers(self, route, headers):
+        """从 x-rate-limit-limit / remaining / reset 响应头更新令牌桶"""
+        try:
+            limit = int(headers["x-rate-limit-limit"])
+            remaining = int(headers["x-rate-limit-remaining"])
+            reset_at = int(headers["x-rate-limit-reset"])
+        except (KeyError, TypeError, ValueError):
+            return
+        self.remaining[route] = remaining
+        RATE_LIMIT_REMAINING.set(remaining, route=route)
+        self._bucket(route).sync(limit, remaining, reset_at)
+
+
+def _route_key(route):
+    """把 /2/users/123/tweets 归一为 /2/users/:id/tweets，使同一接口共用一个桶"""
+    return "/".join(":id" if part.isdigit() else part for part in route.split("/"))
+
+
+class RateLimitedClient(tweepy.Client):
+    def __init__(self, *args, rate_limiter=None, **kwargs):
+        """在每次请求前取令牌，请求后用响应头校准令牌桶"""
+        super().__init__(*args, **kwargs)
+        self.rate_limiter = rate_limiter or RateLimiter()
+
+    def request(self, method, route, params=None, json=None, user_auth=False):
+        key = _route_key(route)
+        with TWITTER_REQUEST_SECONDS.time(route=key):
+            self.rate_limiter.acquire(key)
+            try:
+                response = super().request(method, route, params=params, json=json, user_auth=user_auth)
+            except tweepy.HTTPException as e:
+                TWITTER_REQUESTS.inc(route=key, status=e.response.status_code)
+                raise
+        TWITTER_REQUESTS.inc(route=key, status=response.status_code)
+        self.rate_limiter.update_from_headers(key, response.headers)
+        return response
@@ -0,0 +1,308 @@
+"""
+配置中心模块
+统一读取 config.py（通过 runpy 执行，不受模块导入缓存影响）与可选的 settings.json 覆盖项，
+校验类型后生成只读的 Settings；轮询文件修改时间，变化时重新加载并通知订阅者，
+各模块据此原子地替换关键词匹配器、账号列表与调度，无需重启进程或重新加载模型
+
+settings.json 的键与 config.py 中的配置名一致，按字典逐层合并，例如:
+    {"LEADER_ACCOUNTS": {"new_leader": {"name": "新领导人", "priority": "high"}},
+     "FETCH_CONFIG": {"MAX_WORKERS": 8}}
+值为 null 表示删除该项，例如 {"LEADER_ACCOUNTS": {"RishiSunak": null}} 停止监控该账号
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import runpy
+import threading
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CONFIG_PATH = os.path.join(BASE_DIR, "config.py")
+DEFAULT_OVERRIDE_PATH = os.getenv("POLITWEET_SETTINGS", os.path.join(BASE_DIR, "settings.json"))
+
+PRIORITIES = ("high", "medium", "low")
+
+
+class ConfigError(ValueError):
+    """配置缺项或类型不符"""
+
+
+@dataclass(frozen=True)
+class Account:
+    username: str
+    name: str
+    country: str = ""
+    position: str = ""
+    priority: str = "low"
+
+
+@dataclass(frozen=True)
+class MongoSettings:
+    connection_string: str
+    database_name: str
+    collection_name: str = "tweets"
+    bulk_batch_size: int = 500
+    bulk_flush_seconds: float = 5.0
+
+
+@dataclass(frozen=True)
+class FetchSettings:
+    max_tweets_per_person: int
+    fetch_interval_hours: float
+    page_size: int
+    max_pages_per_fetch: int
+    max_workers: int
+    analysis_workers: int
+    analysis_queue_size: int
+    analysis_wait_seconds: float
+    priority_weights: dict
+    user_id_ttl_hours: float
+    user_id_negative_ttl_hours: float
+
+
+@dataclass(frozen=True)
+class Settings:
+    mongodb: MongoSettings
+    fetch: FetchSettings
+    accounts: dict  # 用户名 → Account
+    black_swan_keywords: dict  # 类别 → {"keywords": [...], "weight": float}
+    sentiment: dict
+    alert: dict
+    dedup: dict
+    metrics: dict
+    scheduler: dict
+    coordination: dict
+    twitter: dict
+    raw: dict = field(repr=False)  # 合并后的全部配置项（大写名称 → 值）
+    version: int = 0
+
+    @property
+    def keyword_digest(self):
+        """关键词表的短摘要，关键词变化时分析缓存随之失效"""
+        payload = json.dumps([self.black_swan_keywords, self.alert.get("LEVELS")], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:8]
+
+
+def _require(section, key, kind, path):
+    if key not in section:
+        raise ConfigError(f"{path}.{key} 缺失")
+    value = section[key]
+    if kind is float and isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    if not isinstance(value, kind) or (kind is int and isinstance(value, bool)):
+        raise ConfigError(f"{path}.{key} 应为 {kind.__name__}，实际为 {type(value).__name__}")
+    return value
+
+
+def _accounts(raw):
+    accounts = {}
+    for username, info in raw.items():
+        if isinstance(info, str):
+            info = {"name": info}
+        if not isinstance(info, dict):
+            raise ConfigError(f"LEADER_ACCOUNTS.{username} 应为 dict")
+        priority = info.get("priority", "low")
+        if priority not in PRIORITIES:
+            raise ConfigError(f"LEADER_ACCOUNTS.{username}.priority 应为 {'/'.join(PRIORITIES)}")
+        accounts[username] = Account(
+            username=username,
+            name=info.get("name", username),
+            country=info.get("country", ""),
+            position=info.get("position", ""),
+            priority=priority
+        )
+    return accounts
+
+
+def _keywords(raw):
+    keywords = {}
+    for category, spec in raw.items():
+        if isinstance(spec, list):
+            spec = {"keywords": spec}
+        terms = _require(spec, "keywords", list, f"BLACK_SWAN_KEYWORDS.{category}")
+        if not all(isinstance(term, str) and term.strip() for term in terms):
+            raise ConfigError(f"BLACK_SWAN_KEYWORDS.{category}.keywords 只能包含非空字符串")
+        keywords[category] = {"keywords": list(terms), "weight": float(spec.get("weight", 1.0))}
+    return keywords
+
+
+def build_settings(raw, version=0):
+    """把合并后的配置项校验并转换为 Settings"""
+    mongo = raw.get("MONGODB_CONFIG", {})
+    fetch = raw.get("FETCH_CONFIG", {})
+    return Settings(
+        mongodb=MongoSettings(
+            connection_string=_require(mongo, "CONNECTION_STRING", str, "MONGODB_CONFIG"),
+            database_name=_require(mongo, "DATABASE_NAME", str, "MONGODB_CONFIG"),
+            collection_name=mongo.get("COLLECTION_NAME", "tweets"),
+            bulk_batch_size=_require(mongo, "BULK_BATCH_SIZE", int, "MONGODB_CONFIG"),
+            bulk_flush_seconds=_require(mongo, "BULK_FLUSH_SECONDS", float, "MONGODB_CONFIG")
+        ),
+        fetch=FetchSettings(
+            max_tweets_per_person=_require(fetch, "MAX_TWEETS_PER_PERSON", int, "FETCH_CONFIG"),
+            fetch_interval_hours=_require(fetch, "FETCH_INTERVAL_HOURS", float, "FETCH_CONFIG"),
+            page_size=_require(fetch, "PAGE_SIZE", int, "FETCH_CONFIG"),
+            max_pages_per_fetch=_require(fetch, "MAX_PAGES_PER_FETCH", int, "FETCH_CONFIG"),
+            max_workers=_require(fetch, "MAX_WORKERS", int, "FETCH_CONFIG"),
+            analysis_workers=_require(fetch, "ANALYSIS_WORKERS", int, "FETCH_CONFIG"),
+            analysis_queue_size=_require(fetch, "ANALYSIS_QUEUE_SIZE", int, "FETCH_CONFIG"),
+            analysis_wait_seconds=_require(fetch, "ANALYSIS_WAIT_SECONDS", float, "FETCH_CONFIG"),
+            priority_weights=dict(_require(fetch, "PRIORITY_WEIGHTS", dict, "FETCH_CONFIG")),
+            user_id_ttl_hours=_require(fetch, "USER_ID_TTL_HOURS", float, "FETCH_CONFIG"),
+            user_id_negative_ttl_hours=_require(fetch, "USER_ID_NEGATIVE_TTL_HOURS", float, "FETCH_CONFIG")
+        ),
+        accounts=_accounts(raw.get("LEADER_ACCOUNTS", {})),
+        black_swan_keywords=_keywords(raw.get("BLACK_SWAN_KEYWORDS", {})),
+        sentiment=raw.get("SENTIMENT_CONFIG", {}),
+        alert=raw.get("ALERT_CONFIG", {}),
+        dedup=raw.get("DEDUP_CONFIG", {"ENABLED": False}),
+        metrics=raw.get("METRICS_CONFIG", {"ENABLED": False}),
+        scheduler=raw.get("SCHEDULER_CONFIG", {"ENABLED": False}),
+        coordination=raw.get("COORDINATION_CONFIG", {"ENABLED": False}),
+        twitter=raw.get("TWITTER_CONFIG", {}),
+        raw=raw,
+        version=version
+    )
+
+
+def deep_merge(base, override, keep_none=False):
+    """字典逐层合并，override 中的非字典值直接替换，None 删除对应项（keep_none=True 时保留 None）"""
+    merged = dict(base)
+    for key, value in override.items():
+        if value is None and not keep_none:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value, keep_none)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_raw(config_path=DEFAULT_CONFIG_PATH, override_path=DEFAULT_OVERRIDE_PATH, overrides=None):
+    namespace = runpy.run_path(config_path)
+    raw = {key: copy.deepcopy(value) for key, value in namespace.items() if key.isupper()}
+    if override_path and os.path.exists(override_path):
+        with open(override_path, encoding="utf-8") as f:
+            raw = deep_merge(raw, json.load(f))
+    if overrides:
+        raw = deep_merge(raw, overrides)
+    return raw
+
+
+class ConfigCenter:
+    def __init__(self, config_path=DEFAULT_CONFIG_PATH, override_path=DEFAULT_OVERRIDE_PATH):
+        self.config_path = config_path
+        self.override_path = override_path
+        self.overrides = {}
+        self.callbacks = []
+        self.lock = threading.RLock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self._mtimes = self._current_mtimes()
+        self.settings = build_settings(load_raw(config_path, override_path), version=1)
+
+    def _current_mtimes(self):
+        return tuple(
+            os.path.getmtime(path) if path and os.path.exists(path) else None
+            for path in (self.config_path, self.override_path)
+        )
+
+    def on_reload(self, callback):
+        """注册回调 callback(new_settings, old_settings)，配置重新加载成功后调用"""
+        with self.lock:
+            self.callbacks.append(callback)
+        return callback
+
+    def reload(self):
+        """重新加载；配置有误时保留当前配置并返回 False"""
+        with self.lock:
+            self._mtimes = self._current_mtimes()
+            old = self.settings
+            try:
+                new = build_settings(
+                    load_raw(self.config_path, self.override_path, self.overrides),
+                    version=old.version + 1
+                )
+            except Exception as e:
+                logger.error(f"配置重新加载失败，继续使用第 {old.version} 版: {e}")
+                return False
+            # 引用替换是原子的，读取方要么拿到旧配置，要么拿到新配置
+            self.settings = new
+            callbacks = list(self.callbacks)
+        logger.info(f"配置已重新加载（第 {new.version} 版）")
+        for callback in callbacks:
+            try:
+                callback(new, old)
+            except Exception as e:
+                logger.error(f"配置重新加载回调失败 {getattr(callback, '__name__', callback)}: {e}")
+        return True
+
+    def apply_overrides(self, overrides):
+        """在文件配置之上叠加进程内覆盖项（如压测、命令行参数），立即生效"""
+        with self.lock:
+            # 累积的覆盖项保留 None，加载时才执行删除
+            self.overrides = deep_merge(self.overrides, overrides, keep_none=True)
+        return self.reload()
+
+    def check(self):
+        """文件有变化时重新加载"""
+        if self._current_mtimes() != self._mtimes:
+            return self.reload()
+        return False
+
+    def start_watching(self, interval=5.0):
+        """后台轮询 config.py 与 settings.json 的修改时间"""
+        if self._watcher is None:
+            def run():
+                while not self._stop.wait(interval):
+                    self.check()
+
+            self._watcher = threading.Thread(target=run, name="config-watcher", daemon=True)
+            self._watcher.start()
+        return self
+
+    def stop_watching(self):
+        self._stop.set()
+
+
+_config_center = None
+_config_lock = threading.Lock()
+
+
+def get_config_center():
+    global _config_center
+    if _config_center is None:
+        with _config_lock:
+            if _config_center is None:
+                _config_center = ConfigCenter()
+    return _config_center
+
+
+def get_settings():
+    """当前生效的配置；长时间运行的循环应每轮重新获取，而不是保存引用"""
+    return get_config_center().settings
+
+
+def on_reload(callback):
+    return get_config_center().on_reload(callback)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="配置检查")
+    parser.add_argument("--check", action="store_true", help="加载并校验 config.py 与 settings.json")
+    args = parser.parse_args()
+
+    try:
+        settings = get_settings()
+    except ConfigError as e:
+        print(f"❌ 配置有误: {e}")
+        raise SystemExit(1)
+    print(f"✅ 配置有效: {len(settings.accounts)} 个账号，{len(settings.black_swan_keywords)} 类关键词，"
+          f"关键词摘要 {settings.keyword_digest}")
@@ -0,0 +1,159 @@
+"""
+面板查询模块
+把可视化面板需要的统计下推到 MongoDB 聚合管道，只返回各图表所需的聚合结果，覆盖全部历史数据
+"""
+
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+from 时序汇总 import ROLLUP_COLLECTIONS
+
+# 时间范围选项 → 回溯时长
+TIME_RANGES = {
+    "最近24小时": timedelta(hours=24),
+    "最近3天": timedelta(days=3),
+    "最近7天": timedelta(days=7),
+    "最近30天": timedelta(days=30),
+    "全部": None
+}
+
+# 推文流只取展示需要的字段
+FEED_PROJECTION = {
+    "_id": 1, "username": 1, "created_at": 1, "text": 1, "sentiment": 1,
+    "risk_score": 1, "urgency_level": 1, "alert_level": 1, "cluster_id": 1, "is_cluster_representative": 1
+}
+
+
+def time_range_start(time_range, now=None):
+    """把时间范围选项转换为 created_at 下限（ISO 字符串），"全部" 返回 None"""
+    delta = TIME_RANGES.get(time_range)
+    if delta is None:
+        return None
+    return ((now or datetime.utcnow()) - delta).isoformat()
+
+
+def build_match(usernames=None, since=None, dedup=False):
+    """
+    构建 $match 条件；created_at 以 ISO 字符串存储，可直接按字典序比较
+    dedup=True 时每个近重复簇只保留代表推文（聚类前入库的推文没有该字段，视为代表）
+    """
+    match = {}
+    if usernames is not None:
+        match["username"] = {"$in": list(usernames)}
+    if since:
+        match["created_at"] = {"$gte": since}
+    if dedup:
+        match["is_cluster_representative"] = {"$ne": False}
+    return match
+
+
+def list_usernames(collection):
+    return sorted(u for u in collection.distinct("username") if u)
+
+
+def collection_summary(collection):
+    """页头与侧边栏用的总数与最新推文时间：读集合元数据与 created_at 索引，不扫描全部文档"""
+    latest = collection.find_one({}, {"created_at": 1, "_id": 0}, sort=[("created_at", -1)])
+    return {"total": collection.estimated_document_count(), "latest": latest.get("created_at") if latest else None}
+
+
+def overview_metrics(collection, match=None):
+    """总数、黑天鹅数、平均情感、高风险数、近重复数、最新推文时间"""
+    pipeline = [
+        {"$match": match or {}},
+        {"$group": {
+            "_id": None,
+            "total": {"$sum": 1},
+            "black_swan": {"$sum": {"$cond": [{"$eq": ["$black_swan", True]}, 1, 0]}},
+            "avg_sentiment": {"$avg": "$sentiment_score"},
+            "high_risk": {"$sum": {"$cond": [{"$gt": ["$risk_score", 50]}, 1, 0]}},
+            "duplicates": {"$sum": {"$cond": [{"$eq": ["$is_cluster_representative", False]}, 1, 0]}},
+            "latest": {"$max": "$created_at"}
+        }}
+    ]
+    result = list(collection.aggregate(pipeline))
+    if not result:
+        return {"total": 0, "black_swan": 0, "avg_sentiment": 0.0, "high_risk": 0, "duplicates": 0, "latest": None}
+    metrics = result[0]
+    metrics.pop("_id", None)
+    metrics["avg_sentiment"] = metrics["avg_sentiment"] or 0.0
+    return metrics
+
+
+def risk_matrix(collection, match=None):
+    """各账号 × 警报级别的推文数，返回 [{username, alert_level, count}]"""
+    pipeline = [
+        {"$match": match or {}},
+        {"$group": {
+            "_id": {"username": "$username", "alert_level": {"$ifNull": ["$alert_level", "未知"]}},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {"_id": 0, "username": "$_id.username", "alert_level": "$_id.alert_level", "count": 1}}
+    ]
+    return list(collection.aggregate(pipeline))
+
+
+def feed_page(collection, match=None, before=None, page_size=10):
+    """
+    推文流游标分页，按 (created_at, _id) 倒序
+    before: 上一页最后一条的 (created_at, _id 字符串)，None 表示第一页
+    返回 (本页推文, 下一页游标或 None)
+    """
+    query = dict(match or {})
+    if before is not None:
+        created_at, last_id = before
+        last_id = ObjectId(last_id)
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}}
+        ]}]}
+
+    # 多取一条用来判断是否还有更早的推文
+    docs = list(
+        collection.find(query, FEED_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(page_size + 1)
+    )
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    next_cursor = (docs[-1]["created_at"], str(docs[-1]["_id"])) if has_more else None
+    return docs, next_cursor
+
+
+# ---------- 历史趋势：读取时序汇总桶（读取量与 tweets 集合大小无关） ----------
+
+def daily_sentiment_from_rollups(db, usernames=None):
+    """按天、按账号的平均情感分数，读取天级汇总桶"""
+    query = {} if usernames is None else {"username": {"$in": list(usernames)}}
+    fields = {"_id": 0, "username": 1, "bucket": 1, "count": 1, "sentiment_sum": 1}
+    return [
+        {"date": doc["bucket"], "username": doc["username"], "sentiment_score": doc["sentiment_sum"] / doc["count"]}
+        for doc in db[ROLLUP_COLLECTIONS["day"]].find(query, fields).sort("bucket", 1)
+        if doc.get("count")
+    ]
+
+
+def risk_histogram_from_rollups(db):
+    """风险分数直方图，合并各天汇总桶中的直方图"""
+    pipeline = [
+        {"$project": {"username": 1, "hist": {"$objectToArray": {"$ifNull": ["$risk_hist", {}]}}}},
+        {"$unwind": "$hist"},
+        {"$group": {"_id": {"username": "$username", "bin": "$hist.k"}, "count": {"$sum": "$hist.v"}}},
+        {"$project": {"_id": 0, "username": "$_id.username", "bin": "$_id.bin", "count": 1}}
+    ]
+    rows = list(db[ROLLUP_COLLECTIONS["day"]].aggregate(pipeline))
+    for row in rows:
+        row["bin"] = int(row["bin"])
+    return sorted(rows, key=lambda row: row["bin"])
+
+
+def black_swan_counts_from_rollups(db):
+    """各账号黑天鹅事件数，汇总各天计数"""
+    pipeline = [
+        {"$group": {"_id": "$username", "count": {"$sum": "$black_swan"}}},
+        {"$match": {"count": {"$gt": 0}}},
+        {"$project": {"_id": 0, "username": "$_id", "count": 1}},
+        {"$sort": {"count": -1}}
+    ]
+    return list(db[ROLLUP_COLLECTIONS["day"]].aggregate(pipeline))